@@ -1,52 +1,121 @@
 import asyncio
 import base64
+import hashlib
 import json
 import os
-from collections import deque
-from typing import Dict
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs
 
 import dotenv
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from twilio.rest import Client
+from fastapi import FastAPI, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from twilio.twiml.voice_response import Connect, VoiceResponse
 
+from functions.function_manifest import tools
 from logger_config import get_logger
+from services.audio_ingest import AudioIngestQueue
 from services.call_context import CallContext
+from services.call_events import FINAL_STATUSES, CallUpdates, call_events, format_sse
+from services.call_store import CallContextStore
+from services.event_emmiter import COALESCE
+from services.http_pool import http_pool
 from services.llm_service import LLMFactory
+from services.message_codec import CodecFactory
+from services.metrics_service import TurnTracer, metrics
+from services.speculation import Speculator
 from services.stream_service import StreamService
+from services.stt_pool import stt_pool
 from services.transcription_service import TranscriptionService
+from services.turn_detection import TurnThresholds
+from services.twilio_service import twilio_gateway
 from services.tts_service import TTSFactory
 
 dotenv.load_dotenv()
 app = FastAPI()
 logger = get_logger("App")
 
-# Global dictionary to store call contexts for each server instance (should be replaced with a database in production)
-global call_contexts
-call_contexts = {}
+# Call contexts by call SID; bounded in memory, completed calls are archived to disk
+call_contexts = CallContextStore()
+
+# Shared encoder/decoder for the Twilio media-stream protocol
+codec = CodecFactory.get_codec()
+
+active_calls = metrics.gauge("aidialer_active_calls", "Media streams currently connected")
+
+# Keep references to fire-and-forget tasks so they are not garbage collected mid-flight
+background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def warm_tts_cache(texts, pin=True):
+    tts_service = TTSFactory.get_tts_service(os.getenv("TTS_SERVICE", "deepgram"))
+    await tts_service.warm_cache([text for text in texts if text], pin)
+
+# Pre-synthesize the greeting and function-call messages so calls can start playback immediately
+@app.on_event("startup")
+async def prewarm_tts_cache():
+    if os.getenv("TTS_CACHE_PREWARM", "true").lower() != "true":
+        return
+    phrases = [tool['function'].get('say') for tool in tools]
+    phrases.append(os.getenv("INITIAL_MESSAGE"))
+    phrases.extend(os.getenv("TTS_CACHE_WARM_PHRASES", "").split("|"))
+    run_in_background(warm_tts_cache(phrases))
+
+# Open live STT sessions before the first call needs one
+@app.on_event("startup")
+async def start_stt_pool():
+    stt_pool.start()
+
+@app.on_event("shutdown")
+async def close_http_pool():
+    await http_pool.close()
+
+@app.on_event("shutdown")
+async def close_stt_pool():
+    await stt_pool.close()
+
+@app.on_event("shutdown")
+async def close_call_store():
+    await call_contexts.close()
 
 # First route that gets called by Twilio when call is initiated
 @app.post("/incoming")
-async def incoming_call() -> HTMLResponse:
+async def incoming_call(request: Request) -> HTMLResponse:
     server = os.environ.get("SERVER")
+    # Send the media stream to the node that placed the call, where its context and caches are warm
+    form = parse_qs((await request.body()).decode())
+    call_sid = form.get("CallSid", [None])[0]
+    owner = await call_contexts.owner(call_sid) if call_sid else None
+    if owner and owner.get("host"):
+        server = owner["host"]
     response = VoiceResponse()
     connect = Connect()
     connect.stream(url=f"wss://{server}/connection")
     response.append(connect)
-    return HTMLResponse(content=str(response), status_code=200)
+    headers = {"X-Call-Node": owner["node_id"]} if owner else None
+    return HTMLResponse(content=str(response), status_code=200, headers=headers)
 
 
 @app.get("/call_recording/{call_sid}")
 async def get_call_recording(call_sid: str):
     """Get the recording URL for a specific call."""
-    recording = get_twilio_client().calls(call_sid).recordings.list()
+    recording = await twilio_gateway.list_recordings(call_sid)
     if recording:
         print({"recording_url": f"https://api.twilio.com/{recording[0].uri}"})
         return {"recording_url": f"https://api.twilio.com/{recording[0].uri}"}
     if not recording:
         return {"error": "Recording not found"}
-    
+
+# Prometheus-style scrape endpoint for pipeline latency and service metrics
+@app.get("/metrics")
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Websocket route for Twilio to get media stream
 @app.websocket("/connection")
 async def websocket_endpoint(websocket: WebSocket):
@@ -59,46 +128,117 @@ async def websocket_endpoint(websocket: WebSocket):
     logger.info(f"Using TTS service: {tts_service_name}")
 
     llm_service = LLMFactory.get_llm_service(llm_service_name, CallContext())
-    stream_service = StreamService(websocket)
+    stream_service = StreamService(websocket, codec)
     transcription_service = TranscriptionService()
     tts_service = TTSFactory.get_tts_service(tts_service_name)
-    
-    marks = deque()
+    if os.getenv("TTS_PREWARM_CONNECTIONS", "true").lower() == "true":
+        run_in_background(tts_service.warm_connection())
+
+    tracer = TurnTracer()
+    llm_service.set_tracer(tracer)
+    tts_service.set_tracer(tracer)
+    stream_service.set_tracer(tracer)
+
+    # Opt-in queued event dispatch, so slow subscribers don't stall the service emitting to them
+    queued_services = {name.strip() for name in os.getenv("EVENT_DISPATCH_QUEUED", "").split(",") if name.strip()}
+    queue_size = int(os.getenv("EVENT_QUEUE_MAXSIZE", 64))
+    overflow = os.getenv("EVENT_QUEUE_OVERFLOW", "block")
+    emitters = {"transcription": transcription_service, "llm": llm_service, "tts": tts_service, "stream": stream_service}
+    for name, emitter in emitters.items():
+        if name in queued_services:
+            # Only the latest utterance matters for barge-in detection
+            policies = {"utterance": COALESCE} if name == "transcription" else None
+            emitter.enable_queued_dispatch(queue_size, overflow, policies)
+
+    # Opt-in: start the reply once the interim transcript has been stable for a short while
+    speculator = None
+    if os.getenv("SPECULATIVE_LLM", "false").lower() == "true":
+        speculator = Speculator(llm_service, tts_service)
+        transcription_service.enable_stability_events(int(os.getenv("SPECULATION_STABLE_MS", 300)) / 1000)
+
     interaction_count = 0
+    turn_task = None
+    call_sid = None
+    # Live updates for the UI, once the call is known
+    updates = None
 
     await transcription_service.connect()
 
-    async def process_media(msg):
-        await transcription_service.send(base64.b64decode(msg['media']['payload']))
+    # Ordered, batched path for caller audio into the transcriber
+    audio_ingest = AudioIngestQueue(transcription_service.send)
+    audio_ingest.start()
+
+    async def run_turn(text, icount, previous_turn, speculative_reply=None):
+        # Replies are still produced one turn at a time
+        if previous_turn is not None:
+            await asyncio.gather(previous_turn, return_exceptions=True)
+        tracer.start_turn(icount)
+        stream_service.start_turn()
+        if speculative_reply is not None:
+            # The reply was started from the interim transcript and has just been released
+            await speculative_reply
+        else:
+            await llm_service.completion(text, icount)
+        # With queued dispatch the reply's sentences may not have reached TTS yet
+        await llm_service.wait_delivered('llmreply')
+        # Sentences are synthesized in the background; the turn lasts until they are done
+        await tts_service.wait_idle()
+        await tts_service.wait_delivered('speech')
+        if updates is not None:
+            updates.transcript_changed()
+
+    def turn_in_progress():
+        return turn_task is not None and not turn_task.done()
 
     async def handle_transcription(text):
-        nonlocal interaction_count
+        nonlocal interaction_count, turn_task
         if not text:
             return
         logger.info(f"Interaction {interaction_count} – STT -> LLM: {text}")
-        await llm_service.completion(text, interaction_count)
+        speculative_reply = await speculator.commit(text) if speculator is not None else None
+        # Deepgram waits for its event handlers before delivering the next transcript, so the
+        # reply runs in its own task; otherwise a barge-in could not be seen until it finished
+        turn_task = asyncio.create_task(run_turn(text, interaction_count, turn_task, speculative_reply))
         interaction_count += 1
 
+    async def handle_stable_transcript(text):
+        # Only speculate while the agent is silent; otherwise this speech is a barge-in
+        if turn_in_progress() or stream_service.has_pending_audio():
+            return
+        speculator.start(text, interaction_count)
+
     async def handle_llm_reply(llm_reply, icount):
         logger.info(f"Interaction {icount}: LLM -> TTS: {llm_reply['partialResponse']}")
-        await tts_service.generate(llm_reply, icount)
-
-    async def handle_speech(response_index, audio, label, icount):
-        logger.info(f"Interaction {icount}: TTS -> TWILIO: {label}")
-        await stream_service.buffer(response_index, audio)
+        await tts_service.submit(llm_reply, icount)
 
-    async def handle_audio_sent(mark_label):
-        marks.append(mark_label)
+    async def handle_speech(response_index, audio, label, icount, final=True):
+        if final:
+            logger.info(f"Interaction {icount}: TTS -> TWILIO: {label}")
+        await stream_service.buffer(response_index, audio, final, label)
 
     async def handle_utterance(text, stream_sid):
+        tracer.speech_detected()
         try:
-            if len(marks) > 0 and text.strip():
+            # The interim result is only the latest segment; compare everything said this turn
+            if speculator is not None and speculator.active and not speculator.covers(transcription_service.transcript):
+                speculator.discard("caller kept talking")
+
+            if (stream_service.has_pending_audio() or turn_in_progress()) and text.strip():
                 logger.info("Intruption detected, clearing system.")
-                await websocket.send_json({
-                    "streamSid": stream_sid,
-                    "event": "clear"
-                })
-                
+                heard = stream_service.interrupt()
+                await websocket.send_text(codec.encode_clear(stream_sid))
+
+                # abort in-flight generation and synthesis, then drop queued audio
+                llm_service.cancel("barge-in")
+                tts_service.cancel("barge-in")
+                llm_service.discard_pending("llmreply")
+                tts_service.discard_pending("speech")
+
+                # the model should only remember what the caller actually heard
+                llm_service.truncate_reply(heard)
+                if updates is not None:
+                    updates.transcript_changed()
+
                 # reset states
                 stream_service.reset()
                 llm_service.reset()
@@ -109,9 +249,10 @@ async def websocket_endpoint(websocket: WebSocket):
 
     transcription_service.on('utterance', handle_utterance)
     transcription_service.on('transcription', handle_transcription)
+    if speculator is not None:
+        transcription_service.on('stable', handle_stable_transcript)
     llm_service.on('llmreply', handle_llm_reply)
     tts_service.on('speech', handle_speech)
-    stream_service.on('audiosent', handle_audio_sent)
 
     # Queue for incoming WebSocket messages
     message_queue = asyncio.Queue()
@@ -120,54 +261,63 @@ async def websocket_endpoint(websocket: WebSocket):
         try:
             while True:
                 data = await websocket.receive_text()
-                await message_queue.put(json.loads(data))
+                await message_queue.put(codec.decode(data))
         except WebSocketDisconnect:
             logger.info("WebSocket disconnected")
 
     async def message_processor():
+        nonlocal call_sid, updates
         while True:
             msg = await message_queue.get()
             if msg['event'] == 'start':
                 stream_sid = msg['start']['streamSid']
                 call_sid = msg['start']['callSid']
 
-                call_context = CallContext()
-
                 if os.getenv("RECORD_CALLS") == "true":
-                    get_twilio_client().calls(call_sid).recordings.create({"recordingChannels": "dual"})
+                    run_in_background(start_call_recording(call_sid))
 
-                # Decide if the call the call was initiated from the UI or is an inbound
-                if call_sid not in call_contexts:
+                # Decide if the call the call was initiated from the UI (on any node) or is an inbound
+                call_context = await call_contexts.fetch(call_sid)
+                if call_context is None:
                     # Inbound call
+                    call_context = CallContext()
                     call_context.system_message = os.environ.get("SYSTEM_MESSAGE")
                     call_context.initial_message = os.environ.get("INITIAL_MESSAGE")
                     call_context.call_sid = call_sid
-                    call_contexts[call_sid] = call_context
-                else:
-                    # Call from UI, reuse the existing context
-                    call_context = call_contexts[call_sid]
-                
+                call_context.stream_sid = stream_sid
+                call_contexts.activate(call_sid, call_context)
+
                 llm_service.set_call_context(call_context)
+                transcription_service.set_turn_thresholds(TurnThresholds.from_env(call_context.turn_detection))
 
                 stream_service.set_stream_sid(stream_sid)
                 transcription_service.set_stream_sid(stream_sid)
 
+                # Push transcript changes and turn latencies to anyone following the call
+                updates = CallUpdates(call_events, call_sid, call_context)
+                transcription_service.on('transcription', updates.transcript_changed)
+                llm_service.on('llmreply', updates.transcript_changed)
+                stream_service.on('audiosent', updates.transcript_changed)
+                tracer.on_turn(updates.turn_finished)
+                updates.transcript_changed()
+
                 logger.info(f"Twilio -> Starting Media Stream for {stream_sid}")
                 await tts_service.generate({
                     "partialResponseIndex": None,
                     "partialResponse": call_context.initial_message
                 }, 1)
             elif msg['event'] == 'media':
-                asyncio.create_task(process_media(msg))
+                await audio_ingest.push(base64.b64decode(msg['media']['payload']))
             elif msg['event'] == 'mark':
                 label = msg['mark']['name']
-                if label in marks:
-                    marks.remove(label)
+                if stream_service.acknowledge(label):
+                    tracer.mark("mark_ack")
             elif msg['event'] == 'stop':
                 logger.info(f"Twilio -> Media stream {stream_sid} ended.")
                 break
             message_queue.task_done()
 
+    active_calls.inc()
     try:
         listener_task = asyncio.create_task(websocket_listener())
         processor_task = asyncio.create_task(message_processor())
@@ -176,14 +326,34 @@ async def websocket_endpoint(websocket: WebSocket):
     except asyncio.CancelledError:
         logger.info("Tasks cancelled")
     finally:
+        active_calls.dec()
+        await audio_ingest.close()
+        if speculator is not None:
+            speculator.discard("call ended")
+        llm_service.cancel("call ended")
+        llm_service.close()
+        tts_service.cancel("call ended")
+        if turn_task is not None:
+            turn_task.cancel()
+        await stream_service.close()
+        for emitter in emitters.values():
+            await emitter.close_queues()
         await transcription_service.disconnect()
+        await tts_service.disconnect()
+        if call_sid is not None:
+            await call_contexts.complete(call_sid)
+        if updates is not None:
+            updates.ended()
 
-def get_twilio_client():
-    return Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+async def start_call_recording(call_sid: str):
+    try:
+        await twilio_gateway.start_recording(call_sid, recording_channels="dual")
+    except Exception as e:
+        logger.error(f"Error starting recording for call {call_sid}: {str(e)}")
 
 # API route to initiate a call via UI
 @app.post("/start_call")
-async def start_call(request: Dict[str, str]):
+async def start_call(request: Dict[str, Any]):
     """Initiate a call using Twilio with optional system and initial messages."""
     to_number = request.get("to_number")
     system_message = request.get("system_message")
@@ -195,36 +365,67 @@ async def start_call(request: Dict[str, str]):
     if not to_number:
         return {"error": "Missing 'to_number' in request"}
 
+    turn_detection = request.get("turn_detection") or {}
+    try:
+        TurnThresholds.from_env(turn_detection)
+    except (TypeError, ValueError, AttributeError) as e:
+        return {"error": f"Invalid 'turn_detection': {e}"}
+
     try:
-        client = get_twilio_client()
         logger.info(f"Initiating call to {to_number} via {service_url}")
-        call = client.calls.create(
+        call = await twilio_gateway.create_call(
             to=to_number,
             from_=os.getenv("APP_NUMBER"),
-            url=f"{service_url}"
+            url=f"{service_url}",
+            # Progress is reported to this node, which holds the call until its media stream connects
+            status_callback=f"https://{call_contexts.node['host']}/call_status_callback",
+            status_callback_event=["initiated", "ringing", "answered", "completed"]
         )
         call_sid = call.sid
         call_context = CallContext()
-        call_contexts[call_sid] = call_context
-        
 
         # Set custom system and initial messages for this call if provided
         call_context.system_message = system_message or os.getenv("SYSTEM_MESSAGE")
         call_context.initial_message = initial_message or os.getenv("Config.INITIAL_MESSAGE")
         call_context.call_sid = call_sid
+        call_context.turn_detection = turn_detection
+        # Twilio may open the media stream on another worker or host; publish the call for it
+        await call_contexts.register(call_sid, call_context)
+
+        # Synthesize a custom greeting while the phone is still ringing; it is only kept for this call
+        run_in_background(warm_tts_cache([call_context.initial_message], pin=False))
 
         return {"call_sid": call_sid}
     except Exception as e:
         logger.error(f"Error initiating call: {str(e)}")
         return {"error": f"Failed to initiate call: {str(e)}"}
 
+# Twilio reports the progress of calls placed by /start_call here
+@app.post("/call_status_callback")
+async def call_status_callback(request: Request) -> Response:
+    form = parse_qs((await request.body()).decode())
+    call_sid = form.get("CallSid", [None])[0]
+    status = form.get("CallStatus", [None])[0]
+    if call_sid and status:
+        final = status in FINAL_STATUSES
+        call_context = await call_contexts.update_status(call_sid, status, final)
+        call_events.publish(call_sid, "status", {"status": status})
+        if final:
+            # Calls that were never answered have no media stream to report their end
+            call_events.publish(call_sid, "end", {"call_ended": True, "final_status": status})
+        logger.info(f"Call {call_sid} status: {status}" + ("" if call_context else " (unknown call)"))
+    return Response(status_code=204)
+
 # API route to get the status of a call
 @app.get("/call_status/{call_sid}")
 async def get_call_status(call_sid: str):
     """Get the status of a call."""
+    # Known from Twilio's status callback, so there is no need to ask Twilio again
+    call_context = await call_contexts.load(call_sid)
+    if call_context is not None and call_context.status:
+        return {"status": call_context.status}
     try:
-        client = get_twilio_client()
-        call = client.calls(call_sid).fetch()
+        call = await twilio_gateway.fetch_call(call_sid)
         return {"status": call.status}
     except Exception as e:
         logger.error(f"Error fetching call status: {str(e)}")
@@ -236,41 +437,157 @@ async def end_call(request: Dict[str, str]):
     """Get the status of a call."""
     try:
         call_sid = request.get("call_sid")
-        client = get_twilio_client()
-        client.calls(call_sid).update(status='completed')
+        await twilio_gateway.update_call(call_sid, status='completed')
         return {"status": "success"}
     except Exception as e:
         logger.error(f"Error ending call {str(e)}")
         return {"error": f"Failed to end requested call: {str(e)}"}
 
+TRANSCRIPT_PAGE_SIZE = int(os.getenv("TRANSCRIPT_PAGE_SIZE", 50))
+
+def conditional_json(request: Request, payload: Dict[str, Any]) -> Response:
+    """JSON response tagged with an ETag; 304 Not Modified when the client already has this version."""
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    known = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if etag in known or "*" in known:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def transcript_entry(call_sid: str, context: CallContext) -> Dict[str, Any]:
+    return {
+        "call_sid": call_sid,
+        "transcript": context.user_context,
+        "start_time": context.start_time,
+        "end_time": context.end_time,
+        "call_ended": context.call_ended,
+        "final_status": context.final_status,
+    }
+
+CALL_EVENTS_KEEPALIVE_SECONDS = float(os.getenv("CALL_EVENTS_KEEPALIVE_SECONDS", 10))
+
+# Server-sent events for following a call live
+@app.get("/events/{call_sid}")
+async def stream_call_events(call_sid: str):
+    """
+    Follow a call as it happens: server-sent events starting with a snapshot (`transcript`
+    from message 0 and the latest `status`), then `transcript` deltas, `status` changes and
+    per-turn `latency` as they happen, until `end`. Apply a delta by keeping the first `since`
+    messages of your copy and appending its `transcript`.
+
+    Updates are only published in the process serving the call. Another node redirects to
+    the serving one when it has its own NODE_HOST; worker processes sharing one public
+    address cannot be told apart, so there the request fails instead of redirecting to
+    itself. Follow live calls through a single worker, or give each worker its own NODE_HOST.
+    """
+    if call_sid not in call_contexts.active:
+        owner = await call_contexts.owner(call_sid)
+        if owner and owner.get("node_id") != call_contexts.node["node_id"]:
+            if owner.get("host") and owner["host"] != call_contexts.node["host"]:
+                return RedirectResponse(f"https://{owner['host']}/events/{call_sid}", status_code=307)
+            logger.info(f"[GET] Call {call_sid} is served by worker {owner.get('node_id')} at this same address")
+            return {"error": "Call is served by another worker process at this address; its live updates are not available here"}
+    call_context = await call_contexts.load(call_sid)
+    if not call_context:
+        logger.info(f"[GET] Call not found for call SID: {call_sid}")
+        return {"error": "Call not found"}
+
+    async def stream():
+        # Subscribe before taking the snapshot so nothing published in between is lost
+        queue = call_events.subscribe(call_sid)
+        try:
+            messages = call_context.user_context
+            yield format_sse("transcript", {"since": 0, "transcript": messages, "seq": len(messages)})
+            if call_context.status:
+                yield format_sse("status", {"status": call_context.status})
+            if call_context.call_ended or call_context.final_status:
+                yield format_sse("end", {"call_ended": call_context.call_ended, "final_status": call_context.final_status})
+                return
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), CALL_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    # Fell behind; the client reconnects and starts from a new snapshot
+                    return
+                event, data = item
+                yield format_sse(event, jsonable_encoder(data))
+                if event == "end":
+                    return
+        finally:
+            call_events.unsubscribe(call_sid, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # API call to get the transcript for a specific call
 @app.get("/transcript/{call_sid}")
-async def get_transcript(call_sid: str):
-    """Get the entire transcript for a specific call."""
-    call_context = call_contexts.get(call_sid)
+async def get_transcript(call_sid: str, request: Request, since: int = Query(0, ge=0)):
+    """
+    Get the transcript for a specific call.
+
+    `seq` is the number of messages so far; pass it back as `since` to get only the messages
+    added after it (a barge-in can still shorten the last reply, so re-read the whole
+    transcript once the call has ended). Send the ETag back in If-None-Match to get a 304
+    when nothing changed.
+    """
+    call_context = await call_contexts.load(call_sid)
 
     if not call_context:
         logger.info(f"[GET] Call not found for call SID: {call_sid}")
         return {"error": "Call not found"}
 
-    return {"transcript": call_context.user_context}
+    messages = call_context.user_context
+    start = min(since, len(messages))
+    return conditional_json(request, {
+        "transcript": messages[start:],
+        "since": start,
+        "seq": len(messages),
+        "call_ended": call_context.call_ended,
+        "final_status": call_context.final_status,
+    })
 
 # API route to get all call transcripts
 @app.get("/all_transcripts")
-async def get_all_transcripts():
-    """Get a list of all current call transcripts."""
+async def get_all_transcripts(request: Request, limit: Optional[int] = Query(None, ge=1, le=500), cursor: Optional[str] = None):
+    """
+    Get call transcripts, one page at a time: this node's ongoing calls, then completed calls
+    newest first, at most `limit` (TRANSCRIPT_PAGE_SIZE by default) of them in all. Pass
+    `next_cursor` back as `cursor` for the next page; it is null after the last one. Use
+    /export_transcripts to read everything.
+    """
     try:
-        transcript_list = []
-        for call_sid, context in call_contexts.items():
-            transcript_list.append({
-                "call_sid": call_sid,
-                "transcript": context.user_context,
-            })
-        return {"transcripts": transcript_list}
+        calls, next_cursor = await call_contexts.page(limit or TRANSCRIPT_PAGE_SIZE, cursor)
+        payload = {
+            "transcripts": [transcript_entry(call_sid, context) for call_sid, context in calls],
+            "next_cursor": next_cursor,
+        }
+        return conditional_json(request, payload)
+    except ValueError as e:
+        return {"error": str(e)}
     except Exception as e:
         logger.error(f"Error fetching all transcripts: {str(e)}")
         return {"error": f"Failed to fetch all transcripts: {str(e)}"}
 
+# API route to export every call transcript, streamed page by page
+@app.get("/export_transcripts")
+async def export_transcripts() -> StreamingResponse:
+    """Stream all call transcripts as newline-delimited JSON, one call per line."""
+    async def lines():
+        cursor = None
+        while True:
+            calls, cursor = await call_contexts.page(TRANSCRIPT_PAGE_SIZE, cursor)
+            for call_sid, context in calls:
+                yield json.dumps(jsonable_encoder(transcript_entry(call_sid, context))) + "\n"
+            if cursor is None:
+                break
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": 'attachment; filename="transcripts.ndjson"'})
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,73 @@
+"""
+Microbenchmark for the Twilio media-stream websocket codec.
+
+Compares the original per-message handling (json.loads on every inbound frame,
+two send_json dict serializations per outbound audio chunk) with the codecs in
+services/message_codec.py.
+
+    python -m benchmarks.codec_bench
+"""
+import base64
+import json
+import os
+import time
+
+from services.message_codec import JSONCodec, OrjsonCodec, orjson
+
+STREAM_SID = "MZ18ad3ab5a668481ce02b83e7395059f0"
+
+INBOUND_MEDIA = json.dumps({
+    "event": "media",
+    "sequenceNumber": "3",
+    "media": {"track": "inbound", "chunk": "1", "timestamp": "5",
+              "payload": base64.b64encode(os.urandom(160)).decode()},
+    "streamSid": STREAM_SID
+}, separators=(",", ":"))
+
+# One sentence worth of synthesized speech, roughly 1.5 s of 8kHz mulaw
+OUTBOUND_AUDIO = base64.b64encode(os.urandom(12000)).decode()
+
+
+def rate(fn, seconds: float = 1.0) -> float:
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            fn()
+        count += 100
+    return count / (time.perf_counter() - started)
+
+
+def baseline_decode():
+    json.loads(INBOUND_MEDIA)
+
+
+def baseline_encode():
+    json.dumps({"streamSid": STREAM_SID, "event": "media", "media": {"payload": OUTBOUND_AUDIO}})
+    json.dumps({"streamSid": STREAM_SID, "event": "mark", "mark": {"name": "2c0d1e37-3b45-4a3b-9f0e-8f6d4a2e7d11"}})
+
+
+def main():
+    codecs = [JSONCodec()] + ([OrjsonCodec()] if orjson is not None else [])
+
+    print("inbound media frames decoded per second")
+    base = rate(baseline_decode)
+    print(f"  {'json.loads (before)':<24} {base:>12,.0f}")
+    for codec in codecs:
+        value = rate(lambda: codec.decode(INBOUND_MEDIA))
+        print(f"  {codec.name + ' codec':<24} {value:>12,.0f}  ({value / base:.1f}x)")
+
+    print("outbound media+mark pairs encoded per second")
+    base = rate(baseline_encode)
+    print(f"  {'2x json.dumps (before)':<24} {base:>12,.0f}")
+    for codec in codecs:
+        def encode():
+            codec.encode_media(STREAM_SID, OUTBOUND_AUDIO)
+            codec.encode_mark(STREAM_SID, "2c0d1e37-3b45-4a3b-9f0e-8f6d4a2e7d11")
+        value = rate(encode)
+        print(f"  {codec.name + ' codec':<24} {value:>12,.0f}  ({value / base:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Offline load test for the /connection media-stream endpoint.
+
+Starts the FastAPI app in a subprocess with stub STT, LLM and TTS services
+(see benchmarks/stub_services.py), then opens N fake Twilio media streams that
+send start/media/stop events at real-time 20 ms pacing and acknowledge marks
+the way Twilio does once audio has finished playing.
+
+    python -m benchmarks.loadtest --calls 10,50,100 --duration 30 \\
+        --stt-latency 0.15 --llm-latency 0.4 --tts-latency 0.2
+
+For every step it reports how many calls were sustained for the whole run,
+client-observed turn latency (last caller frame of a turn -> first reply audio),
+the server's event-loop lag and the per-stage turn latencies from /metrics.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_AUDIO = os.path.join(REPO_ROOT, "examples", "sample.m4a")
+FRAME_BYTES = 160  # 20 ms of 8kHz mulaw
+FRAME_SECONDS = 0.02
+QUANTILE_LINE = re.compile(r'^(\w+)_quantile\{(.*)\} (\S+)$')
+
+
+def load_caller_audio() -> bytes:
+    """Decode examples/sample.m4a to 8kHz mulaw, falling back to a synthetic tone without ffmpeg."""
+    if shutil.which("ffmpeg"):
+        result = subprocess.run(
+            ["ffmpeg", "-v", "quiet", "-i", SAMPLE_AUDIO, "-ar", "8000", "-ac", "1", "-f", "mulaw", "-"],
+            capture_output=True, check=False
+        )
+        if result.returncode == 0 and result.stdout:
+            return result.stdout
+    print("ffmpeg not available, using a synthetic 440Hz tone as caller audio", file=sys.stderr)
+    t = np.arange(8000 * 10) / 8000
+    return mulaw_encode(0.3 * np.sin(2 * np.pi * 440 * t))
+
+
+def mulaw_encode(samples: np.ndarray) -> bytes:
+    mu = 255
+    companded = np.sign(samples) * np.log1p(mu * np.abs(samples)) / np.log1p(mu)
+    return (~((companded + 1) / 2 * mu).astype(np.uint8)).tobytes()
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in (0.5, 0.95, 0.99)}
+
+
+def format_ms(quantiles) -> str:
+    if not quantiles:
+        return "n/a"
+    return " ".join(f"p{int(q * 100)}={value * 1000:.0f}ms" for q, value in quantiles.items())
+
+
+# --- server side -------------------------------------------------------------
+
+async def monitor_event_loop_lag(interval: float = 0.05):
+    from services.metrics_service import metrics
+    lag = metrics.histogram(
+        "aidialer_event_loop_lag_seconds", "Extra delay observed by a periodic event-loop probe",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+    )
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        lag.observe(max(0.0, time.monotonic() - started - interval))
+
+
+async def serve(port: int):
+    import uvicorn
+
+    import app as server
+    from benchmarks.stub_services import StubLLMFactory, StubTranscriptionService, StubTTSFactory, StubTwilioGateway
+
+    server.TranscriptionService = StubTranscriptionService
+    server.LLMFactory = StubLLMFactory
+    server.TTSFactory = StubTTSFactory
+    server.twilio_gateway = StubTwilioGateway()
+
+    monitor = asyncio.create_task(monitor_event_loop_lag())
+    config = uvicorn.Config(server.app, host="127.0.0.1", port=port, log_level="warning", ws_max_queue=1024)
+    await uvicorn.Server(config).serve()
+    monitor.cancel()
+
+
+# --- client side -------------------------------------------------------------
+
+class FakeTwilioCall:
+    """One simulated Twilio media stream."""
+    def __init__(self, url: str, audio: bytes, duration: float, turn_seconds: float):
+        self.url = url
+        self.audio = audio
+        self.duration = duration
+        self.frames_per_turn = int(turn_seconds / FRAME_SECONDS)
+        self.stream_sid = f"MZ{uuid.uuid4().hex}"
+        self.call_sid = f"CA{uuid.uuid4().hex}"
+        self.turn_latencies = []
+        self.turn_ended_at = None
+        self.play_until = 0.0
+        self.mark_tasks = set()
+        self.error = None
+
+    async def run(self):
+        import websockets
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                receiver = asyncio.create_task(self.receive(ws))
+                await self.send_media(ws)
+                receiver.cancel()
+                for task in list(self.mark_tasks):
+                    task.cancel()
+        except Exception as e:
+            self.error = e
+
+    async def send_media(self, ws):
+        await ws.send(json.dumps({
+            "event": "start",
+            "start": {"streamSid": self.stream_sid, "callSid": self.call_sid,
+                      "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}},
+            "streamSid": self.stream_sid
+        }))
+        total_frames = int(self.duration / FRAME_SECONDS)
+        started = time.monotonic()
+        for i in range(total_frames):
+            offset = (i * FRAME_BYTES) % max(FRAME_BYTES, len(self.audio) - FRAME_BYTES)
+            payload = base64.b64encode(self.audio[offset:offset + FRAME_BYTES]).decode("ascii")
+            await ws.send(json.dumps({
+                "event": "media",
+                "sequenceNumber": str(i + 2),
+                "media": {"track": "inbound", "chunk": str(i + 1), "timestamp": str(i * 20), "payload": payload},
+                "streamSid": self.stream_sid
+            }))
+            if (i + 1) % self.frames_per_turn == 0:
+                self.turn_ended_at = time.monotonic()
+            delay = started + (i + 1) * FRAME_SECONDS - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await ws.send(json.dumps({"event": "stop", "streamSid": self.stream_sid, "stop": {"callSid": self.call_sid}}))
+
+    async def receive(self, ws):
+        async for data in ws:
+            msg = json.loads(data)
+            now = time.monotonic()
+            if msg["event"] == "media":
+                if self.turn_ended_at is not None:
+                    self.turn_latencies.append(now - self.turn_ended_at)
+                    self.turn_ended_at = None
+                audio_seconds = len(base64.b64decode(msg["media"]["payload"])) / 8000
+                self.play_until = max(self.play_until, now) + audio_seconds
+            elif msg["event"] == "mark":
+                task = asyncio.create_task(self.ack_mark(ws, msg["mark"]["name"], self.play_until))
+                self.mark_tasks.add(task)
+                task.add_done_callback(self.mark_tasks.discard)
+            elif msg["event"] == "clear":
+                self.play_until = now
+
+    async def ack_mark(self, ws, name: str, played_at: float):
+        # Twilio echoes a mark back once everything queued before it has played (or was cleared)
+        while time.monotonic() < min(played_at, self.play_until):
+            await asyncio.sleep(min(0.05, min(played_at, self.play_until) - time.monotonic()))
+        try:
+            await ws.send(json.dumps({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}}))
+        except Exception:
+            pass
+
+
+def fetch_server_quantiles(base_url: str):
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=5) as response:
+        body = response.read().decode()
+    quantiles = {}
+    for line in body.splitlines():
+        match = QUANTILE_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+        series = (name, labels.get("stage", ""))
+        quantiles.setdefault(series, {})[float(labels["quantile"])] = float(value)
+    return quantiles
+
+
+async def wait_for_server(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await asyncio.to_thread(fetch_server_quantiles, base_url)
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not come up")
+
+
+async def run_step(args, calls: int, audio: bytes):
+    env = dict(os.environ,
+               RECORD_CALLS="false",
+               STT_POOL_SIZE="0",
+               STATE_SQLITE_PATH=os.path.join(tempfile.gettempdir(), "aidialer-loadtest-calls.sqlite3"),
+               LOADTEST_STT_LATENCY=str(args.stt_latency),
+               LOADTEST_LLM_LATENCY=str(args.llm_latency),
+               LOADTEST_LLM_TOKEN_LATENCY=str(args.llm_token_latency),
+               LOADTEST_TTS_LATENCY=str(args.tts_latency),
+               LOADTEST_TURN_SECONDS=str(args.turn_seconds))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.loadtest", "serve", "--port", str(args.port)],
+        cwd=REPO_ROOT, env=env, stderr=None if args.verbose else subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        await wait_for_server(base_url)
+        fakes = [FakeTwilioCall(f"ws://127.0.0.1:{args.port}/connection", audio, args.duration, args.turn_seconds)
+                 for _ in range(calls)]
+        tasks = []
+        for fake in fakes:
+            tasks.append(asyncio.create_task(fake.run()))
+            await asyncio.sleep(args.ramp / max(1, calls))
+        await asyncio.gather(*tasks)
+        server_quantiles = await asyncio.to_thread(fetch_server_quantiles, base_url)
+    finally:
+        server.terminate()
+        server.wait()
+
+    sustained = [fake for fake in fakes if fake.error is None and fake.turn_latencies]
+    latencies = [latency for fake in fakes for latency in fake.turn_latencies]
+    print(f"\n=== {calls} concurrent calls ===")
+    print(f"calls sustained:   {len(sustained)}/{calls}")
+    errors = {repr(fake.error) for fake in fakes if fake.error is not None}
+    if errors:
+        print(f"errors:            {'; '.join(sorted(errors))[:300]}")
+    print(f"turn latency:      {format_ms(percentiles(latencies))} ({len(latencies)} turns)")
+    print(f"event-loop lag:    {format_ms(server_quantiles.get(('aidialer_event_loop_lag_seconds', ''), {}))}")
+    for (name, stage), values in sorted(server_quantiles.items()):
+        if stage:
+            print(f"  {stage:<20} {format_ms(values)}")
+
+
+async def main(args):
+    audio = load_caller_audio()
+    for calls in [int(n) for n in args.calls.split(",")]:
+        await run_step(args, calls, audio)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", nargs="?", default="run", choices=["run", "serve"])
+    parser.add_argument("--calls", default="10", help="comma separated list of concurrency steps")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of audio each call streams")
+    parser.add_argument("--ramp", type=float, default=2, help="seconds over which calls are opened")
+    parser.add_argument("--turn-seconds", type=float, default=4, help="caller audio per conversational turn")
+    parser.add_argument("--stt-latency", type=float, default=0.15)
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="time to first token")
+    parser.add_argument("--llm-token-latency", type=float, default=0.01, help="delay between streamed words")
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--verbose", action="store_true", help="show server logs")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        asyncio.run(serve(args.port))
+    else:
+        asyncio.run(main(args))
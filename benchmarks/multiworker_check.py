@@ -0,0 +1,151 @@
+"""
+End-to-end check that calls work when several worker processes share call state.
+
+Starts --workers copies of the app (stub STT, LLM, TTS and Twilio, as in the load test),
+each on its own port with its own NODE_ID and NODE_HOST, all sharing one STATE_BACKEND
+(a temporary SQLite file by default). For every call it:
+
+  1. places the call with /start_call on one worker, with a call-specific greeting
+  2. asks a second worker for the /incoming TwiML and checks it points the media stream
+     back at the first worker (call affinity)
+  3. streams the call's media to that second worker anyway, as a load balancer ignoring
+     the hint would
+  4. sends Twilio's final status callback to the first worker, as Twilio would
+  5. reads /transcript from a third worker and checks the call used its own greeting
+     rather than the inbound defaults
+  6. reads /transcript and /all_transcripts back from the first worker, which still holds
+     the call's pending context, and checks they show the archived call with its final
+     status, listed once
+
+    python -m benchmarks.multiworker_check --workers 3 --calls 6
+
+Exits non-zero if any call fails a check.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import urllib.parse
+import urllib.request
+
+from benchmarks.loadtest import REPO_ROOT, FakeTwilioCall, load_caller_audio, wait_for_server
+
+
+def post_json(url: str, body: dict) -> dict:
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def post_form(url: str, form: dict) -> str:
+    request = urllib.request.Request(url, data=urllib.parse.urlencode(form).encode(),
+                                     headers={"Content-Type": "application/x-www-form-urlencoded"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.read().decode()
+
+
+def get_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+async def check_call(n: int, ports, audio: bytes, duration: float) -> list:
+    placed, streamed, read = ports[n % len(ports)], ports[(n + 1) % len(ports)], ports[(n + 2) % len(ports)]
+    greeting = f"Hello, this is call {n} placed on port {placed}."
+    failures = []
+
+    started = await asyncio.to_thread(post_json, f"http://127.0.0.1:{placed}/start_call",
+                                      {"to_number": "+15550100", "initial_message": greeting})
+    call_sid = started.get("call_sid")
+    if not call_sid:
+        return [f"call {n}: /start_call failed: {started}"]
+
+    twiml = await asyncio.to_thread(post_form, f"http://127.0.0.1:{streamed}/incoming", {"CallSid": call_sid})
+    if f"wss://127.0.0.1:{placed}/connection" not in twiml:
+        failures.append(f"call {n}: /incoming on :{streamed} did not route to :{placed}: {twiml}")
+
+    # The caller never finishes a turn: speaking over the greeting would cut it from the transcript
+    fake = FakeTwilioCall(f"ws://127.0.0.1:{streamed}/connection", audio, duration, turn_seconds=duration * 10)
+    fake.call_sid = call_sid
+    await fake.run()
+    if fake.error is not None:
+        failures.append(f"call {n}: media stream on :{streamed} failed: {fake.error!r}")
+
+    # Status callbacks go to the worker that placed the call, not the one that served it
+    await asyncio.to_thread(post_form, f"http://127.0.0.1:{placed}/call_status_callback",
+                            {"CallSid": call_sid, "CallStatus": "completed"})
+
+    # The transcript is published when the serving worker finishes the call, just after the stream closes
+    for _ in range(50):
+        transcript = await asyncio.to_thread(get_json, f"http://127.0.0.1:{read}/transcript/{call_sid}")
+        if has_greeting(transcript, greeting):
+            break
+        await asyncio.sleep(0.1)
+    else:
+        failures.append(f"call {n}: /transcript on :{read} does not show the call's own greeting: {transcript}")
+        return failures
+
+    transcript = await asyncio.to_thread(get_json, f"http://127.0.0.1:{placed}/transcript/{call_sid}")
+    if not has_greeting(transcript, greeting) or not transcript.get("call_ended"):
+        failures.append(f"call {n}: /transcript on :{placed} still shows the pending call: {transcript}")
+    elif transcript.get("final_status") != "completed":
+        failures.append(f"call {n}: /transcript on :{placed} lost the final status: {transcript}")
+    listed = await asyncio.to_thread(get_json, f"http://127.0.0.1:{placed}/all_transcripts?limit=500")
+    count = sum(1 for entry in listed.get("transcripts", []) if entry.get("call_sid") == call_sid)
+    if count != 1:
+        failures.append(f"call {n}: /all_transcripts on :{placed} lists the call {count} times")
+    return failures
+
+
+def has_greeting(transcript: dict, greeting: str) -> bool:
+    messages = transcript.get("transcript") or []
+    return any(message.get("role") == "assistant" and message.get("content") == greeting for message in messages)
+
+
+async def main(args):
+    ports = [args.port + i for i in range(args.workers)]
+    state_path = os.path.join(tempfile.mkdtemp(prefix="aidialer-workers-"), "calls.sqlite3")
+    servers = []
+    try:
+        for i, port in enumerate(ports):
+            env = dict(os.environ,
+                       RECORD_CALLS="false",
+                       STT_POOL_SIZE="0",
+                       STATE_BACKEND=args.backend,
+                       STATE_SQLITE_PATH=state_path,
+                       NODE_ID=f"worker-{i}",
+                       NODE_HOST=f"127.0.0.1:{port}",
+                       LOADTEST_TURN_SECONDS=str(args.duration * 10))
+            servers.append(subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.loadtest", "serve", "--port", str(port)],
+                cwd=REPO_ROOT, env=env, stderr=None if args.verbose else subprocess.DEVNULL
+            ))
+        for port in ports:
+            await wait_for_server(f"http://127.0.0.1:{port}")
+
+        audio = load_caller_audio()
+        results = await asyncio.gather(*(check_call(n, ports, audio, args.duration) for n in range(args.calls)))
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    failures = [failure for result in results for failure in result]
+    print(f"{args.calls} calls across {args.workers} workers ({args.backend} state): {args.calls - len([r for r in results if r])} passed")
+    for failure in failures:
+        print(f"  FAIL {failure[:300]}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=6)
+    parser.add_argument("--duration", type=float, default=2, help="seconds of audio each call streams")
+    parser.add_argument("--backend", default="sqlite", help="STATE_BACKEND for the workers (sqlite or redis)")
+    parser.add_argument("--port", type=int, default=3200)
+    parser.add_argument("--verbose", action="store_true", help="show server logs")
+    sys.exit(asyncio.run(main(parser.parse_args())))
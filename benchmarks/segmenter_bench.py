@@ -0,0 +1,84 @@
+"""
+Microbenchmark for splitting streamed LLM output into sentences.
+
+Compares the original approach (append every token to a buffer and re.split the
+whole buffer again) with services/sentence_segmenter.py, on a short phone-style
+reply and on a long response where the original cost grows with the square of
+the buffer length. Also prints how each one splits text with abbreviations and
+decimals.
+
+    python -m benchmarks.segmenter_bench
+"""
+import re
+import time
+from typing import List
+
+from services.sentence_segmenter import SentenceSegmenter
+
+SHORT_REPLY = ("Sure, I can help with that. One turkey sandwich for delivery to 3000 Church St. "
+               "The total comes to $12.50 including tax. Is there anything else?")
+
+# A long answer with no sentence break, the worst case for re-splitting the whole buffer
+LONG_REPLY = " ".join(["the order includes one turkey sandwich on wheat with lettuce tomato and mustard"] * 60) + "."
+
+TRICKY_REPLY = "Dr. Smith's office is at 3.5 miles from example.com/a.b, e.g. near St. Mary's. Call at 5 p.m. tomorrow. Thanks!"
+
+
+def tokens(text: str) -> List[str]:
+    # Roughly how chat models stream: a word at a time with its leading space
+    return re.findall(r"\s*\S+", text)
+
+
+def baseline(stream: List[str]) -> List[str]:
+    buffer = ""
+    out = []
+    for token in stream:
+        buffer += token
+        sentences = re.split(r'([.!?])', buffer)
+        sentences = [''.join(sentences[i:i+2]) for i in range(0, len(sentences), 2)]
+        out.extend(sentence.strip() for sentence in sentences[:-1])
+        buffer = sentences[-1] if sentences else ""
+    if buffer.strip():
+        out.append(buffer.strip())
+    return out
+
+
+def segmenter(stream: List[str]) -> List[str]:
+    seg = SentenceSegmenter(early_flush_comma=False, early_flush_words=0)
+    out = []
+    for token in stream:
+        out.extend(seg.push(token))
+    remainder = seg.flush()
+    if remainder:
+        out.append(remainder)
+    return out
+
+
+def rate(fn, stream: List[str], seconds: float = 1.0) -> float:
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        fn(stream)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    for label, text in (("short reply", SHORT_REPLY), ("long reply", LONG_REPLY)):
+        stream = tokens(text)
+        print(f"{label} ({len(stream)} tokens), responses segmented per second")
+        base = rate(baseline, stream)
+        print(f"  {'re.split (before)':<24} {base:>12,.0f}")
+        value = rate(segmenter, stream)
+        print(f"  {'SentenceSegmenter':<24} {value:>12,.0f}  ({value / base:.1f}x)")
+
+    print("splitting text with abbreviations, decimals and URLs")
+    for name, fn in (("re.split (before)", baseline), ("SentenceSegmenter", segmenter)):
+        print(f"  {name}:")
+        for sentence in fn(tokens(TRICKY_REPLY)):
+            print(f"    {sentence!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Offline stand-ins for the Deepgram, LLM, TTS and Twilio services used by the load-test harness.
+
+Each stub keeps the public interface of the service it replaces and only injects
+configurable latency, so the rest of the pipeline in `app.py` runs unchanged.
+"""
+import asyncio
+import os
+import uuid
+from types import SimpleNamespace
+
+from services.call_context import CallContext
+from services.event_emmiter import EventEmitter
+from services.llm_service import AbstractLLMService
+from services.speculation import StableTranscriptDetector
+from services.tts_service import AbstractTTSService
+
+# Twilio streams 8kHz mulaw, one byte per sample
+BYTES_PER_SECOND = 8000
+MULAW_SILENCE = b"\xff"
+
+CALLER_PHRASES = [
+    "Hi, this is Ike's Sandwich, how can I help you?",
+    "Sure, what's the delivery address?",
+    "Great, and how would you like to pay?",
+    "Thanks, your order will be there in thirty minutes.",
+]
+
+AGENT_REPLY = (
+    "Thanks for picking up. I would like one turkey sandwich for delivery. "
+    "The address is 3000 Church St, San Francisco. I can pay with a Visa card."
+)
+
+
+def _latency(name: str) -> float:
+    return float(os.getenv(f"LOADTEST_{name}_LATENCY", "0"))
+
+
+class StubTranscriptionService(EventEmitter):
+    """Pretends the caller finishes a sentence every LOADTEST_TURN_SECONDS of received audio."""
+    def __init__(self):
+        super().__init__()
+        self.stream_sid = None
+        self.turn_bytes = int(float(os.getenv("LOADTEST_TURN_SECONDS", "4")) * BYTES_PER_SECOND)
+        self.received = 0
+        self.turns = 0
+        self.interim_sent = False
+        self.transcript = ""
+        self.pending = set()
+        self.stability = StableTranscriptDetector(lambda text: self.emit('stable', text), 0)
+
+    def enable_stability_events(self, window: float):
+        self.stability.window = window
+
+    def set_turn_thresholds(self, thresholds):
+        pass
+
+    def set_stream_sid(self, stream_id):
+        self.stream_sid = stream_id
+
+    def get_stream_sid(self):
+        return self.stream_sid
+
+    async def connect(self):
+        await asyncio.sleep(_latency("STT_CONNECT"))
+
+    async def send(self, payload: bytes):
+        self.received += len(payload)
+        phrase = CALLER_PHRASES[self.turns % len(CALLER_PHRASES)]
+        if not self.interim_sent and self.received >= self.turn_bytes // 2:
+            self.interim_sent = True
+            self.transcript = phrase
+            self.stability.update(phrase)
+            await self.emit('utterance', phrase, self.stream_sid)
+        if self.received >= self.turn_bytes:
+            await self.emit('utterance', phrase, self.stream_sid)
+            self.received -= self.turn_bytes
+            self.turns += 1
+            self.interim_sent = False
+            task = asyncio.create_task(self._finalize(phrase))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+
+    async def _finalize(self, phrase: str):
+        await asyncio.sleep(_latency("STT"))
+        self.transcript = ""
+        self.stability.reset()
+        await self.emit('transcription', phrase)
+
+    async def disconnect(self):
+        self.stability.reset()
+        for task in list(self.pending):
+            task.cancel()
+
+
+class StubLLMService(AbstractLLMService):
+    """Streams a canned reply word by word after a first-token delay."""
+    async def stream_completion(self, text: str, interaction_count: int, role: str = 'user', name: str = 'user'):
+        self.user_context.append({"role": role, "content": text, "name": name})
+        self.window.build(self.system_message, self.user_context)
+        await asyncio.sleep(_latency("LLM"))
+        self.tracer.mark("llm_first_token")
+        token_delay = _latency("LLM_TOKEN")
+        self.current_response = ""
+        for word in AGENT_REPLY.split(" "):
+            self.current_response += word + " "
+            await self.emit_complete_sentences(word + " ", interaction_count)
+            if token_delay:
+                await asyncio.sleep(token_delay)
+        await self.emit_remaining_text(interaction_count)
+        self.user_context.append({"role": "assistant", "content": AGENT_REPLY})
+        self.current_response = None
+
+    async def summarize(self, prompt: str) -> str:
+        await asyncio.sleep(_latency("LLM"))
+        return "The agent is ordering one turkey sandwich for delivery to 3000 Church St."
+
+
+class StubLLMFactory:
+    @staticmethod
+    def get_llm_service(service_name: str, context: CallContext) -> AbstractLLMService:
+        return StubLLMService(context)
+
+
+class StubTTS(AbstractTTSService):
+    """Returns mulaw silence roughly as long as the sentence would take to say."""
+    seconds_per_word = 0.3
+
+    async def synthesize(self, text: str):
+        await asyncio.sleep(_latency("TTS"))
+        duration = len(text.split()) * self.seconds_per_word
+        audio = MULAW_SILENCE * int(duration * BYTES_PER_SECOND)
+        # Hand the audio over in provider-sized pieces so streaming mode has something to stream
+        for start in range(0, len(audio), 4096):
+            yield audio[start:start + 4096]
+
+    async def set_voice(self, voice_id):
+        return
+
+    async def disconnect(self):
+        return
+
+
+class StubTTSFactory:
+    @staticmethod
+    def get_tts_service(service_name: str) -> AbstractTTSService:
+        return StubTTS()
+
+
+class StubTwilioGateway:
+    """Places no calls; just hands out call SIDs and reports calls as in progress."""
+    async def create_call(self, to: str, from_: str, url: str, **kwargs):
+        return SimpleNamespace(sid=f"CA{uuid.uuid4().hex}")
+
+    async def fetch_call(self, call_sid: str):
+        return SimpleNamespace(sid=call_sid, status="in-progress")
+
+    async def update_call(self, call_sid: str, **kwargs):
+        return SimpleNamespace(sid=call_sid, **kwargs)
+
+    async def list_recordings(self, call_sid: str):
+        return []
+
+    async def start_recording(self, call_sid: str, **kwargs):
+        return None
@@ -0,0 +1,231 @@
+"""
+Offline evaluation of end-of-turn detection.
+
+Replays transcript and audio-energy event streams through services/turn_detection.py
+with each detector and reports, per detector:
+
+  - response delay: time from the end of the caller's speech to the turn being handed
+    to the LLM (median and p95)
+  - false-cutoff rate: share of caller turns that were ended while the caller was still
+    going to say more
+
+Event streams are the JSON lines written by a live call with TURN_EVENT_LOG_DIR set.
+In a recording the caller's turns are Deepgram's finalized segments, merged when the
+gap between them is under --gap seconds. With --synthetic, calls are generated instead
+(short answers, mid-thought pauses and long replies, with known turn boundaries) together
+with what Deepgram would send for each DEEPGRAM_ENDPOINTING_MS value in --endpointing-ms.
+
+    python -m benchmarks.turn_eval --synthetic
+    python -m benchmarks.turn_eval --synthetic --endpointing-ms 200,800 --set hold_ms=1800
+    python -m benchmarks.turn_eval recordings/
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+from typing import Any, Dict, Iterable, List, Tuple
+
+from loguru import logger
+
+from services.turn_detection import TurnDetectorFactory, TurnThresholds, TurnTracker
+
+DETECTORS = ("deepgram", "adaptive")
+CHUNK = 0.02        # Twilio sends 20ms of audio per media message
+WORD_SECONDS = 0.3
+FINAL_LAG = 0.05    # Deepgram's processing time after the endpoint
+
+Event = Dict[str, Any]
+Turn = Tuple[float, float]   # (speech start, speech end) of one caller turn
+
+# Each turn is a list of spoken segments separated by (pause seconds, segment) pairs
+SCRIPTS = [
+    ["Yes."],
+    ["No."],
+    ["That's right."],
+    ["Yeah, sure"],
+    ["I'd like to order a turkey sandwich."],
+    ["Can you deliver to 3000 Church Street?"],
+    ["I want the turkey sandwich,", (0.9, "and maybe some chips.")],
+    ["So um", (1.1, "I think I'll take the large one.")],
+    ["My number is 415", (0.7, "555 0134.")],
+    ["I was wondering because", (1.0, "the last order came late,"), (0.8, "whether you could refund it.")],
+    ["Let me check the address I have it somewhere here it is 12 Main Street apartment 4."],
+    ["Okay."],
+]
+
+
+def synthetic_call(rng: random.Random, endpointing: float, count: int = 12) -> Tuple[List[Event], List[Turn]]:
+    """Events for one generated call, as TranscriptionService would record them, and its caller turns."""
+    events: List[Event] = []
+    turns: List[Turn] = []
+    t = 0.5
+    # (time, kind, payload) scheduled transcript events, merged with the audio ticks below
+    scheduled: List[Tuple[float, str, Dict[str, Any]]] = []
+    speech: List[Tuple[float, float]] = []
+
+    for script in rng.sample(SCRIPTS, min(count, len(SCRIPTS))):
+        segments = [(0.0, script[0])] + list(script[1:])
+        segment_words: List[str] = []
+        segment_start = turn_start = t
+        for n, (pause, text) in enumerate(segments):
+            if n:
+                t += pause
+                if pause * 1000 >= endpointing:
+                    # Deepgram endpoints inside the pause
+                    finish_segment(scheduled, segment_words, segment_start, speech[-1][1], endpointing)
+                    segment_words, segment_start = [], t
+            for word in text.split():
+                start, end = t, t + WORD_SECONDS * rng.uniform(0.8, 1.2)
+                speech.append((start, end))
+                segment_words.append(word)
+                t = end
+                scheduled.append((end + 0.1, "interim", {"text": " ".join(segment_words)}))
+        finish_segment(scheduled, segment_words, segment_start, t, endpointing)
+        turns.append((turn_start, t))
+        # The agent answers; the caller is quiet until the next turn
+        t += rng.uniform(2.5, 4.0)
+
+    scheduled.sort(key=lambda item: item[0])
+    clock, i = 0.0, 0
+    spoken = iter(speech)
+    current = next(spoken, None)
+    while clock < t:
+        clock += CHUNK
+        while current is not None and current[1] < clock:
+            current = next(spoken, None)
+        talking = current is not None and current[0] <= clock
+        events.append({"t": round(clock, 3), "event": "audio", "rms": rng.uniform(1500, 4000) if talking else rng.uniform(20, 120)})
+        while i < len(scheduled) and scheduled[i][0] <= clock:
+            at, kind, payload = scheduled[i]
+            events.append({"t": round(clock, 3), "event": kind, **payload})
+            i += 1
+    return events, turns
+
+
+def finish_segment(scheduled, words: List[str], start: float, end: float, endpointing: float):
+    at = end + endpointing / 1000 + FINAL_LAG
+    # Interim results lag the finalized one; drop any that would arrive after it
+    scheduled[:] = [item for item in scheduled if not (item[1] == "interim" and item[0] > at)]
+    scheduled.append((at, "final", {"text": " ".join(words), "speech_final": True,
+                                     "audio_start": round(start, 3), "audio_end": round(end, 3)}))
+    scheduled.append((at, "endpoint", {"kind": "speech_final"}))
+
+
+def caller_turns(events: List[Event], gap: float) -> List[Turn]:
+    """Ground truth: finalized speech segments, merged when the caller resumed within `gap` seconds."""
+    turns: List[List[float]] = []
+    for event in events:
+        if event["event"] != "final" or "audio_start" not in event:
+            continue
+        if turns and event["audio_start"] - turns[-1][1] < gap:
+            turns[-1][1] = max(turns[-1][1], event["audio_end"])
+        else:
+            turns.append([event["audio_start"], event["audio_end"]])
+    return [(start, end) for start, end in turns]
+
+
+def replay(events: List[Event], detector: str, thresholds: TurnThresholds) -> List[float]:
+    """Times at which the tracker handed a turn to the LLM."""
+    tracker = TurnTracker(TurnDetectorFactory.get_detector(detector, thresholds))
+    decisions = []
+    for event in events:
+        now, kind = event["t"], event["event"]
+        if kind == "audio":
+            turn = tracker.on_audio(event["rms"], now)
+        elif kind == "interim":
+            turn = tracker.on_interim(event["text"], now)
+        elif kind == "final":
+            turn = tracker.on_final(event["text"], now)
+        elif kind == "endpoint":
+            turn = tracker.on_endpoint(now)
+        else:
+            continue
+        if turn:
+            decisions.append(now)
+    return decisions
+
+
+def score(turns: List[Turn], decisions: List[float]) -> Tuple[List[float], int]:
+    """Response delays of the turns that were answered, and how many turns were cut off early."""
+    delays, cutoffs = [], 0
+    for n, (start, end) in enumerate(turns):
+        next_start = turns[n + 1][0] if n + 1 < len(turns) else float("inf")
+        if any(start <= d < end for d in decisions):
+            cutoffs += 1
+        answered = [d for d in decisions if end <= d < next_start]
+        if answered:
+            delays.append(answered[0] - end)
+    return delays, cutoffs
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def load(paths: Iterable[str]) -> List[Tuple[str, List[Event]]]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".jsonl"))
+        else:
+            files.append(path)
+    calls = []
+    for path in files:
+        with open(path) as f:
+            calls.append((path, [json.loads(line) for line in f if line.strip()]))
+    return calls
+
+
+def report(label: str, calls: List[Tuple[List[Event], List[Turn]]], thresholds: TurnThresholds):
+    print(label)
+    print(f"  {'detector':<10} {'turns':>6} {'answered':>9} {'median ms':>10} {'p95 ms':>8} {'cut off':>8}")
+    for detector in DETECTORS:
+        delays, cutoffs, total = [], 0, 0
+        for events, turns in calls:
+            call_delays, call_cutoffs = score(turns, replay(events, detector, thresholds))
+            delays.extend(call_delays)
+            cutoffs += call_cutoffs
+            total += len(turns)
+        if not total:
+            print(f"  {detector:<10} no caller turns")
+            continue
+        median = f"{statistics.median(delays) * 1000:.0f}" if delays else "-"
+        p95 = f"{percentile(delays, 0.95) * 1000:.0f}" if delays else "-"
+        print(f"  {detector:<10} {total:>6} {len(delays):>9} {median:>10} {p95:>8} {cutoffs / total:>8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="recorded .jsonl event streams or directories of them")
+    parser.add_argument("--synthetic", action="store_true", help="generate calls instead of reading recordings")
+    parser.add_argument("--calls", type=int, default=50, help="synthetic calls to generate")
+    parser.add_argument("--endpointing-ms", default="200", help="comma-separated Deepgram endpointing values to simulate")
+    parser.add_argument("--gap", type=float, default=1.0, help="merge recorded segments closer than this many seconds into one turn")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="override a turn threshold, e.g. hold_ms=1800")
+    args = parser.parse_args()
+    # Replays run thousands of turns; the per-call detector logging is noise here
+    logger.disable("services.turn_detection")
+
+    overrides = dict(item.split("=", 1) for item in args.set)
+    unknown = set(overrides) - set(TurnThresholds.FIELDS)
+    if unknown:
+        parser.error(f"unknown thresholds: {', '.join(sorted(unknown))} (known: {', '.join(TurnThresholds.FIELDS)})")
+    thresholds = TurnThresholds.from_env(overrides)
+
+    if args.synthetic:
+        for endpointing in (float(value) for value in args.endpointing_ms.split(",")):
+            rng = random.Random(args.seed)
+            calls = [synthetic_call(rng, endpointing) for _ in range(args.calls)]
+            report(f"{args.calls} synthetic calls, Deepgram endpointing {endpointing:.0f}ms", calls, thresholds)
+    elif args.paths:
+        calls = load(args.paths)
+        report(f"{len(calls)} recorded calls", [(events, caller_turns(events, args.gap)) for _, events in calls], thresholds)
+    else:
+        parser.error("give recorded event streams or --synthetic")
+
+
+if __name__ == "__main__":
+    main()
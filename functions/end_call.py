@@ -1,16 +1,12 @@
-import os
-from twilio.rest import Client
 import asyncio
 
+from services.twilio_service import twilio_gateway
+
 async def end_call(context, args):
-    # Retrieve the Twilio credentials from environment variables
-    account_sid = os.environ['TWILIO_ACCOUNT_SID']
-    auth_token = os.environ['TWILIO_AUTH_TOKEN']
-    client = Client(account_sid, auth_token)
     call_sid = context.call_sid
 
     # Fetch the call
-    call = client.calls(call_sid).fetch()
+    call = await twilio_gateway.fetch_call(call_sid)
 
     # Check if the call is already completed
     if call.status in ['completed', 'failed', 'busy', 'no-answer', 'canceled']:
@@ -20,6 +16,6 @@ async def end_call(context, args):
     await asyncio.sleep(5)
 
     # End the call
-    call = client.calls(call_sid).update(status='completed')
+    call = await twilio_gateway.update_call(call_sid, status='completed')
 
     return f"Call ended successfully. Final status: {call.status}"
\ No newline at end of file
@@ -8,7 +8,9 @@ tools = [
                 "type": "object",
                 "properties": {}
             },
-            "say": "Transferring your call, please wait."
+            "say": "Transferring your call, please wait.",
+            "timeout": 20,
+            "side_effects": True
         }
     },    
     
@@ -21,7 +23,9 @@ tools = [
                 "type": "object",
                 "properties": {}
             },
-            "say": "Goodbye."
+            "say": "Goodbye.",
+            "timeout": 15,
+            "side_effects": True
         }
     }
 ]
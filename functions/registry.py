@@ -0,0 +1,108 @@
+import asyncio
+import importlib
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from functions.function_manifest import tools
+from logger_config import get_logger
+from services.metrics_service import metrics
+
+logger = get_logger("Functions")
+
+function_latency = metrics.histogram("aidialer_function_seconds", "Time spent running LLM tool calls, by function")
+function_calls = metrics.counter("aidialer_function_calls_total", "LLM tool calls by function and result (ok, error, timeout, unknown)")
+
+
+class Tool:
+    """
+    A function from the manifest, resolved to its implementation in functions/<name>.py.
+
+    `side_effects` marks tools that act on the call itself (hanging up, transferring): once
+    dispatched they must run to completion even if the caller barges in.
+    """
+    def __init__(self, name: str, function: Callable, say: str, timeout: float, side_effects: bool = False):
+        self.name = name
+        self.function = function
+        self.say = say
+        self.timeout = timeout
+        self.side_effects = side_effects
+
+
+class ToolCall:
+    """One tool call requested by the model, with its arguments already parsed."""
+    def __init__(self, name: str, arguments: Dict[str, Any], call_id: Optional[str] = None):
+        self.name = name
+        self.arguments = arguments
+        self.call_id = call_id
+
+
+class FunctionRegistry:
+    """
+    The functions the LLM can call, loaded from the manifest once per process.
+
+    Tools are indexed by name. `run_all` executes every tool call from one model response
+    concurrently, each bounded by its manifest `timeout` (FUNCTION_TIMEOUT_SECONDS by default),
+    and always produces a result string the model can read, including for errors and timeouts.
+    Calls to tools with side effects run detached from the caller: cancelling `run_all` (on a
+    barge-in) only stops waiting for their results, not the calls themselves.
+    """
+    def __init__(self, manifest: List[Dict[str, Any]] = tools):
+        default_timeout = float(os.getenv("FUNCTION_TIMEOUT_SECONDS", 30))
+        self.tools: Dict[str, Tool] = {}
+        # Side-effecting calls still running; referenced here so they are not garbage collected
+        self.detached: Set[asyncio.Task] = set()
+        for tool in manifest:
+            spec = tool['function']
+            module = importlib.import_module(f"functions.{spec['name']}")
+            self.tools[spec['name']] = Tool(
+                spec['name'],
+                getattr(module, spec['name']),
+                spec.get('say', ''),
+                float(spec.get('timeout', default_timeout)),
+                bool(spec.get('side_effects', False))
+            )
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self.tools.get(name)
+
+    async def run(self, context: Any, call: ToolCall) -> str:
+        tool = self.get(call.name)
+        if tool is None:
+            function_calls.inc(function=call.name, result="unknown")
+            return f"Unknown function: {call.name}"
+
+        started = time.monotonic()
+        result = "cancelled"
+        try:
+            response = await asyncio.wait_for(tool.function(context, call.arguments), timeout=tool.timeout)
+            result = "ok"
+            return str(response)
+        except asyncio.TimeoutError:
+            result = "timeout"
+            logger.error(f"Function {call.name} timed out after {tool.timeout}s")
+            return f"Function {call.name} timed out."
+        except Exception as e:
+            result = "error"
+            logger.error(f"Function {call.name} failed: {e}")
+            return f"Function {call.name} failed: {e}"
+        finally:
+            function_latency.observe(time.monotonic() - started, function=call.name)
+            function_calls.inc(function=call.name, result=result)
+            logger.info(f"Function {call.name} called with args: {call.arguments}")
+
+    async def run_all(self, context: Any, calls: List[ToolCall]) -> List[str]:
+        runs = []
+        for call in calls:
+            tool = self.get(call.name)
+            if tool is not None and tool.side_effects:
+                task = asyncio.create_task(self.run(context, call))
+                self.detached.add(task)
+                task.add_done_callback(self.detached.discard)
+                runs.append(asyncio.shield(task))
+            else:
+                runs.append(self.run(context, call))
+        return list(await asyncio.gather(*runs))
+
+
+function_registry = FunctionRegistry()
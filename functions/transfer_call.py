@@ -1,24 +1,22 @@
 import os
-from twilio.rest import Client
 import asyncio
 
+from services.twilio_service import twilio_gateway
+
 async def transfer_call(context, args):
     # Retrieve the active call using the CallSid
-    account_sid = os.environ['TWILIO_ACCOUNT_SID']
-    auth_token = os.environ['TWILIO_AUTH_TOKEN']
     transfer_number = os.environ['TRANSFER_NUMBER']
-
-    client = Client(account_sid, auth_token)
     call_sid = context.call_sid
 
     # Wait for 10 seconds before transferring the call
     await asyncio.sleep(8)
 
     try:
-        call = client.calls(call_sid).fetch()
+        call = await twilio_gateway.fetch_call(call_sid)
         
         # Update the call with the transfer number
-        call = client.calls(call_sid).update(
+        call = await twilio_gateway.update_call(
+            call_sid,
             url=f'http://twimlets.com/forward?PhoneNumber={transfer_number}',
             method='POST'
         )
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from logger_config import get_logger
+from services.metrics_service import metrics
+
+logger = get_logger("AudioIngest")
+
+# Twilio media frames are 8kHz mulaw: 8 bytes per millisecond
+BYTES_PER_MS = 8
+
+dropped_audio = metrics.counter(
+    "aidialer_stt_ingest_dropped_ms_total", "Milliseconds of caller audio dropped because the transcriber fell behind"
+)
+send_latency = metrics.histogram("aidialer_stt_send_seconds", "Time taken to hand one audio chunk to the transcriber")
+
+
+class AudioIngestQueue:
+    """
+    Ordered, batched path for caller audio from Twilio to the transcriber.
+
+    Media frames are appended in arrival order and coalesced into chunks of `chunk_ms`
+    milliseconds. A single consumer task per call forwards the chunks, so audio can no
+    longer reach Deepgram out of order. The queue holds at most `max_chunks` chunks;
+    when it is full `push` waits up to `max_wait_ms` for room and then drops the oldest
+    chunk, so a slow transcriber cannot grow memory or latency without bound.
+    """
+    def __init__(self, send: Callable[[bytes], Awaitable], chunk_ms: Optional[int] = None,
+                 max_chunks: Optional[int] = None, max_wait_ms: Optional[int] = None):
+        self.send = send
+        self.chunk_ms = chunk_ms or int(os.getenv("STT_CHUNK_MS", 80))
+        self.chunk_bytes = self.chunk_ms * BYTES_PER_MS
+        self.max_wait = (max_wait_ms or int(os.getenv("STT_INGEST_MAX_WAIT_MS", 100))) / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_chunks or int(os.getenv("STT_INGEST_MAX_CHUNKS", 25)))
+        self.pending = bytearray()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def push(self, frame: bytes):
+        self.pending += frame
+        if len(self.pending) >= self.chunk_bytes:
+            chunk = bytes(self.pending)
+            self.pending.clear()
+            await self._enqueue(chunk)
+
+    async def _enqueue(self, chunk: Optional[bytes]):
+        try:
+            self.queue.put_nowait(chunk)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        try:
+            await asyncio.wait_for(self.queue.put(chunk), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            try:
+                dropped = self.queue.get_nowait()
+                dropped_audio.inc(len(dropped) // BYTES_PER_MS)
+                logger.warning(f"Transcriber is falling behind, dropped {len(dropped) // BYTES_PER_MS}ms of audio")
+            except asyncio.QueueEmpty:
+                pass
+            self.queue.put_nowait(chunk)
+
+    async def _run(self):
+        while True:
+            chunk = await self.queue.get()
+            if chunk is None:
+                break
+            started = time.monotonic()
+            try:
+                await self.send(chunk)
+            except Exception as e:
+                logger.error(f"Error while sending audio to transcriber: {e}")
+            send_latency.observe(time.monotonic() - started)
+
+    async def close(self):
+        if self.task is None:
+            return
+        if self.pending:
+            await self._enqueue(bytes(self.pending))
+            self.pending.clear()
+        await self._enqueue(None)
+        try:
+            await asyncio.wait_for(self.task, timeout=2)
+        except asyncio.TimeoutError:
+            self.task.cancel()
+        self.task = None
@@ -1,16 +1,86 @@
-from typing import List, Optional
+import json
+import sys
+import zlib
+from typing import Any, Dict, List, Optional
 
 
 class CallContext:
-    """Store context for the current call."""
+    """
+    Store context for the current call.
+
+    While the call runs, `user_context` is the live message list the LLM service appends to.
+    Once the call has ended, `compact` replaces it with zlib-compressed JSON; reading
+    `user_context` afterwards decodes a fresh copy.
+    """
+    __slots__ = (
+        "stream_sid", "call_sid", "call_ended", "system_message", "initial_message",
+        "start_time", "end_time", "status", "final_status", "turn_detection", "_user_context", "_transcript"
+    )
+
     def __init__(self):
         self.stream_sid: Optional[str] = None
         self.call_sid: Optional[str] = None
         self.call_ended: bool = False
-        self.user_context: List = []
         self.system_message: str = ""
         self.initial_message: str = ""
         self.start_time: Optional[str] = None
         self.end_time: Optional[str] = None
+        # Latest status reported by Twilio's status callback; final_status once the call is over
+        self.status: Optional[str] = None
         self.final_status: Optional[str] = None
-        
+        # Per-call overrides for end-of-turn detection thresholds (see services/turn_detection.py)
+        self.turn_detection: Dict[str, Any] = {}
+        self._user_context: Optional[List[Dict[str, Any]]] = []
+        self._transcript: Optional[bytes] = None
+
+    @property
+    def user_context(self) -> List[Dict[str, Any]]:
+        if self._transcript is not None:
+            return json.loads(zlib.decompress(self._transcript))
+        return self._user_context
+
+    @user_context.setter
+    def user_context(self, messages: List[Dict[str, Any]]):
+        self._user_context = messages
+        self._transcript = None
+
+    @property
+    def compacted(self) -> bool:
+        return self._transcript is not None
+
+    def compact(self):
+        if self._transcript is None:
+            self._transcript = self.compressed_transcript()
+            self._user_context = None
+
+    def compressed_transcript(self) -> bytes:
+        if self._transcript is not None:
+            return self._transcript
+        return zlib.compress(json.dumps(self._user_context, separators=(",", ":")).encode("utf-8"))
+
+    RECORD_FIELDS = ("call_sid", "stream_sid", "call_ended", "system_message", "initial_message",
+                     "start_time", "end_time", "status", "final_status", "turn_detection")
+
+    def to_record(self, with_transcript: bool = True) -> Dict[str, Any]:
+        """Plain fields for the shared state backend; the transcript as compressed JSON bytes."""
+        record = {name: getattr(self, name) for name in self.RECORD_FIELDS}
+        if with_transcript:
+            record["transcript"] = self.compressed_transcript()
+        return record
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "CallContext":
+        context = cls()
+        for name in cls.RECORD_FIELDS:
+            if name in record:
+                setattr(context, name, record[name])
+        if record.get("transcript") is not None:
+            context._transcript = record["transcript"]
+        return context
+
+    def approx_bytes(self) -> int:
+        """Rough memory held by this context, for the call-context store's accounting."""
+        size = sys.getsizeof(self) + len(self.system_message or "") + len(self.initial_message or "")
+        if self._transcript is not None:
+            return size + len(self._transcript)
+        return size + sum(sys.getsizeof(message) + len(str(message.get("content") or "")) for message in self._user_context)
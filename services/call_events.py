@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from services.call_context import CallContext
+from services.metrics_service import metrics
+
+subscriber_count = metrics.gauge("aidialer_call_event_subscribers", "Clients following a call's live updates")
+events_published = metrics.counter("aidialer_call_events_published_total", "Live call updates pushed to subscribers, by event")
+lagging_subscribers = metrics.counter("aidialer_call_event_subscribers_dropped_total", "Subscribers disconnected because they fell behind")
+
+# Twilio call statuses after which nothing more will happen on the call
+FINAL_STATUSES = ("completed", "busy", "failed", "no-answer", "canceled")
+
+
+def format_sse(event: str, data: Any) -> str:
+    """One server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class CallEventHub:
+    """
+    Live updates for each call, pushed to whoever follows it (see /events/{call_sid}).
+
+    Events are `transcript` (messages added or changed since the subscriber's copy), `status`
+    (Twilio status callbacks), `latency` (stage timings of each finished turn) and `end`.
+    They are published by the process serving the call and never block it: each subscriber
+    has a bounded queue, and one that falls behind is disconnected instead of being waited
+    for. It can reconnect and start again from a fresh snapshot.
+    """
+    def __init__(self, queue_size: Optional[int] = None):
+        self.queue_size = queue_size or int(os.getenv("CALL_EVENTS_QUEUE_SIZE", 256))
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, call_sid: str) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.setdefault(call_sid, set()).add(queue)
+        subscriber_count.inc()
+        return queue
+
+    def unsubscribe(self, call_sid: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(call_sid)
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[call_sid]
+        subscriber_count.dec()
+
+    def has_subscribers(self, call_sid: str) -> bool:
+        return call_sid in self.subscribers
+
+    def publish(self, call_sid: str, event: str, data: Any):
+        for queue in list(self.subscribers.get(call_sid, ())):
+            if queue.full():
+                # Its stream ends at the None; the client's copy can no longer be kept in step
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.unsubscribe(call_sid, queue)
+                lagging_subscribers.inc()
+                continue
+            queue.put_nowait((event, data))
+        events_published.inc(event=event)
+
+
+class CallUpdates:
+    """
+    Publishes one call's updates to the hub, from the events of the services serving it.
+
+    The transcript is compared with what was last published, so barge-ins and discarded
+    speculative replies, which rewrite the end of the transcript, go out as corrections
+    too: every `transcript` event says from which message (`since`) the subscriber's copy
+    should be replaced.
+    """
+    def __init__(self, hub: CallEventHub, call_sid: str, context: CallContext):
+        self.hub = hub
+        self.call_sid = call_sid
+        self.context = context
+        self.published: List[Dict[str, Any]] = []
+
+    def transcript_changed(self, *args: Any):
+        # Nobody to tell; the next subscriber starts from a snapshot and deltas are replayable
+        if not self.hub.has_subscribers(self.call_sid):
+            return
+        messages = self.context.user_context
+        start = 0
+        while start < min(len(messages), len(self.published)) and messages[start] == self.published[start]:
+            start += 1
+        if start == len(messages) == len(self.published):
+            return
+        self.published = [dict(message) for message in messages]
+        self.hub.publish(self.call_sid, "transcript", {"since": start, "transcript": self.published[start:], "seq": len(messages)})
+
+    def turn_finished(self, interaction_count: int, timings: Dict[str, float]):
+        self.hub.publish(self.call_sid, "latency", {
+            "interaction": interaction_count,
+            "timings_ms": {stage: round(seconds * 1000) for stage, seconds in timings.items()},
+        })
+
+    def ended(self):
+        self.transcript_changed()
+        self.hub.publish(self.call_sid, "end", {"call_ended": True, "final_status": self.context.final_status})
+
+
+call_events = CallEventHub()
@@ -0,0 +1,250 @@
+import base64
+import json
+import math
+import os
+import socket
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from logger_config import get_logger
+from services.call_context import CallContext
+from services.metrics_service import metrics
+from services.state_backend import StateBackend, StateBackendFactory
+
+logger = get_logger("CallStore")
+
+context_count = metrics.gauge("aidialer_call_contexts", "Call contexts held in memory, by state (active, pending, completed)")
+context_bytes = metrics.gauge("aidialer_call_context_memory_bytes", "Estimated memory held by in-memory call contexts")
+evictions = metrics.counter("aidialer_call_contexts_evicted_total", "Call contexts dropped from memory, by reason (ttl, size, pending_ttl, served_elsewhere)")
+archive_reads = metrics.counter("aidialer_call_archive_reads_total", "Call contexts read from the state backend: evicted here, or served by another process")
+# Kept in the shared record by whichever node receives Twilio's status callbacks
+STATUS_FIELDS = ("status", "final_status")
+
+stream_affinity = metrics.counter("aidialer_call_stream_affinity_total", "Media streams by where their call's context was found (local, shared, none)")
+
+
+class CallContextStore:
+    """
+    Call contexts by call SID, bounded in memory and backed by shared state.
+
+    Works like the dict it replaces for calls that are in memory. Contexts of connected calls
+    are never evicted. When a call's media stream stops, `complete` compacts its transcript,
+    writes it to the state backend and keeps it in memory for CALL_CONTEXT_TTL_SECONDS, at
+    most CALL_CONTEXT_MAX_COMPLETED of them. Contexts created by /start_call for calls that
+    never connect are dropped after CALL_CONTEXT_PENDING_TTL_SECONDS.
+
+    The state backend (STATE_BACKEND, see services/state_backend.py) is what lets several
+    worker processes or hosts serve calls: `register` publishes a call placed by this node and
+    records this node (NODE_ID, reachable at NODE_HOST) as its owner, `fetch` finds it from
+    whichever process the media stream reaches and makes that process the owner, and
+    `load`/`page` serve completed calls from any of them. A pending context this node still
+    holds for a call another node served is replaced by that node's archived record as soon
+    as it is read.
+    """
+    def __init__(self, ttl: Optional[float] = None, max_completed: Optional[int] = None,
+                 pending_ttl: Optional[float] = None, backend: Optional[StateBackend] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("CALL_CONTEXT_TTL_SECONDS", 3600))
+        self.max_completed = max_completed if max_completed is not None else int(os.getenv("CALL_CONTEXT_MAX_COMPLETED", 500))
+        self.pending_ttl = pending_ttl if pending_ttl is not None else float(os.getenv("CALL_CONTEXT_PENDING_TTL_SECONDS", 600))
+        self.backend = backend or StateBackendFactory.get_backend()
+        self.node = {
+            "node_id": os.getenv("NODE_ID") or f"{socket.gethostname()}-{os.getpid()}",
+            "host": os.getenv("NODE_HOST") or os.getenv("SERVER") or "",
+        }
+        self.contexts: Dict[str, CallContext] = {}
+        self.active: Set[str] = set()
+        # call SID -> (state, expiry) for contexts that are not connected, soonest expiry first
+        self.expiring: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def __getitem__(self, call_sid: str) -> CallContext:
+        return self.contexts[call_sid]
+
+    def __setitem__(self, call_sid: str, context: CallContext):
+        """Register a call that has not connected yet (see `activate` and `complete`)."""
+        self.contexts[call_sid] = context
+        if call_sid not in self.active:
+            self._expire_at(call_sid, "pending", self.pending_ttl)
+        self.prune()
+
+    def __contains__(self, call_sid: str) -> bool:
+        return call_sid in self.contexts
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.contexts))
+
+    def __len__(self) -> int:
+        return len(self.contexts)
+
+    def get(self, call_sid: str, default: Optional[CallContext] = None) -> Optional[CallContext]:
+        return self.contexts.get(call_sid, default)
+
+    def items(self) -> List[Tuple[str, CallContext]]:
+        return list(self.contexts.items())
+
+    async def register(self, call_sid: str, context: CallContext):
+        """A call placed by this node: keep it here and publish it for the process its media stream reaches."""
+        self[call_sid] = context
+        await self.backend.save_call(call_sid, context.to_record(with_transcript=False), completed=False, ttl=self.pending_ttl)
+        await self.backend.set_owner(call_sid, self.node, ttl=self.pending_ttl)
+
+    async def fetch(self, call_sid: str) -> Optional[CallContext]:
+        """The context of a call whose media stream just connected, wherever it was registered."""
+        context = self.contexts.get(call_sid)
+        if context is not None:
+            stream_affinity.inc(source="local")
+        else:
+            record = await self.backend.load_call(call_sid)
+            if record is None or record.get("call_ended"):
+                stream_affinity.inc(source="none")
+                return None
+            stream_affinity.inc(source="shared")
+            context = CallContext.from_record(record)
+        # This node serves the call now; `complete` removes the entry. Kept as long as a
+        # completed context, so it outlives any call
+        await self.backend.set_owner(call_sid, self.node, ttl=self.ttl)
+        return context
+
+    async def owner(self, call_sid: str) -> Optional[Dict[str, str]]:
+        """The node serving a call, or that placed it if it is still waiting for its media stream."""
+        return await self.backend.get_owner(call_sid)
+
+    def activate(self, call_sid: str, context: CallContext):
+        """The call's media stream connected; keep its context until `complete`."""
+        self.contexts[call_sid] = context
+        self.active.add(call_sid)
+        self.expiring.pop(call_sid, None)
+        if context.start_time is None:
+            context.start_time = datetime.now(timezone.utc).isoformat()
+        self.prune()
+
+    async def complete(self, call_sid: str):
+        """The call's media stream stopped: compact, archive and start its TTL."""
+        context = self.contexts.get(call_sid)
+        self.active.discard(call_sid)
+        if context is None:
+            return
+        context.call_ended = True
+        context.end_time = context.end_time or datetime.now(timezone.utc).isoformat()
+        context.compact()
+        self._expire_at(call_sid, "completed", self.ttl)
+        try:
+            # Twilio's status callbacks reach the node that placed the call, which may not be this
+            # one; `update_status` keeps them in the shared record until now
+            await self.backend.save_call(call_sid, context.to_record(), completed=True, keep=STATUS_FIELDS)
+            await self.backend.delete_owner(call_sid)
+        except Exception as e:
+            logger.error(f"Error archiving call {call_sid}: {e}")
+        self.prune()
+
+    async def load(self, call_sid: str) -> Optional[CallContext]:
+        """The call's context from memory, or from the state backend if it was evicted or served elsewhere."""
+        context = self.contexts.get(call_sid)
+        if context is not None and (call_sid in self.active or context.call_ended):
+            return context
+        record = await self.backend.load_call(call_sid)
+        if record is None or (context is not None and not record.get("call_ended")):
+            # Not connected anywhere yet, or live on another node: the backend knows no more
+            return context
+        if context is not None:
+            # Another node served and archived the call; drop the pending copy made here
+            self._evict(call_sid, "served_elsewhere")
+            self.update_metrics()
+        archive_reads.inc()
+        return CallContext.from_record(record)
+
+    async def update_status(self, call_sid: str, status: str, final: bool) -> Optional[CallContext]:
+        """Record a status reported by Twilio; completed calls are updated in place in the archive."""
+        context = None
+        for _ in range(2):
+            context = await self.load(call_sid)
+            if context is None:
+                return None
+            context.status = status
+            if final:
+                context.final_status = status
+            if context.call_ended:
+                # Not save_call: that would move the call to the top of the archive and shift issued cursors
+                await self.backend.update_call(call_sid, context.to_record())
+                return context
+            # Not archived yet: the shared record carries the status to `complete`, wherever the call is served
+            if await self.backend.update_call(call_sid, context.to_record(with_transcript=False), completed=False):
+                return context
+            if call_sid in self.active:
+                # Its pending record expired; `complete` archives this context as it is
+                return context
+            # Archived by the node that served it in the meantime; record the status there instead
+        return context
+
+    async def page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Tuple[str, CallContext]], Optional[str]]:
+        """
+        One page of calls and the cursor for the next (None after the last page).
+
+        The first page starts with this node's calls that have not completed yet, which count
+        against `limit` (it is only exceeded when there are more of them than that); completed
+        calls follow from the state backend, newest first. A cursor is a position in that
+        archive, so calls completing while a client pages through do not shift its pages.
+        Raises ValueError for a cursor this store did not issue.
+        """
+        live = []
+        if cursor is None:
+            for call_sid, context in self.items():
+                if not context.call_ended and call_sid not in self.active:
+                    # Pending here, but possibly served and archived by another node since
+                    context = await self.load(call_sid)
+                if context is not None and not context.call_ended:
+                    live.append((call_sid, context))
+        remaining = limit - len(live)
+        if remaining <= 0:
+            # The page is full of ongoing calls; the archive starts on the next one
+            return live, self.encode_cursor(math.inf, "")
+        records = await self.backend.page_completed(remaining, self.decode_cursor(cursor) if cursor else None)
+        next_cursor = None
+        if len(records) == remaining:
+            next_cursor = self.encode_cursor(records[-1]["archived_at"], records[-1]["call_sid"])
+        return live + [(record["call_sid"], CallContext.from_record(record)) for record in records], next_cursor
+
+    @staticmethod
+    def encode_cursor(archived_at: float, call_sid: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([archived_at, call_sid]).encode()).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[float, str]:
+        try:
+            archived_at, call_sid = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return float(archived_at), str(call_sid)
+        except (ValueError, TypeError, UnicodeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+
+    def _expire_at(self, call_sid: str, state: str, ttl: float):
+        self.expiring.pop(call_sid, None)
+        self.expiring[call_sid] = (state, time.monotonic() + ttl)
+
+    def prune(self):
+        now = time.monotonic()
+        # Completed and pending entries are appended as they happen, so expiries are in order per state
+        for call_sid, (state, expires_at) in list(self.expiring.items()):
+            if expires_at > now:
+                continue
+            self._evict(call_sid, "ttl" if state == "completed" else "pending_ttl")
+
+        completed = [call_sid for call_sid, (state, _) in self.expiring.items() if state == "completed"]
+        for call_sid in completed[:max(0, len(completed) - self.max_completed)]:
+            self._evict(call_sid, "size")
+        self.update_metrics()
+
+    def _evict(self, call_sid: str, reason: str):
+        self.expiring.pop(call_sid, None)
+        self.contexts.pop(call_sid, None)
+        evictions.inc(reason=reason)
+
+    def update_metrics(self):
+        completed = sum(1 for state, _ in self.expiring.values() if state == "completed")
+        context_count.set(len(self.active), state="active")
+        context_count.set(completed, state="completed")
+        context_count.set(len(self.contexts) - len(self.active) - completed, state="pending")
+        context_bytes.set(sum(context.approx_bytes() for context in self.contexts.values()))
+
+    async def close(self):
+        await self.backend.close()
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Awaitable, Optional, Set
+
+from services.metrics_service import metrics
+
+cancelled_work = metrics.counter("aidialer_cancelled_work_total", "LLM responses and TTS requests aborted by barge-in, by stage")
+cancelled_chars = metrics.counter("aidialer_cancelled_chars_total", "Characters generated or queued for synthesis that were thrown away, by stage")
+
+
+class CancelScope:
+    """
+    Cancellation handle for the work belonging to one interaction.
+
+    Coroutines started through `run` execute as tasks owned by the scope. `cancel` cancels
+    all of them, which unwinds the provider stream they are reading (closing the HTTP
+    response) instead of letting it generate output nobody will hear. A cancelled scope
+    stays cancelled; services swap in a fresh scope for the next interaction.
+    """
+    def __init__(self):
+        self.cancelled = False
+        self.reason: Optional[str] = None
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def run(self, coro: Awaitable) -> Any:
+        """Run `coro` inside the scope. Returns None if the scope was cancelled."""
+        if self.cancelled:
+            coro.close()
+            return None
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # Only swallow our own cancellation, not the caller being cancelled
+            if self.cancelled and task.cancelled():
+                return None
+            raise
+        finally:
+            self.tasks.discard(task)
+
+    def cancel(self, reason: str = ""):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self.reason = reason
+        for task in self.tasks:
+            task.cancel()
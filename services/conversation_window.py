@@ -0,0 +1,124 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from logger_config import get_logger
+from services.metrics_service import metrics
+
+logger = get_logger("ConversationWindow")
+
+prompt_tokens = metrics.histogram("aidialer_llm_prompt_tokens", "Estimated input tokens sent to the LLM per request",
+                                  buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+prompt_messages = metrics.histogram("aidialer_llm_prompt_messages", "Messages sent verbatim to the LLM per request",
+                                    buckets=(2, 4, 8, 16, 32, 64, 128))
+summaries = metrics.counter("aidialer_context_summaries_total", "Background summaries of older conversation turns, by result")
+
+SUMMARY_PROMPT = """You maintain the running summary of a phone call between an AI agent (assistant) and a caller (user).
+Update the summary with the new messages below. Keep every concrete fact: names, numbers, addresses, prices,
+order details, decisions and anything the agent promised or still has to do. Write at most 150 words, plain text.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+
+Message = Dict[str, Any]
+
+
+def estimate_tokens(message: Message) -> int:
+    # Roughly four characters per token for English, plus per-message overhead
+    return len(str(message.get("content") or "")) // 4 + 4
+
+
+class ConversationWindow:
+    """
+    Keeps the prompt sent to the LLM under LLM_CONTEXT_BUDGET_TOKENS.
+
+    The full history stays in the service's `user_context` (the UI and call records read it);
+    the window only decides what is sent. Recent messages go verbatim. Once the prompt is over
+    budget, the oldest messages are folded into a running summary that is sent right after
+    the system prompt. Summaries are produced by a background task, so a reply never waits for
+    one: until it finishes, the previous summary and the unsummarized messages are sent.
+    At least LLM_CONTEXT_KEEP_MESSAGES recent messages are always sent verbatim.
+    """
+    def __init__(self, summarize: Callable[[str], Awaitable[str]], budget_tokens: Optional[int] = None, keep_messages: Optional[int] = None):
+        self.summarize = summarize
+        self.budget_tokens = budget_tokens or int(os.getenv("LLM_CONTEXT_BUDGET_TOKENS", 3000))
+        self.keep_messages = keep_messages or int(os.getenv("LLM_CONTEXT_KEEP_MESSAGES", 6))
+        self.summary = ""
+        # Number of messages at the start of the history that the summary covers
+        self.summarized = 0
+        self.history_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def reset(self):
+        self.close()
+        self.summary = ""
+        self.summarized = 0
+        self.history_id = None
+
+    def build(self, system_message: str, history: List[Message]) -> Tuple[Optional[str], List[Message]]:
+        """
+        Return the summary note (None until there is one) and the messages to send verbatim.
+        The note is kept separate from the system message so the system prefix stays
+        byte-identical across requests and provider prompt caching keeps applying.
+        """
+        if self.history_id != id(history):
+            # A new call context was installed; the old summary does not apply to it
+            self.reset()
+            self.history_id = id(history)
+
+        note = f"Summary of the earlier part of this call:\n{self.summary}" if self.summary else None
+        recent = history[self.summarized:]
+
+        tokens = sum(estimate_tokens({"content": text}) for text in (system_message, note) if text)
+        tokens += sum(estimate_tokens(message) for message in recent)
+        prompt_tokens.observe(tokens)
+        prompt_messages.observe(len(recent))
+
+        if tokens > self.budget_tokens and self.task is None:
+            self.fold(history, tokens - self.budget_tokens)
+        return note, recent
+
+    def fold(self, history: List[Message], excess_tokens: int):
+        """Start summarizing enough of the oldest unsummarized messages to get back under budget."""
+        last_foldable = len(history) - self.keep_messages
+        end = self.summarized
+        freed = 0
+        while end < last_foldable and freed < excess_tokens:
+            freed += estimate_tokens(history[end])
+            end += 1
+        # The verbatim part has to start with a caller message for the providers to accept it
+        while end < last_foldable and history[end]["role"] != "user":
+            end += 1
+        if end <= self.summarized or history[end]["role"] != "user":
+            return
+
+        messages = list(history[self.summarized:end])
+        self.task = asyncio.create_task(self.run_summary(messages, end, id(history)))
+
+    async def run_summary(self, messages: List[Message], end: int, history_id: int):
+        transcript = "\n".join(f"{message['role']}: {message.get('content') or ''}" for message in messages)
+        prompt = SUMMARY_PROMPT.format(summary=self.summary or "(none yet)", transcript=transcript)
+        try:
+            summary = (await self.summarize(prompt)).strip()
+            if not summary or history_id != self.history_id:
+                summaries.inc(result="discarded")
+                return
+            self.summary = summary
+            self.summarized = end
+            summaries.inc(result="ok")
+            logger.info(f"Folded {len(messages)} messages into the conversation summary")
+        except Exception as e:
+            summaries.inc(result="error")
+            logger.error(f"Error summarizing conversation: {e}")
+        finally:
+            self.task = None
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
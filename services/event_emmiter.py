@@ -1,5 +1,53 @@
 import asyncio
-from typing import Any, Callable, Dict, List
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from logger_config import get_logger
+from services.metrics_service import metrics
+
+logger = get_logger("EventEmitter")
+
+handler_latency = metrics.histogram("aidialer_event_handler_seconds", "Time spent in event handlers, by emitter, event and handler")
+handler_overflow = metrics.counter("aidialer_event_queue_overflow_total", "Queued events dropped or replaced because a handler fell behind, by policy (or discarded as stale)")
+
+# Overflow policies for queued dispatch
+BLOCK = "block"              # emit waits for room, so a slow handler slows the producer down
+DROP_OLDEST = "drop_oldest"  # the oldest queued event is discarded to make room
+COALESCE = "coalesce"        # only the newest event is kept; anything still queued is replaced
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+
+class HandlerStats:
+    """Counters for one handler subscribed to one event."""
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.dropped = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.max_queued = 0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "avg_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+            "max_seconds": self.max_seconds,
+            "max_queued": self.max_queued,
+        }
+
+
+class Subscription:
+    """A handler registered for an event, with its own queue and consumer task in queued mode."""
+    def __init__(self, event: str, callback: Callable):
+        self.event = event
+        self.callback = callback
+        self.name = getattr(callback, "__name__", repr(callback))
+        self.stats = HandlerStats()
+        self.queue: Optional[asyncio.Queue] = None
+        self.overflow = BLOCK
+        self.consumer: Optional[asyncio.Task] = None
 
 
 class EventEmitter:
@@ -8,13 +56,28 @@ class EventEmitter:
 
     An event emitter allows registering callbacks for specific events and emitting those events
     with optional arguments and keyword arguments.
+
+    By default `emit` runs every callback inline, in order, and returns once they are all done.
+    After `enable_queued_dispatch`, each subscriber instead gets its own bounded queue and
+    consumer task: `emit` only enqueues, so a slow subscriber no longer stalls the producer.
+    Events still reach each subscriber in the order they were emitted. What happens when a
+    queue is full is set by the overflow policy (block, drop_oldest or coalesce), per event
+    if needed. Handler timings are recorded in both modes and available from `handler_stats`.
+    Events made stale by `discard_pending` are never delivered, including one a consumer had
+    already taken off its queue but not yet handed to the callback.
     """
 
     def __init__(self):
         """
         Initializes an instance of the EventEmitter class.
         """
-        self._events: Dict[str, List[Callable]] = {}
+        self._events: Dict[str, List[Subscription]] = {}
+        self._queued = False
+        self._queue_size = 0
+        self._overflow = BLOCK
+        self._event_overflow: Dict[str, str] = {}
+        # Bumped by discard_pending; queued events carry the generation they were emitted in
+        self._generations: Dict[str, int] = {}
 
     def on(self, event: str, callback: Callable):
         """
@@ -26,7 +89,25 @@ class EventEmitter:
         """
         if event not in self._events:
             self._events[event] = []
-        self._events[event].append(callback)
+        self._events[event].append(Subscription(event, callback))
+
+    def enable_queued_dispatch(self, maxsize: int = 64, overflow: str = BLOCK, policies: Optional[Dict[str, str]] = None):
+        """
+        Switches this emitter to queued dispatch.
+
+        Args:
+            maxsize (int): How many events may wait for each subscriber.
+            overflow (str): What to do when a subscriber's queue is full: block, drop_oldest or coalesce.
+            policies (Dict[str, str]): Optional per-event overrides of `overflow`.
+        """
+        policies = policies or {}
+        for policy in [overflow, *policies.values()]:
+            if policy not in OVERFLOW_POLICIES:
+                raise ValueError(f"Unsupported overflow policy: {policy}")
+        self._queued = True
+        self._queue_size = maxsize
+        self._overflow = overflow
+        self._event_overflow = dict(policies)
 
     async def emit(self, event: str, *args: Any, **kwargs: Any):
         """
@@ -38,19 +119,145 @@ class EventEmitter:
             **kwargs (Any): Optional keyword arguments to be passed to the callbacks.
         """
         if event in self._events:
-            for callback in self._events[event]:
-                await self._run_callback(callback, *args, **kwargs)
+            for subscription in self._events[event]:
+                if self._queued:
+                    await self._enqueue(subscription, args, kwargs)
+                else:
+                    await self._run_callback(subscription, *args, **kwargs)
+
+    async def _enqueue(self, subscription: Subscription, args: Tuple, kwargs: Dict[str, Any]):
+        """
+        Hands an event to a subscriber's queue, applying the overflow policy if it is full.
+
+        Args:
+            subscription (Subscription): The subscriber to deliver to.
+            args (Tuple): Positional arguments for the callback.
+            kwargs (Dict[str, Any]): Keyword arguments for the callback.
+        """
+        if subscription.consumer is None:
+            subscription.queue = asyncio.Queue(self._queue_size)
+            subscription.overflow = self._event_overflow.get(subscription.event, self._overflow)
+            subscription.consumer = asyncio.create_task(self._consume(subscription))
+        queue = subscription.queue
+
+        if subscription.overflow == COALESCE:
+            self._discard_queued(subscription)
+        elif subscription.overflow == DROP_OLDEST and queue.full():
+            queue.get_nowait()
+            queue.task_done()
+            self._count_dropped(subscription)
+
+        await queue.put((self._generations.get(subscription.event, 0), args, kwargs))
+        subscription.stats.max_queued = max(subscription.stats.max_queued, queue.qsize())
 
-    async def _run_callback(self, callback: Callable, *args: Any, **kwargs: Any):
+    async def _consume(self, subscription: Subscription):
+        """
+        Delivers queued events to one subscriber, one at a time.
+
+        Args:
+            subscription (Subscription): The subscriber whose queue to drain.
+        """
+        while True:
+            generation, args, kwargs = await subscription.queue.get()
+            try:
+                if generation != self._generations.get(subscription.event, 0):
+                    self._count_dropped(subscription, "discarded")
+                    continue
+                await self._run_callback(subscription, *args, **kwargs)
+            except Exception as e:
+                logger.error(f"Error in {subscription.name} handling '{subscription.event}': {e}")
+            finally:
+                subscription.queue.task_done()
+
+    async def _run_callback(self, subscription: Subscription, *args: Any, **kwargs: Any):
         """
         Runs a callback function with the provided arguments.
 
         Args:
-            callback (Callable): The callback function to be executed.
+            subscription (Subscription): The subscriber whose callback should be executed.
             *args (Any): Optional positional arguments to be passed to the callback.
             **kwargs (Any): Optional keyword arguments to be passed to the callback.
         """
-        if asyncio.iscoroutinefunction(callback):
-            await callback(*args, **kwargs)
-        else:
-            callback(*args, **kwargs)
\ No newline at end of file
+        stats = subscription.stats
+        started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(subscription.callback):
+                await subscription.callback(*args, **kwargs)
+            else:
+                subscription.callback(*args, **kwargs)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.calls += 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+            handler_latency.observe(elapsed, emitter=self.__class__.__name__, event=subscription.event, handler=subscription.name)
+
+    def _discard_queued(self, subscription: Subscription):
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+            subscription.queue.task_done()
+            self._count_dropped(subscription)
+
+    def _count_dropped(self, subscription: Subscription, policy: Optional[str] = None):
+        subscription.stats.dropped += 1
+        handler_overflow.inc(emitter=self.__class__.__name__, event=subscription.event, policy=policy or subscription.overflow)
+
+    def discard_pending(self, event: Optional[str] = None):
+        """
+        Drops queued events that have not been delivered yet, e.g. audio made stale by a barge-in.
+
+        Args:
+            event (str): Only drop events with this name; all events if omitted.
+        """
+        for name, subscriptions in self._events.items():
+            if event is not None and name != event:
+                continue
+            self._generations[name] = self._generations.get(name, 0) + 1
+            for subscription in subscriptions:
+                if subscription.queue is not None:
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                        subscription.queue.task_done()
+                        self._count_dropped(subscription, "discarded")
+
+    async def wait_delivered(self, event: Optional[str] = None):
+        """
+        Waits until every queued event has been handled (or discarded).
+
+        Args:
+            event (str): Only wait for events with this name; all events if omitted.
+        """
+        for name, subscriptions in self._events.items():
+            if event is not None and name != event:
+                continue
+            for subscription in subscriptions:
+                if subscription.consumer is not None:
+                    await subscription.queue.join()
+
+    def handler_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns timing and queue statistics keyed by "event:handler".
+        """
+        return {
+            f"{subscription.event}:{subscription.name}": subscription.stats.as_dict()
+            for subscriptions in self._events.values()
+            for subscription in subscriptions
+        }
+
+    async def close_queues(self):
+        """
+        Stops the consumer tasks of queued dispatch, dropping anything still queued.
+        """
+        for subscriptions in self._events.values():
+            for subscription in subscriptions:
+                if subscription.consumer is not None:
+                    subscription.consumer.cancel()
+                    # Release anyone still waiting in wait_delivered
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                        subscription.queue.task_done()
+                    subscription.consumer = None
+                    subscription.queue = None
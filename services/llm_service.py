@@ -1,20 +1,27 @@
-import importlib
+import asyncio
+import copy
 import json
 import os
-import re
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import anthropic
 from openai import AsyncOpenAI
 
 from functions.function_manifest import tools
+from functions.registry import ToolCall, function_registry
 from logger_config import get_logger
 from services.call_context import CallContext
+from services.cancellation import CancelScope, cancelled_chars, cancelled_work
+from services.conversation_window import ConversationWindow
 from services.event_emmiter import EventEmitter
+from services.metrics_service import TurnTracer, metrics
+from services.sentence_segmenter import SentenceSegmenter
 
 logger = get_logger("LLMService")
 
+input_tokens = metrics.counter("aidialer_llm_input_tokens_total", "LLM input tokens by provider and kind (uncached, cache_read, cache_write)")
+
 class AbstractLLMService(EventEmitter, ABC):
     def __init__(self, context: CallContext):
         super().__init__()
@@ -26,12 +33,18 @@ class AbstractLLMService(EventEmitter, ABC):
             {"role": "assistant", "content": self.initial_message}
         ]
         self.partial_response_index = 0
-        self.available_functions = {}
-        for tool in tools:
-            function_name = tool['function']['name']
-            module = importlib.import_module(f'functions.{function_name}')
-            self.available_functions[function_name] = getattr(module, function_name)
-        self.sentence_buffer = ""
+        self.functions = function_registry
+        self.segmenter = SentenceSegmenter()
+        # Decides which part of user_context is sent; user_context itself keeps the full history
+        self.window = ConversationWindow(self.summarize)
+        self.tracer = TurnTracer()
+        self.scope = CancelScope()
+        # Text generated so far by the response that is currently streaming, if any
+        self.current_response: Optional[str] = None
+        # While speculating, llmreply events are held here instead of being emitted
+        self.held_replies: Optional[List[Tuple[Tuple, Dict[str, Any]]]] = None
+        self.hold_listener: Optional[Callable[[Dict[str, Any]], None]] = None
+        self.replies_released = asyncio.Event()
         context.user_context = self.user_context
 
     def set_call_context(self, context: CallContext):
@@ -44,11 +57,93 @@ class AbstractLLMService(EventEmitter, ABC):
         self.system_message = context.system_message
         self.initial_message = context.initial_message
 
+    def set_tracer(self, tracer: TurnTracer):
+        self.tracer = tracer
 
-    @abstractmethod
     async def completion(self, text: str, interaction_count: int, role: str = 'user', name: str = 'user'):
+        """Stream a response inside the current cancel scope, so a barge-in can abort it."""
+        await self.scope.run(self.stream_completion(text, interaction_count, role, name))
+
+    @abstractmethod
+    async def stream_completion(self, text: str, interaction_count: int, role: str = 'user', name: str = 'user'):
+        pass
+
+    @abstractmethod
+    async def summarize(self, prompt: str) -> str:
+        """One-shot, non-streaming completion used to fold older turns into the conversation summary."""
         pass
 
+    def close(self):
+        self.window.close()
+
+    def cancel(self, reason: str = "barge-in"):
+        """Abort the in-flight response and keep what had been generated so far in the context."""
+        if self.current_response is not None:
+            cut_off = self.current_response
+            logger.info(f"LLM response cancelled ({reason}) after {len(cut_off)} chars: {cut_off}")
+            cancelled_work.inc(stage="llm")
+            cancelled_chars.inc(len(cut_off), stage="llm")
+            if cut_off:
+                self.user_context.append({"role": "assistant", "content": cut_off})
+            self.current_response = None
+        self.scope.cancel(reason)
+        self.scope = CancelScope()
+        self.segmenter.reset()
+
+    async def emit(self, event: str, *args: Any, **kwargs: Any):
+        if event == 'llmreply' and self.held_replies is not None:
+            self.held_replies.append((args, kwargs))
+            if self.hold_listener is not None:
+                self.hold_listener(args[0])
+            return
+        await super().emit(event, *args, **kwargs)
+
+    def hold_replies(self, listener: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """Hold back llmreply events (and tool calls) until `release_replies`, for speculative turns."""
+        self.held_replies = []
+        self.hold_listener = listener
+        self.replies_released = asyncio.Event()
+
+    async def release_replies(self):
+        held, self.held_replies, self.hold_listener = self.held_replies or [], None, None
+        self.replies_released.set()
+        for args, kwargs in held:
+            await super().emit('llmreply', *args, **kwargs)
+
+    def drop_held_replies(self):
+        self.held_replies = None
+        self.hold_listener = None
+
+    def held_reply_texts(self) -> List[str]:
+        return [args[0]['partialResponse'] for args, _ in self.held_replies or []]
+
+    def truncate_reply(self, heard: str):
+        """
+        Cut the assistant messages of the latest turn down to what the caller actually heard
+        before interrupting.
+
+        `heard` covers the whole turn (tool fillers and earlier replies included), so it is
+        matched against the turn's assistant messages in order: those heard in full are kept,
+        the one cut off mid-way is replaced by its heard part and any later ones are dropped.
+        """
+        start = len(self.user_context)
+        while start > 0 and self.user_context[start - 1]["role"] != "user":
+            start -= 1
+        remaining = " ".join(heard.split())
+        kept = []
+        for message in self.user_context[start:]:
+            if message["role"] == "assistant":
+                content = " ".join(message["content"].split())
+                if content and remaining.startswith(content):
+                    remaining = remaining[len(content):].lstrip()
+                elif remaining:
+                    message["content"] = remaining
+                    remaining = ""
+                else:
+                    continue
+            kept.append(message)
+        self.user_context[start:] = kept
+
     def reset(self):
         self.partial_response_index = 0
 
@@ -70,7 +165,8 @@ class AbstractLLMService(EventEmitter, ABC):
                     "description": function.get('description', ''),
                     "input_schema": {
                         "type": "object",
-                        "properties": function.get('parameters', {}).get('properties', {}),
+                        # Copied so trimming descriptions below leaves the shared manifest alone
+                        "properties": copy.deepcopy(function.get('parameters', {}).get('properties', {})),
                         "required": function.get('parameters', {}).get('required', [])
                     }
                 }
@@ -87,99 +183,155 @@ class AbstractLLMService(EventEmitter, ABC):
         
         return anthropic_tools
 
-    def split_into_sentences(self, text):
-        # Split the text into sentences, keeping the separators
-        sentences = re.split(r'([.!?])', text)
-        # Pair the sentences with their separators
-        sentences = [''.join(sentences[i:i+2]) for i in range(0, len(sentences), 2)]
-        return sentences
+    async def run_tool_calls(self, calls: List[ToolCall], interaction_count: int):
+        """
+        Say each tool's filler message, run all calls from the response concurrently, then
+        let the model continue with the results. end_call results are not sent back.
+        """
+        if self.held_replies is not None:
+            # Speculative turn: tools have side effects, so wait until the transcript is confirmed
+            await self.replies_released.wait()
+
+        for call in calls:
+            logger.info(f"Function call detected: {call.name}")
+            tool = self.functions.get(call.name)
+            if tool is not None and tool.say:
+                await self.emit('llmreply', {
+                    "partialResponseIndex": None,
+                    "partialResponse": tool.say
+                }, interaction_count)
+                self.user_context.append({"role": "assistant", "content": tool.say})
+
+        responses = await self.functions.run_all(self.context, calls)
+
+        results = [(call.name, response) for call, response in zip(calls, responses) if call.name != "end_call"]
+        if not results:
+            return
+        for name, response in results[:-1]:
+            self.user_context.append({"role": "function", "content": response, "name": name})
+        name, response = results[-1]
+        await self.completion(response, interaction_count, 'function', name)
+
+    def record_usage(self, provider: str, interaction_count: int, uncached: int, cache_read: int = 0, cache_write: int = 0):
+        input_tokens.inc(uncached, provider=provider, kind="uncached")
+        input_tokens.inc(cache_read, provider=provider, kind="cache_read")
+        input_tokens.inc(cache_write, provider=provider, kind="cache_write")
+        total = uncached + cache_read + cache_write
+        logger.info(f"Interaction {interaction_count}: {total} input tokens, {cache_read} read from the prompt cache")
 
     async def emit_complete_sentences(self, text, interaction_count):
-        self.sentence_buffer += text
-        sentences = self.split_into_sentences(self.sentence_buffer)
-        
-        # Emit all complete sentences
-        for sentence in sentences[:-1]:
+        for sentence in self.segmenter.push(text):
+            self.tracer.mark("llm_first_sentence")
             await self.emit('llmreply', {
                 "partialResponseIndex": self.partial_response_index,
-                "partialResponse": sentence.strip()
+                "partialResponse": sentence
             }, interaction_count)
             self.partial_response_index += 1
-        
-        # Keep the last (potentially incomplete) sentence in the buffer
-        self.sentence_buffer = sentences[-1] if sentences else ""
+
+    async def emit_remaining_text(self, interaction_count):
+        """Emit whatever the segmenter is still holding once a response has finished streaming."""
+        remainder = self.segmenter.flush()
+        if remainder:
+            self.tracer.mark("llm_first_sentence")
+            await self.emit('llmreply', {
+                "partialResponseIndex": self.partial_response_index,
+                "partialResponse": remainder
+            }, interaction_count)
+            self.partial_response_index += 1
+
+# Manifest entries also carry internal fields ("say", "timeout") that are not sent to the provider
+OPENAI_FUNCTION_KEYS = ("name", "description", "parameters")
+# Provider tool schemas are built once; byte-identical tools on every request keep provider prompt caches warm
+OPENAI_TOOLS = [
+    {"type": tool["type"], "function": {key: value for key, value in tool["function"].items() if key in OPENAI_FUNCTION_KEYS}}
+    for tool in tools
+]
+ANTHROPIC_TOOLS = AbstractLLMService.convert_openai_tools_to_anthropic(tools)
+if ANTHROPIC_TOOLS:
+    # Anthropic caches the prompt up to the last block marked with cache_control
+    ANTHROPIC_TOOLS[-1]["cache_control"] = {"type": "ephemeral"}
+
 
 class OpenAIService(AbstractLLMService):
     def __init__(self, context: CallContext):
         super().__init__(context)
         self.openai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-    async def completion(self, text: str, interaction_count: int, role: str = 'user', name: str = 'user'):
+    async def stream_completion(self, text: str, interaction_count: int, role: str = 'user', name: str = 'user'):
         try:
             self.user_context.append({"role": role, "content": text, "name": name})
-            messages = [{"role": "system", "content": self.system_message}] + self.user_context
+            summary, history = self.window.build(self.system_message, self.user_context)
+            # OpenAI caches matching prompt prefixes automatically, so the static part comes first
+            messages = [{"role": "system", "content": self.system_message}]
+            if summary:
+                messages.append({"role": "system", "content": summary})
+            messages += history
         
             stream = await self.openai.chat.completions.create(
                 model="gpt-4o",
                 messages=messages,
-                tools=tools,
+                tools=OPENAI_TOOLS,
                 stream=True,
+                stream_options={"include_usage": True},
             )
 
             complete_response = ""
-            function_name = ""
-            function_args = ""
+            self.current_response = complete_response
+            # Streamed tool calls arrive in fragments keyed by their index in the response
+            tool_calls: Dict[int, Dict[str, str]] = {}
 
             async for chunk in stream:
+                if chunk.usage is not None:
+                    details = chunk.usage.prompt_tokens_details
+                    cached = (details.cached_tokens or 0) if details else 0
+                    self.record_usage("openai", interaction_count, chunk.usage.prompt_tokens - cached, cached)
+                if not chunk.choices:
+                    # The usage chunk that ends the stream has no choices
+                    continue
+                self.tracer.mark("llm_first_token")
                 delta = chunk.choices[0].delta
                 content = delta.content or ""
-                tool_calls = delta.tool_calls
-
-                if tool_calls:
-                    for tool_call in tool_calls:
-                        if tool_call.function and tool_call.function.name:
-                            logger.info(f"Function call detected: {tool_call.function.name}")
-                            function_name = tool_call.function.name
-                            function_args += tool_call.function.arguments or ""
-                else:
+
+                if delta.tool_calls:
+                    for fragment in delta.tool_calls:
+                        call = tool_calls.setdefault(fragment.index, {"id": "", "name": "", "arguments": ""})
+                        if fragment.id:
+                            call["id"] = fragment.id
+                        if fragment.function and fragment.function.name:
+                            call["name"] = fragment.function.name
+                        if fragment.function and fragment.function.arguments:
+                            call["arguments"] += fragment.function.arguments
+                elif content:
                     complete_response += content
+                    self.current_response = complete_response
                     await self.emit_complete_sentences(content, interaction_count)
 
-                if chunk.choices[0].finish_reason == "tool_calls":
-                    logger.info(f"Function call detected: {function_name}")
-                    function_to_call = self.available_functions[function_name]
-                    function_args = self.validate_function_args(function_args)
-                    
-                    tool_data = next((tool for tool in tools if tool['function']['name'] == function_name), None)
-                    say = tool_data['function']['say']
-
-                    await self.emit('llmreply', {
-                        "partialResponseIndex": None,
-                        "partialResponse": say
-                    }, interaction_count)
-
-                    self.user_context.append({"role": "assistant", "content": say})
-                    
-                    function_response = await function_to_call(self.context, function_args)
-                                        
-                    logger.info(f"Function {function_name} called with args: {function_args}")
-
-                    if function_name != "end_call":
-                        await self.completion(function_response, interaction_count, 'function', function_name)
-
             # Emit any remaining content in the buffer
-            if self.sentence_buffer.strip():
-                await self.emit('llmreply', {
-                    "partialResponseIndex": self.partial_response_index,
-                    "partialResponse": self.sentence_buffer.strip()
-                }, interaction_count)
-                self.sentence_buffer = ""
+            await self.emit_remaining_text(interaction_count)
+
+            if complete_response or not tool_calls:
+                self.user_context.append({"role": "assistant", "content": complete_response})
+            self.current_response = None
 
-            self.user_context.append({"role": "assistant", "content": complete_response})
+            if tool_calls:
+                calls = [
+                    ToolCall(call["name"], self.validate_function_args(call["arguments"] or "{}"), call["id"])
+                    for _, call in sorted(tool_calls.items())
+                ]
+                await self.run_tool_calls(calls, interaction_count)
 
         except Exception as e:
+            self.current_response = None
             logger.error(f"Error in OpenAIService completion: {str(e)}")
 
+    async def summarize(self, prompt: str) -> str:
+        response = await self.openai.chat.completions.create(
+            model=os.getenv("OPENAI_SUMMARY_MODEL", "gpt-4o-mini"),
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=300,
+        )
+        return response.choices[0].message.content or ""
+
 
 class AnthropicService(AbstractLLMService):
     def __init__(self, context: CallContext):
@@ -191,61 +343,83 @@ class AnthropicService(AbstractLLMService):
             {"role": "assistant", "content": self.initial_message}
         ]
 
-    async def completion(self, text: str, interaction_count: int, role: str = 'user', name: str = 'user'):
+    async def stream_completion(self, text: str, interaction_count: int, role: str = 'user', name: str = 'user'):
         try:
-            self.user_context.append({"role": role, "content": text})
+            self.user_context.append({"role": role, "content": text, "name": name})
             
-            messages = [{"role": msg["role"], "content": msg["content"]} for msg in self.user_context]
+            summary, history = self.window.build(self.system_message, self.user_context)
+            messages = self.to_anthropic_messages(history)
+            # Tools and the system message form a cached prefix; the summary changes, so it goes after the breakpoint
+            system = [{"type": "text", "text": self.system_message, "cache_control": {"type": "ephemeral"}}]
+            if summary:
+                system.append({"type": "text", "text": summary})
             
             async with self.client.messages.stream(
                 model="claude-3-opus-20240229",
                 max_tokens=300,
-                system=self.system_message,
+                system=system,
                 messages=messages,
-                tools=self.convert_openai_tools_to_anthropic(tools),
+                tools=ANTHROPIC_TOOLS,
             ) as stream:
                 complete_response = ""
+                self.current_response = complete_response
                 async for event in stream:
+                    if event.type in ("text", "input_json"):
+                        self.tracer.mark("llm_first_token")
                     if event.type == "text":
                         content = event.text
                         complete_response += content
+                        self.current_response = complete_response
                         await self.emit_complete_sentences(content, interaction_count)
-                    elif event.type == "tool_call":
-                        function_name = event.tool_call.function.name
-                        function_args = event.tool_call.function.arguments
-                        logger.info(f"Function call detected: {function_name}")
-                        function_to_call = self.available_functions[function_name]
-                        function_args = self.validate_function_args(function_args)
-                        
-                        tool_data = next((tool for tool in tools if tool['function']['name'] == function_name), None)
-                        say = tool_data['function']['say']
-
-                        await self.emit('llmreply', {
-                            "partialResponseIndex": None,
-                            "partialResponse": say
-                        }, interaction_count)
-
-                        function_response = await function_to_call(function_args)
-                                            
-                        logger.info(f"Function {function_name} called with args: {function_args}")
-
-                        if function_name != "end_call":
-                            await self.completion(function_response, interaction_count, 'function', function_name)
 
                 # Emit any remaining content in the buffer
-                if self.sentence_buffer.strip():
-                    await self.emit('llmreply', {
-                        "partialResponseIndex": self.partial_response_index,
-                        "partialResponse": self.sentence_buffer.strip()
-                    }, interaction_count)
-                    self.sentence_buffer = ""
+                await self.emit_remaining_text(interaction_count)
 
                 final_message = await stream.get_final_message()
-                self.user_context.append({"role": "assistant", "content": final_message.content[0].text})
+                usage = final_message.usage
+                self.record_usage("anthropic", interaction_count, usage.input_tokens,
+                                  usage.cache_read_input_tokens or 0, usage.cache_creation_input_tokens or 0)
+
+            calls = [
+                ToolCall(block.name, block.input if isinstance(block.input, dict) else {}, block.id)
+                for block in final_message.content if block.type == "tool_use"
+            ]
+            if complete_response or not calls:
+                self.user_context.append({"role": "assistant", "content": complete_response})
+            self.current_response = None
+
+            if calls:
+                await self.run_tool_calls(calls, interaction_count)
 
         except Exception as e:
+            self.current_response = None
             logger.error(f"Error in AnthropicService completion: {str(e)}")
 
+    @staticmethod
+    def to_anthropic_messages(history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Anthropic has no function role and needs alternating roles: results become caller-side text."""
+        messages = []
+        for message in history:
+            role, content = message["role"], message["content"] or ""
+            if not content:
+                # Anthropic rejects empty turns, e.g. a reply that was only a tool call
+                continue
+            if role == "function":
+                role, content = "user", f"Result of {message.get('name', 'function')}: {content}"
+            if messages and messages[-1]["role"] == role:
+                messages[-1]["content"] += "\n" + content
+            else:
+                messages.append({"role": role, "content": content})
+        return messages
+
+    async def summarize(self, prompt: str) -> str:
+        response = await self.client.messages.create(
+            model=os.getenv("ANTHROPIC_SUMMARY_MODEL", "claude-3-haiku-20240307"),
+            max_tokens=300,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return "".join(block.text for block in response.content if block.type == "text")
+
 class LLMFactory:
     @staticmethod
     def get_llm_service(service_name: str, context: CallContext) -> AbstractLLMService:
@@ -0,0 +1,99 @@
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from logger_config import get_logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = get_logger("Codec")
+
+# Twilio sends compact JSON; the spaced variants keep the fast path for other json.dumps producers
+MEDIA_EVENT_MARKERS = ('"event":"media"', '"event": "media"')
+PAYLOAD_MARKER = '"payload":'
+
+
+@lru_cache(maxsize=1024)
+def _quoted(value: str) -> str:
+    return json.dumps(value)
+
+
+class JSONCodec:
+    """
+    Encodes and decodes the Twilio media-stream websocket protocol with the standard library.
+
+    Inbound media frames are recognised before parsing: the base64 payload is sliced out of
+    the raw text (base64 never contains quotes) and wrapped in a minimal message, so the
+    50-per-second media events skip the JSON parser entirely. Outbound media, mark and clear
+    envelopes are assembled from string templates instead of serializing dicts.
+    """
+    name = "json"
+
+    def loads(self, data: str) -> Dict[str, Any]:
+        return json.loads(data)
+
+    def dumps(self, message: Dict[str, Any]) -> str:
+        return json.dumps(message)
+
+    def decode(self, data: str) -> Dict[str, Any]:
+        payload = self.media_payload(data)
+        if payload is not None:
+            return {"event": "media", "media": {"payload": payload}}
+        return self.loads(data)
+
+    @staticmethod
+    def media_payload(data: str) -> Optional[str]:
+        if MEDIA_EVENT_MARKERS[0] not in data and MEDIA_EVENT_MARKERS[1] not in data:
+            return None
+        start = data.find(PAYLOAD_MARKER)
+        if start < 0:
+            return None
+        start = data.find('"', start + len(PAYLOAD_MARKER)) + 1
+        if start == 0:
+            return None
+        end = data.find('"', start)
+        if end < 0:
+            return None
+        return data[start:end]
+
+    @staticmethod
+    def encode_media(stream_sid: str, payload: str) -> str:
+        return f'{{"streamSid":{_quoted(stream_sid)},"event":"media","media":{{"payload":"{payload}"}}}}'
+
+    @staticmethod
+    def encode_mark(stream_sid: str, name: str) -> str:
+        return f'{{"streamSid":{_quoted(stream_sid)},"event":"mark","mark":{{"name":{_quoted(name)}}}}}'
+
+    @staticmethod
+    def encode_clear(stream_sid: str) -> str:
+        return f'{{"streamSid":{_quoted(stream_sid)},"event":"clear"}}'
+
+
+class OrjsonCodec(JSONCodec):
+    """Same protocol handling as JSONCodec, with orjson for the messages that do need a parser."""
+    name = "orjson"
+
+    def loads(self, data: str) -> Dict[str, Any]:
+        return orjson.loads(data)
+
+    def dumps(self, message: Dict[str, Any]) -> str:
+        return orjson.dumps(message).decode()
+
+
+class CodecFactory:
+    @staticmethod
+    def get_codec(codec_name: Optional[str] = None) -> JSONCodec:
+        codec_name = (codec_name or os.getenv("WS_CODEC", "orjson")).lower()
+        if codec_name == "orjson":
+            if orjson is not None:
+                return OrjsonCodec()
+            logger.warning("orjson is not installed, falling back to the json codec")
+            return JSONCodec()
+        elif codec_name == "json":
+            return JSONCodec()
+        else:
+            raise ValueError(f"Unsupported websocket codec: {codec_name}")
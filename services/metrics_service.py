@@ -0,0 +1,221 @@
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from logger_config import get_logger
+
+logger = get_logger("Metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """A monotonically increasing value, optionally split by labels."""
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+    def set(self, value: float, **labels):
+        self.values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class _HistogramSeries:
+    def __init__(self, buckets: Tuple[float, ...], window: int):
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=window)
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram that also keeps a sliding window of recent samples,
+    so p50/p95/p99 can be reported without a query layer in front of it.
+    """
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 2048):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.window = window
+        self.series: Dict[LabelKey, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = _HistogramSeries(self.buckets, self.window)
+        position = bisect_left(self.buckets, value)
+        if position < len(self.buckets):
+            series.bucket_counts[position] += 1
+        series.count += 1
+        series.sum += value
+        series.samples.append(value)
+
+    def quantiles(self, **labels) -> Dict[float, float]:
+        series = self.series.get(_label_key(labels))
+        if series is None or not series.samples:
+            return {}
+        ordered = sorted(series.samples)
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        quantile_lines = [
+            f"# HELP {self.name}_quantile Recent-window quantiles of {self.name}",
+            f"# TYPE {self.name}_quantile gauge"
+        ]
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.bucket_counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series.count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series.sum}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series.count}")
+            for q, value in self.quantiles(**dict(key)).items():
+                quantile_lines.append(f"{self.name}_quantile{_format_labels(key, ('quantile', str(q)))} {value}")
+        return lines + quantile_lines
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics rendered on the /metrics route."""
+    def __init__(self):
+        self._metrics: Dict[str, Counter] = {}
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+turn_stage_latency = metrics.histogram(
+    "aidialer_turn_stage_seconds",
+    "Seconds from the final transcript of a turn until each pipeline stage first happened"
+)
+
+
+class TurnTracer:
+    """
+    Time every stage of a conversational turn for a single call.
+
+    A turn starts when the final transcript is handed to the LLM. Each stage is recorded
+    once per turn, the first time it happens, as the time elapsed since the turn started.
+    `stt_final` is measured the other way round: from the last interim transcript to the
+    final one, which is how long Deepgram took to decide the caller was done.
+    Callbacks registered with `on_turn` get each turn's timings once its audio is acknowledged.
+
+    A speculative reply (see services/speculation.py) starts streaming before its turn does.
+    Between `begin_speculation` and the next `start_turn`, its LLM stages are held back with
+    the time they happened and then recorded for the new turn, as zero if they came first;
+    `cancel_speculation` drops them when the speculation is discarded.
+    """
+    STAGES = ("stt_final", "llm_first_token", "llm_first_sentence", "tts_first_byte", "audio_sent", "mark_ack")
+    SPECULATIVE_STAGES = ("llm_first_token", "llm_first_sentence")
+
+    def __init__(self):
+        self.interaction_count: Optional[int] = None
+        self.turn_start: Optional[float] = None
+        self.last_speech: Optional[float] = None
+        self.timings: Dict[str, float] = {}
+        self.listeners: List[Callable[[int, Dict[str, float]], None]] = []
+        # Stage -> time.monotonic() for a speculative reply whose turn has not started yet
+        self.speculative: Optional[Dict[str, float]] = None
+
+    def on_turn(self, callback: Callable[[int, Dict[str, float]], None]):
+        self.listeners.append(callback)
+
+    def speech_detected(self):
+        self.last_speech = time.monotonic()
+
+    def begin_speculation(self):
+        self.speculative = {}
+
+    def cancel_speculation(self):
+        self.speculative = None
+
+    def start_turn(self, interaction_count: int):
+        now = time.monotonic()
+        self.interaction_count = interaction_count
+        self.turn_start = now
+        self.timings = {}
+        if self.last_speech is not None:
+            self._record("stt_final", now - self.last_speech)
+            self.last_speech = None
+        speculative, self.speculative = self.speculative, None
+        for stage, happened_at in (speculative or {}).items():
+            self._record(stage, max(0.0, happened_at - now))
+
+    def mark(self, stage: str):
+        if self.speculative is not None and stage in self.SPECULATIVE_STAGES:
+            self.speculative.setdefault(stage, time.monotonic())
+            return
+        if self.turn_start is None or stage in self.timings:
+            return
+        self._record(stage, time.monotonic() - self.turn_start)
+        if stage == "mark_ack":
+            summary = ", ".join(f"{name}={self.timings[name] * 1000:.0f}ms" for name in self.STAGES if name in self.timings)
+            logger.info(f"Interaction {self.interaction_count} latency: {summary}")
+            for callback in self.listeners:
+                callback(self.interaction_count, dict(self.timings))
+
+    def _record(self, stage: str, elapsed: float):
+        self.timings[stage] = elapsed
+        turn_stage_latency.observe(elapsed, stage=stage)
@@ -0,0 +1,149 @@
+import os
+import re
+from typing import List, Optional
+
+# Words that end in a period without ending the sentence ("Dr. Smith", "e.g. this")
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "approx", "apt",
+    "ave", "blvd", "dept", "est", "fig", "inc", "ltd", "co", "corp", "e.g", "i.e", "a.m", "p.m",
+}
+# Abbreviations only when a number follows ("No. 5"); otherwise ordinary words ("No. I can't.")
+NUMBER_ABBREVIATIONS = {"no"}
+
+# A run of terminators plus any closing quotes or brackets: "?", "...", '."', "!)"
+TERMINATOR = re.compile(r"""[.!?]+["'”’)\]]*""")
+CLAUSE_BREAK = re.compile(r"[,;:—](?=\s)")
+COMPLETE_WORD = re.compile(r"\S+(?=\s)")
+
+
+class SentenceSegmenter:
+    """
+    Splits streamed LLM text into sentences as tokens arrive.
+
+    Only text that has not been looked at yet is scanned, so the cost per token stays constant
+    however long the response gets. A terminator only ends a sentence when it is followed by
+    whitespace, which keeps decimals ("3.5"), URLs ("example.com/a.b") and times together;
+    known abbreviations and initials never end a sentence. A capital letter counts as an initial
+    when another initial follows ("J. R. R. Tolkien"), or when a capitalized name follows and the
+    letter starts the sentence or comes after a capitalized word ("John F. Kennedy"); "plan B.
+    Then" and "so do I. Okay." still split.
+
+    To get TTS started sooner, the first segment of a response can be cut early: at the first
+    clause break (SENTENCE_EARLY_FLUSH_COMMA) and/or once it reaches SENTENCE_EARLY_FLUSH_WORDS
+    words. Later segments are always whole sentences.
+    """
+    def __init__(self, early_flush_comma: Optional[bool] = None, early_flush_words: Optional[int] = None):
+        if early_flush_comma is None:
+            early_flush_comma = os.getenv("SENTENCE_EARLY_FLUSH_COMMA", "false").lower() == "true"
+        if early_flush_words is None:
+            early_flush_words = int(os.getenv("SENTENCE_EARLY_FLUSH_WORDS", 0))
+        self.early_flush_comma = early_flush_comma
+        self.early_flush_words = early_flush_words
+        self.reset()
+
+    def reset(self):
+        self.buffer = ""
+        # Everything before scan_from has been checked and contains no sentence boundary
+        self.scan_from = 0
+        self.segments_emitted = 0
+
+    @property
+    def pending(self) -> str:
+        return self.buffer
+
+    def push(self, text: str) -> List[str]:
+        """Add streamed text and return the sentences it completed, in order."""
+        self.buffer += text
+        segments = []
+        start = 0
+        position = self.scan_from
+        while True:
+            match = TERMINATOR.search(self.buffer, position)
+            if match is None:
+                position = len(self.buffer)
+                break
+            end = match.end()
+            if end == len(self.buffer):
+                # Can't tell yet whether the next token starts a new sentence
+                position = match.start()
+                break
+            if not self.buffer[end].isspace():
+                position = end
+                continue
+            abbreviation = self.is_abbreviation(start, match.start(), match.group(), end)
+            if abbreviation is None:
+                # Only the next word tells whether this was "No. 5" or the end of "No."
+                position = match.start()
+                break
+            position = end
+            if abbreviation:
+                continue
+            segment = self.buffer[start:end].strip()
+            if segment:
+                segments.append(segment)
+            start = end
+
+        self.buffer = self.buffer[start:]
+        self.scan_from = position - start
+
+        if not segments and self.segments_emitted == 0 and (self.early_flush_comma or self.early_flush_words):
+            clause = self.first_clause()
+            if clause:
+                segments.append(clause)
+
+        self.segments_emitted += len(segments)
+        return segments
+
+    def flush(self) -> str:
+        """Return whatever is left at the end of a response and start over for the next one."""
+        remainder = self.buffer.strip()
+        self.reset()
+        return remainder
+
+    def is_abbreviation(self, start: int, terminator_at: int, terminator: str, end: int) -> Optional[bool]:
+        """Whether the terminator belongs to an abbreviation; None if the text after it has not arrived yet."""
+        if terminator != ".":
+            return False
+        word_start = terminator_at
+        while word_start > start and not self.buffer[word_start - 1].isspace():
+            word_start -= 1
+        word = self.buffer[word_start:terminator_at].lstrip("\"'(“‘[")
+        following = self.buffer[end:].lstrip()
+        if len(word) == 1 and word.isalpha():
+            return self.is_initial(start, word_start, word, following)
+        if word.lower() in NUMBER_ABBREVIATIONS:
+            return following[0].isdigit() if following else None
+        return word.lower() in ABBREVIATIONS
+
+    def is_initial(self, start: int, word_start: int, letter: str, following: str) -> Optional[bool]:
+        if not letter.isupper():
+            return False
+        if len(following) < 2:
+            return None
+        if not following[0].isupper():
+            return False
+        if following[0].isalpha() and following[1] == ".":
+            return True
+        if letter == "I":
+            return False
+        previous = self.buffer[start:word_start].split()
+        return not previous or previous[-1].lstrip("\"'(“‘[")[:1].isupper()
+
+    def first_clause(self) -> Optional[str]:
+        cut = None
+        if self.early_flush_comma:
+            match = CLAUSE_BREAK.search(self.buffer)
+            if match:
+                cut = match.end()
+        if cut is None and self.early_flush_words:
+            for count, match in enumerate(COMPLETE_WORD.finditer(self.buffer), start=1):
+                if count == self.early_flush_words:
+                    cut = match.end()
+                    break
+        if cut is None:
+            return None
+
+        clause = self.buffer[:cut].strip()
+        self.buffer = self.buffer[cut:]
+        self.scan_from = 0
+        return clause or None
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from logger_config import get_logger
+from services.metrics_service import metrics
+
+logger = get_logger("Speculation")
+
+speculations = metrics.counter("aidialer_speculation_total", "Speculative LLM turns by outcome (hit, miss)")
+wasted_tokens = metrics.counter("aidialer_speculation_wasted_tokens_total", "Estimated LLM output tokens generated by discarded speculative turns")
+
+
+def normalize_transcript(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+
+class StableTranscriptDetector:
+    """
+    Calls `on_stable` with the caller's running transcript once it has stopped changing for
+    `window` seconds. The running transcript is the finalized segments of the current
+    utterance plus the latest interim result.
+    """
+    def __init__(self, on_stable: Callable[[str], Awaitable[Any]], window: float):
+        self.on_stable = on_stable
+        self.window = window
+        self.hypothesis = ""
+        self.timer: Optional[asyncio.Task] = None
+
+    def update(self, hypothesis: str):
+        hypothesis = hypothesis.strip()
+        if not self.window or not hypothesis or hypothesis == self.hypothesis:
+            return
+        self.hypothesis = hypothesis
+        self.cancel_timer()
+        self.timer = asyncio.create_task(self.wait_until_stable(hypothesis))
+
+    async def wait_until_stable(self, hypothesis: str):
+        await asyncio.sleep(self.window)
+        # Detach before calling out, so a reset from inside the callback cannot cancel it
+        self.timer = None
+        await self.on_stable(hypothesis)
+
+    def reset(self):
+        self.hypothesis = ""
+        self.cancel_timer()
+
+    def cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+class Speculator:
+    """
+    Starts the LLM reply for a turn before the transcript is final.
+
+    When the caller's interim transcript has been stable for SPECULATION_STABLE_MS, `start`
+    runs a completion for it with the LLM service's `llmreply` events held back, so nothing
+    is synthesized or played yet and tool calls wait. If the final transcript matches,
+    `commit` releases the held replies and the turn continues from wherever the completion
+    got to. Otherwise the completion is cancelled and the conversation history and response
+    index are restored as if it never ran. With SPECULATION_PREFETCH_TTS the first held
+    sentence is synthesized into the TTS cache, so a hit plays it without a provider round trip.
+    """
+    def __init__(self, llm_service, tts_service=None, prefetch_tts: Optional[bool] = None):
+        self.llm_service = llm_service
+        self.tts_service = tts_service
+        if prefetch_tts is None:
+            prefetch_tts = os.getenv("SPECULATION_PREFETCH_TTS", "false").lower() == "true"
+        self.prefetch_tts = prefetch_tts
+        self.text: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.prefetch_task: Optional[asyncio.Task] = None
+        self.snapshot: List[Dict[str, Any]] = []
+        self.index_snapshot = 0
+
+    @property
+    def active(self) -> bool:
+        return self.task is not None
+
+    def matches(self, text: str) -> bool:
+        return self.active and normalize_transcript(text) == normalize_transcript(self.text)
+
+    def covers(self, transcript: str) -> bool:
+        """Whether the caller's running transcript is still a word-for-word prefix of the text being speculated on."""
+        if not self.active:
+            return False
+        words = normalize_transcript(transcript).split()
+        return words == normalize_transcript(self.text).split()[:len(words)]
+
+    def start(self, text: str, interaction_count: int):
+        if self.matches(text):
+            return
+        self.discard("transcript changed")
+        logger.info(f"Speculating on: {text}")
+        self.text = text
+        self.snapshot = list(self.llm_service.user_context)
+        self.index_snapshot = self.llm_service.partial_response_index
+        # Its LLM stages belong to the turn it turns into, which has not started yet
+        self.llm_service.tracer.begin_speculation()
+        self.llm_service.hold_replies(self.on_held_reply if self.prefetch_tts and self.tts_service else None)
+        self.task = asyncio.create_task(self.llm_service.completion(text, interaction_count))
+
+    def on_held_reply(self, llm_reply: Dict[str, Any]):
+        if self.prefetch_task is None and llm_reply.get('partialResponse'):
+            self.prefetch_task = asyncio.create_task(self.tts_service.warm_cache([llm_reply['partialResponse']], pin=False))
+
+    async def commit(self, text: str) -> Optional[asyncio.Task]:
+        """Release the speculative reply if it was for `text`; returns its task, or None on a miss."""
+        if not self.active:
+            return None
+        if not self.matches(text):
+            self.discard("final transcript differs")
+            return None
+        speculations.inc(result="hit")
+        logger.info(f"Speculation hit: {text}")
+        task = self.task
+        self.clear()
+        await self.llm_service.release_replies()
+        return task
+
+    def discard(self, reason: str):
+        if not self.active:
+            return
+        speculations.inc(result="miss")
+        generated = self.llm_service.current_response
+        if generated is None:
+            generated = " ".join(self.llm_service.held_reply_texts())
+        wasted_tokens.inc(len(generated) // 4)
+        logger.info(f"Speculation discarded ({reason}): {self.text}")
+
+        self.llm_service.cancel("speculation discarded")
+        self.llm_service.drop_held_replies()
+        self.llm_service.tracer.cancel_speculation()
+        # Same list object: the call context and the conversation window hold references to it
+        self.llm_service.user_context[:] = self.snapshot
+        self.llm_service.partial_response_index = self.index_snapshot
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+        self.clear()
+
+    def clear(self):
+        self.text = None
+        self.task = None
+        self.prefetch_task = None
+        self.snapshot = []
@@ -0,0 +1,387 @@
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from logger_config import get_logger
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import WatchError
+except ImportError:
+    aioredis = None
+
+logger = get_logger("StateBackend")
+
+# A call record is a JSON-serializable dict of CallContext fields; "transcript" holds bytes
+Record = Dict[str, Any]
+# Position of a completed call in the archive, newest first: (archived_at, call_sid)
+Position = Tuple[float, str]
+
+
+def merge_kept(stored: Optional[Record], record: Record, keep: Sequence[str]) -> Record:
+    """`record`, with the fields in `keep` taken from `stored` where it has them set."""
+    if not stored or not keep:
+        return record
+    merged = dict(record)
+    for name in keep:
+        if stored.get(name) is not None:
+            merged[name] = stored[name]
+    return merged
+
+
+class StateBackend(ABC):
+    """
+    Call state shared by every worker process (and host) serving this app.
+
+    Holds the record of each call, written when /start_call places it (pending) and when its
+    media stream ends (completed), so whichever process Twilio's websocket reaches can load
+    the call's configuration and any process can serve its transcript. It also holds the node
+    that owns each call, which /incoming uses to steer the media stream back to it.
+    Pending records and owners expire; completed records are kept, and `page_completed`
+    lists them newest first with an "archived_at" timestamp for resuming the listing.
+    """
+    @abstractmethod
+    async def save_call(self, call_sid: str, record: Record, completed: bool, ttl: Optional[float] = None,
+                        keep: Sequence[str] = ()):
+        """Save a call's record. Fields in `keep` that the replaced record has set are kept from it, atomically."""
+        pass
+
+    @abstractmethod
+    async def load_call(self, call_sid: str) -> Optional[Record]:
+        pass
+
+    @abstractmethod
+    async def update_call(self, call_sid: str, record: Record, completed: Optional[bool] = None) -> bool:
+        """
+        Replace a saved call's record, keeping its expiry and its position in the archive.
+        With `completed`, only while the call is (or is not yet) completed. Returns whether
+        the record was replaced.
+        """
+        pass
+
+    @abstractmethod
+    async def page_completed(self, limit: int, before: Optional[Position] = None) -> List[Record]:
+        """Up to `limit` completed records, newest first, starting after position `before`."""
+        pass
+
+    @abstractmethod
+    async def set_owner(self, call_sid: str, owner: Dict[str, str], ttl: float):
+        pass
+
+    @abstractmethod
+    async def get_owner(self, call_sid: str) -> Optional[Dict[str, str]]:
+        pass
+
+    @abstractmethod
+    async def delete_owner(self, call_sid: str):
+        pass
+
+    async def close(self):
+        return
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local stand-in: for a single worker, and for tests."""
+    def __init__(self):
+        self.calls: Dict[str, Record] = {}
+        # call SID -> archived_at, for completed calls
+        self.completed: Dict[str, float] = {}
+        self.owners: Dict[str, Dict[str, str]] = {}
+        self.expires: Dict[str, float] = {}
+
+    def _alive(self, key: str) -> bool:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.expires.pop(key, None)
+            kind, call_sid = key.split(":", 1)
+            (self.calls if kind == "call" else self.owners).pop(call_sid, None)
+            return False
+        return True
+
+    async def save_call(self, call_sid, record, completed, ttl=None, keep=()):
+        self.calls[call_sid] = merge_kept(self.calls.get(call_sid), record, keep)
+        if completed:
+            self.completed[call_sid] = time.time()
+        else:
+            self.completed.pop(call_sid, None)
+        if ttl is None:
+            self.expires.pop(f"call:{call_sid}", None)
+        else:
+            self.expires[f"call:{call_sid}"] = time.monotonic() + ttl
+
+    async def load_call(self, call_sid):
+        return self.calls.get(call_sid) if self._alive(f"call:{call_sid}") else None
+
+    async def update_call(self, call_sid, record, completed=None):
+        if call_sid not in self.calls:
+            return False
+        if completed is not None and (call_sid in self.completed) != completed:
+            return False
+        self.calls[call_sid] = record
+        return True
+
+    async def page_completed(self, limit, before=None):
+        positions = sorted(((archived_at, call_sid) for call_sid, archived_at in self.completed.items()), reverse=True)
+        if before is not None:
+            positions = [position for position in positions if position < tuple(before)]
+        return [dict(self.calls[call_sid], archived_at=archived_at) for archived_at, call_sid in positions[:limit]]
+
+    async def set_owner(self, call_sid, owner, ttl):
+        self.owners[call_sid] = owner
+        self.expires[f"owner:{call_sid}"] = time.monotonic() + ttl
+
+    async def get_owner(self, call_sid):
+        return self.owners.get(call_sid) if self._alive(f"owner:{call_sid}") else None
+
+    async def delete_owner(self, call_sid):
+        self.owners.pop(call_sid, None)
+        self.expires.pop(f"owner:{call_sid}", None)
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Local stand-in shared by worker processes on one host through a SQLite file (WAL mode).
+    Also the default archive for a single process, so transcripts survive restarts.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.lock = asyncio.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS call_records (
+                call_sid TEXT PRIMARY KEY,
+                completed INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                expires_at REAL,
+                record TEXT NOT NULL,
+                transcript BLOB
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS call_records_archive ON call_records (completed, updated_at, call_sid)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS call_owners (
+                call_sid TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+
+    async def run(self, fn, *args):
+        async with self.lock:
+            return await asyncio.to_thread(fn, *args)
+
+    def _save_call(self, call_sid: str, record: Record, completed: bool, ttl: Optional[float], keep: Sequence[str]):
+        fields = {name: value for name, value in record.items() if name != "transcript"}
+        try:
+            if keep:
+                # Other processes write the same file: hold the write lock from the read to the write
+                self.db.execute("BEGIN IMMEDIATE")
+                row = self.db.execute("SELECT record FROM call_records WHERE call_sid = ?", (call_sid,)).fetchone()
+                fields = merge_kept(json.loads(row[0]) if row else None, fields, keep)
+            now = time.time()
+            self.db.execute(
+                "INSERT OR REPLACE INTO call_records (call_sid, completed, updated_at, expires_at, record, transcript) VALUES (?, ?, ?, ?, ?, ?)",
+                (call_sid, int(completed), now, None if ttl is None else now + ttl, json.dumps(fields), record.get("transcript"))
+            )
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+    def _load_call(self, call_sid: str) -> Optional[Record]:
+        row = self.db.execute(
+            "SELECT record, transcript FROM call_records WHERE call_sid = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (call_sid, time.time())
+        ).fetchone()
+        return self._record(*row) if row else None
+
+    def _update_call(self, call_sid: str, record: Record, completed: Optional[bool]) -> bool:
+        fields = {name: value for name, value in record.items() if name != "transcript"}
+        query = "UPDATE call_records SET record = ?, transcript = ? WHERE call_sid = ?"
+        params: tuple = (json.dumps(fields), record.get("transcript"), call_sid)
+        if completed is not None:
+            query += " AND completed = ?"
+            params += (int(completed),)
+        updated = self.db.execute(query, params).rowcount > 0
+        self.db.commit()
+        return updated
+
+    def _page_completed(self, limit: int, before: Optional[Position]) -> List[Record]:
+        query = "SELECT record, transcript, updated_at FROM call_records WHERE completed = 1"
+        params: tuple = ()
+        if before is not None:
+            query += " AND (updated_at < ? OR (updated_at = ? AND call_sid < ?))"
+            params = (before[0], before[0], before[1])
+        rows = self.db.execute(query + " ORDER BY updated_at DESC, call_sid DESC LIMIT ?", params + (limit,)).fetchall()
+        return [dict(self._record(record, transcript), archived_at=updated_at) for record, transcript, updated_at in rows]
+
+    def _set_owner(self, call_sid: str, owner: Dict[str, str], ttl: float):
+        self.db.execute("INSERT OR REPLACE INTO call_owners (call_sid, owner, expires_at) VALUES (?, ?, ?)",
+                        (call_sid, json.dumps(owner), time.time() + ttl))
+        self.db.execute("DELETE FROM call_owners WHERE expires_at <= ?", (time.time(),))
+        self.db.commit()
+
+    def _get_owner(self, call_sid: str) -> Optional[Dict[str, str]]:
+        row = self.db.execute("SELECT owner FROM call_owners WHERE call_sid = ? AND expires_at > ?", (call_sid, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _delete_owner(self, call_sid: str):
+        self.db.execute("DELETE FROM call_owners WHERE call_sid = ?", (call_sid,))
+        self.db.commit()
+
+    @staticmethod
+    def _record(record: str, transcript: Optional[bytes]) -> Record:
+        fields = json.loads(record)
+        if transcript is not None:
+            fields["transcript"] = transcript
+        return fields
+
+    async def save_call(self, call_sid, record, completed, ttl=None, keep=()):
+        await self.run(self._save_call, call_sid, record, completed, ttl, keep)
+
+    async def load_call(self, call_sid):
+        return await self.run(self._load_call, call_sid)
+
+    async def update_call(self, call_sid, record, completed=None):
+        return await self.run(self._update_call, call_sid, record, completed)
+
+    async def page_completed(self, limit, before=None):
+        return await self.run(self._page_completed, limit, before)
+
+    async def set_owner(self, call_sid, owner, ttl):
+        await self.run(self._set_owner, call_sid, owner, ttl)
+
+    async def get_owner(self, call_sid):
+        return await self.run(self._get_owner, call_sid)
+
+    async def delete_owner(self, call_sid):
+        await self.run(self._delete_owner, call_sid)
+
+    async def close(self):
+        self.db.close()
+
+
+class RedisStateBackend(StateBackend):
+    """Shared across hosts. Needs the optional `redis` package and REDIS_URL."""
+    def __init__(self, url: str, prefix: str = "aidialer"):
+        if aioredis is None:
+            raise ValueError("STATE_BACKEND=redis needs the redis package (pip install redis)")
+        self.redis = aioredis.from_url(url)
+        self.prefix = prefix
+
+    def key(self, kind: str, call_sid: str) -> str:
+        return f"{self.prefix}:{kind}:{call_sid}"
+
+    @staticmethod
+    def encode(record: Record) -> str:
+        data = dict(record)
+        if data.get("transcript") is not None:
+            data["transcript"] = base64.b64encode(data["transcript"]).decode("ascii")
+        return json.dumps(data)
+
+    async def save_call(self, call_sid, record, completed, ttl=None, keep=()):
+        key = self.key("call", call_sid)
+        ex = None if ttl is None else max(1, int(ttl))
+        if not keep:
+            await self.redis.set(key, self.encode(record), ex=ex)
+        else:
+            async with self.redis.pipeline() as pipe:
+                while True:
+                    try:
+                        # Retried if another process writes the record between the read and the write
+                        await pipe.watch(key)
+                        raw = await pipe.get(key)
+                        merged = merge_kept(json.loads(raw) if raw is not None else None, record, keep)
+                        pipe.multi()
+                        pipe.set(key, self.encode(merged), ex=ex)
+                        await pipe.execute()
+                        break
+                    except WatchError:
+                        continue
+        if completed:
+            await self.redis.zadd(self.key("completed", "index"), {call_sid: time.time()})
+
+    async def load_call(self, call_sid):
+        raw = await self.redis.get(self.key("call", call_sid))
+        if raw is None:
+            return None
+        record = json.loads(raw)
+        if record.get("transcript") is not None:
+            record["transcript"] = base64.b64decode(record["transcript"])
+        return record
+
+    async def update_call(self, call_sid, record, completed=None):
+        # Only if it is still there; the completed index is left alone
+        key = self.key("call", call_sid)
+        if completed is None:
+            return bool(await self.redis.set(key, self.encode(record), xx=True, keepttl=True))
+        async with self.redis.pipeline() as pipe:
+            try:
+                # A save_call racing with this one rewrites the key and aborts the transaction
+                await pipe.watch(key)
+                archived = await pipe.zscore(self.key("completed", "index"), call_sid) is not None
+                if archived != completed:
+                    return False
+                pipe.multi()
+                pipe.set(key, self.encode(record), xx=True, keepttl=True)
+                replaced, = await pipe.execute()
+                return bool(replaced)
+            except WatchError:
+                return False
+
+    async def page_completed(self, limit, before=None):
+        index = self.key("completed", "index")
+        records = []
+        offset = 0
+        # Calls archived in the same instant share a score; they come in descending call SID order
+        while len(records) < limit:
+            entries = await self.redis.zrevrangebyscore(index, before[0] if before else "+inf", "-inf",
+                                                        start=offset, num=limit, withscores=True)
+            if not entries:
+                break
+            offset += len(entries)
+            for call_sid, archived_at in entries:
+                call_sid = call_sid.decode() if isinstance(call_sid, bytes) else call_sid
+                if before is not None and archived_at == before[0] and call_sid >= before[1]:
+                    continue
+                record = await self.load_call(call_sid)
+                if record is not None and len(records) < limit:
+                    records.append(dict(record, archived_at=archived_at))
+        return records
+
+    async def set_owner(self, call_sid, owner, ttl):
+        await self.redis.set(self.key("owner", call_sid), json.dumps(owner), ex=max(1, int(ttl)))
+
+    async def get_owner(self, call_sid):
+        raw = await self.redis.get(self.key("owner", call_sid))
+        return json.loads(raw) if raw is not None else None
+
+    async def delete_owner(self, call_sid):
+        await self.redis.delete(self.key("owner", call_sid))
+
+    async def close(self):
+        await self.redis.close()
+
+
+class StateBackendFactory:
+    @staticmethod
+    def get_backend(name: Optional[str] = None) -> StateBackend:
+        name = (name or os.getenv("STATE_BACKEND", "sqlite")).lower()
+        if name == "memory":
+            return MemoryStateBackend()
+        elif name == "sqlite":
+            return SQLiteStateBackend(os.getenv("STATE_SQLITE_PATH", "data/calls.sqlite3"))
+        elif name == "redis":
+            return RedisStateBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        else:
+            raise ValueError(f"Unsupported state backend: {name}")
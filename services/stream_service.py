@@ -1,60 +1,197 @@
-import uuid
-from typing import Dict
+import asyncio
+import base64
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
 
 from fastapi import WebSocket
 
 from logger_config import get_logger
 from services.event_emmiter import EventEmitter
+from services.message_codec import CodecFactory, JSONCodec
+from services.metrics_service import TurnTracer
 
 logger = get_logger("Stream")
 
+# Twilio plays 8kHz mulaw: 8 bytes per millisecond
+BYTES_PER_MS = 8
+
 class StreamService(EventEmitter):
-    def __init__(self, websocket: WebSocket):
+    """
+    Sends synthesized audio to Twilio in order and tracks what has actually been played.
+
+    Every chunk sent is followed by a mark named with an increasing sequence number. Twilio
+    echoes marks back in playback order, so acknowledging mark N means every earlier chunk
+    has been played as well. Marks map back to the partial response they belong to, which
+    lets a barge-in work out exactly which sentences the caller heard.
+
+    Audio is kept as raw bytes until it leaves the process. A sender task splits it into
+    OUTBOUND_FRAME_MS frames and paces them so Twilio never holds more than
+    OUTBOUND_LOOKAHEAD_MS of unplayed audio, which keeps barge-in clears fast and memory
+    per call flat regardless of how far ahead TTS runs.
+    """
+    def __init__(self, websocket: WebSocket, codec: JSONCodec = None):
         super().__init__()
         self.ws = websocket
+        self.codec = codec or CodecFactory.get_codec()
         self.expected_audio_index = 0
-        self.audio_buffer: Dict[int, str] = {}
+        self.audio_buffer: Dict[int, List[Tuple[bytes, str, bool]]] = {}
+        self.completed_indexes: Set[int] = set()
+        # TTS delivers partial responses concurrently; buffering and draining happen one at a time
+        self.buffer_lock = asyncio.Lock()
         self.stream_sid = ''
+        self.tracer = TurnTracer()
+        self.mark_sequence = 0
+        # mark name -> (partialResponseIndex, text, final chunk of that text), in send order
+        self.pending_marks: "OrderedDict[str, Tuple[Optional[int], str, bool]]" = OrderedDict()
+        self.heard: List[str] = []
+
+        self.frame_bytes = int(os.getenv("OUTBOUND_FRAME_MS", 100)) * BYTES_PER_MS
+        self.lookahead = int(os.getenv("OUTBOUND_LOOKAHEAD_MS", 300)) / 1000
+        # (audio, partialResponseIndex, text, final) waiting to be paced out to Twilio
+        self.outbox: Deque[Tuple[bytes, Optional[int], str, bool]] = deque()
+        self.outbox_ready = asyncio.Event()
+        self.sending: Optional[Tuple[bytes, Optional[int], str, bool]] = None
+        # When the audio already handed to Twilio will have finished playing
+        self.play_clock = 0.0
+        self.generation = 0
+        self.sender_task: Optional[asyncio.Task] = None
 
     def set_stream_sid(self, stream_sid: str):
         self.stream_sid = stream_sid
 
-    async def buffer(self, index: int, audio: str):
-        if index is None:
-            await self.send_audio(audio)
-        elif index == self.expected_audio_index:
-            await self.send_audio(audio)
-            self.expected_audio_index += 1
+    def set_tracer(self, tracer: TurnTracer):
+        self.tracer = tracer
 
-            while self.expected_audio_index in self.audio_buffer:
-                buffered_audio = self.audio_buffer[self.expected_audio_index]
-                await self.send_audio(buffered_audio)
-                del self.audio_buffer[self.expected_audio_index]
-                self.expected_audio_index += 1
-        else:
-            self.audio_buffer[index] = audio
+    async def buffer(self, index: int, audio: bytes, final: bool = True, text: str = ""):
+        """
+        Play audio in partialResponseIndex order. A partial response may arrive as several
+        chunks; the next index is only played once a chunk marked `final` has been seen.
+        Audio without an index (greetings, function-call messages) is played right away.
+        Audio still waiting for the lock when the caller barges in is dropped.
+        """
+        generation = self.generation
+        async with self.buffer_lock:
+            if generation != self.generation:
+                return
+            if index is None:
+                await self.send_audio(audio, index, text, final)
+            elif index == self.expected_audio_index:
+                await self.send_audio(audio, index, text, final)
+                if final:
+                    self.expected_audio_index += 1
+                    await self.drain()
+            elif index > self.expected_audio_index:
+                self.audio_buffer.setdefault(index, []).append((audio, text, final))
+                if final:
+                    self.completed_indexes.add(index)
+
+    async def drain(self):
+        while True:
+            index = self.expected_audio_index
+            for buffered_audio, text, final in self.audio_buffer.pop(index, []):
+                await self.send_audio(buffered_audio, index, text, final)
+            if index not in self.completed_indexes:
+                break
+            self.completed_indexes.remove(index)
+            self.expected_audio_index += 1
 
     def reset(self):
         self.expected_audio_index = 0
         self.audio_buffer = {}
+        self.completed_indexes = set()
+        self._drop_outbox()
+
+    def start_turn(self):
+        self.heard = []
+
+    def has_pending_audio(self) -> bool:
+        return bool(self.pending_marks or self.outbox or self.sending)
+
+    def acknowledge(self, mark_label: str) -> bool:
+        """Record that Twilio played everything up to `mark_label`. Returns False for unknown marks."""
+        if mark_label not in self.pending_marks:
+            return False
+        while self.pending_marks:
+            label, (index, text, final) = self.pending_marks.popitem(last=False)
+            if final and text:
+                self.heard.append(text)
+            if label == mark_label:
+                break
+        return True
+
+    def interrupt(self) -> str:
+        """Forget audio that will now never play and return the text the caller heard this turn."""
+        queued = ([self.sending] if self.sending else []) + list(self.outbox)
+        unplayed = [text for _, text, final in self.pending_marks.values() if final and text]
+        unplayed += [text for _, _, text, final in queued if final and text]
+        if unplayed:
+            logger.info(f"Caller did not hear: {' '.join(unplayed)}")
+        self.pending_marks.clear()
+        self._drop_outbox()
+        heard = " ".join(self.heard)
+        self.heard = []
+        return heard
+
+    async def send_audio(self, audio: bytes, index: Optional[int] = None, text: str = "", final: bool = True):
+        # An empty final chunk still gets a mark, so the end of the partial response is tracked
+        if not audio and not final:
+            return
+
+        self.outbox.append((audio, index, text, final))
+        self.outbox_ready.set()
+        if self.sender_task is None:
+            self.sender_task = asyncio.create_task(self.send_loop())
+
+    async def send_loop(self):
+        try:
+            while True:
+                if not self.outbox:
+                    self.outbox_ready.clear()
+                    await self.outbox_ready.wait()
+                    continue
+                self.sending = self.outbox.popleft()
+                await self.send_paced(*self.sending)
+                self.sending = None
+        except Exception as e:
+            logger.error(f"Error while sending audio to Twilio: {e}")
+        finally:
+            self.sender_task = None
+
+    async def send_paced(self, audio: bytes, index: Optional[int], text: str, final: bool):
+        generation = self.generation
+        view = memoryview(audio)
+        for offset in range(0, len(audio), self.frame_bytes):
+            ahead = self.play_clock - time.monotonic()
+            if ahead > self.lookahead:
+                await asyncio.sleep(ahead - self.lookahead)
+                if generation != self.generation:
+                    return
+
+            frame = view[offset:offset + self.frame_bytes]
+            payload = base64.b64encode(frame).decode('ascii')
+            await self.ws.send_text(self.codec.encode_media(self.stream_sid, payload))
+            self.tracer.mark("audio_sent")
+            self.play_clock = max(self.play_clock, time.monotonic()) + len(frame) / (BYTES_PER_MS * 1000)
+            if generation != self.generation:
+                return
+
+        self.mark_sequence += 1
+        mark_label = str(self.mark_sequence)
+        self.pending_marks[mark_label] = (index, text, final)
+        await self.ws.send_text(self.codec.encode_mark(self.stream_sid, mark_label))
+
+        await self.emit('audiosent', mark_label)
+
+    def _drop_outbox(self):
+        # Twilio's buffer is being cleared, so anything not yet sent is dropped too
+        self.outbox.clear()
+        self.sending = None
+        self.generation += 1
+        self.play_clock = time.monotonic()
 
-    async def send_audio(self, audio: str):
-        await self.ws.send_json({
-            "streamSid": self.stream_sid,
-            "event": "media",
-            "media": {
-                "payload": audio
-            }
-        })
-
-        mark_label = str(uuid.uuid4())
-
-        await self.ws.send_json({
-            "streamSid": self.stream_sid,
-            "event": "mark",
-            "mark": {
-                "name": mark_label
-            }
-        })
-
-        await self.emit('audiosent', mark_label)
\ No newline at end of file
+    async def close(self):
+        if self.sender_task is not None:
+            self.sender_task.cancel()
+            self.sender_task = None
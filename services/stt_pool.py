@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+from typing import Any, List, Optional, Set, Tuple
+
+from deepgram import DeepgramClient, DeepgramClientOptions, LiveOptions
+from dotenv import load_dotenv
+
+from logger_config import get_logger
+from services.metrics_service import metrics
+
+load_dotenv()
+logger = get_logger("STTPool")
+
+pool_requests = metrics.counter("aidialer_stt_pool_requests_total", "Live STT sessions requested by calls, by result (hit, miss)")
+pool_idle = metrics.gauge("aidialer_stt_pool_idle", "Pre-opened live STT sessions waiting for a call")
+stt_connect_time = metrics.histogram("aidialer_stt_connect_seconds", "Time spent opening a live STT session")
+pool_discarded = metrics.counter("aidialer_stt_pool_discarded_total", "Idle live STT sessions closed by the pool, by reason (closed, expired, failed)")
+
+
+def live_options() -> LiveOptions:
+    return LiveOptions(
+        model="nova-2",
+        language="en-US",
+        encoding="mulaw",
+        sample_rate=8000,
+        channels=1,
+        punctuate=True,
+        interim_results=True,
+        endpointing=int(os.getenv("DEEPGRAM_ENDPOINTING_MS", 200)),
+        utterance_end_ms=int(os.getenv("DEEPGRAM_UTTERANCE_END_MS", 1000))
+    )
+
+
+class STTConnectionPool:
+    """
+    Live Deepgram sessions opened ahead of the calls that will use them.
+
+    Opening a live session is a websocket handshake to Deepgram, which every call used to pay
+    after Twilio connected and before any caller audio could be transcribed. The pool keeps
+    STT_POOL_SIZE sessions open (Deepgram KeepAlive messages stop them timing out while idle)
+    and hands one to each new call without waiting; the free slot is refilled in the
+    background. Size it to the number of calls expected to start within a few seconds of each
+    other. When the pool is empty the call opens its own session, as before. Sessions are used
+    by one call and closed when it ends; idle ones older than STT_POOL_MAX_IDLE_SECONDS are
+    replaced so no session lives indefinitely.
+    """
+    def __init__(self, size: Optional[int] = None, max_idle: Optional[float] = None):
+        self.size = size if size is not None else int(os.getenv("STT_POOL_SIZE", 2))
+        self.max_idle = max_idle if max_idle is not None else float(os.getenv("STT_POOL_MAX_IDLE_SECONDS", 300))
+        self.client = DeepgramClient(os.getenv("DEEPGRAM_API_KEY"), DeepgramClientOptions(options={"keepalive": "true"}))
+        # (opened_at, live session), oldest first
+        self.idle: List[Tuple[float, Any]] = []
+        self.opening = 0
+        self.refill_task: Optional[asyncio.Task] = None
+        self.maintenance_task: Optional[asyncio.Task] = None
+        self.closing: Set[asyncio.Task] = set()
+
+    async def open_session(self) -> Tuple[Any, bool]:
+        """Open a live session; returns it and whether Deepgram accepted it."""
+        started = time.monotonic()
+        live = self.client.listen.asynclive.v("1")
+        started_ok = await live.start(live_options())
+        stt_connect_time.observe(time.monotonic() - started)
+        return live, bool(started_ok)
+
+    async def acquire(self):
+        """A started live session for a new call; pooled if one is ready, otherwise opened now."""
+        while self.idle:
+            opened_at, live = self.idle.pop()
+            pool_idle.set(len(self.idle))
+            if await self.usable(opened_at, live):
+                pool_requests.inc(result="hit")
+                self.schedule_refill()
+                return live
+        pool_requests.inc(result="miss")
+        self.schedule_refill()
+        live, _ = await self.open_session()
+        return live
+
+    async def usable(self, opened_at: float, live) -> bool:
+        """Whether an idle session can still be handed out; closes it if not."""
+        if not await live.is_connected():
+            reason = "closed"
+        elif time.monotonic() - opened_at > self.max_idle:
+            reason = "expired"
+        else:
+            return True
+        pool_discarded.inc(reason=reason)
+        self.close_session(live)
+        return False
+
+    def schedule_refill(self):
+        if self.size > 0 and (self.refill_task is None or self.refill_task.done()):
+            self.refill_task = asyncio.create_task(self.refill())
+
+    async def refill(self):
+        while len(self.idle) + self.opening < self.size:
+            self.opening += 1
+            try:
+                live, started_ok = await self.open_session()
+            except Exception as e:
+                logger.error(f"Error opening pooled STT session: {e}")
+                started_ok = False
+                live = None
+            finally:
+                self.opening -= 1
+            if not started_ok:
+                pool_discarded.inc(reason="failed")
+                if live is not None:
+                    self.close_session(live)
+                # Deepgram is unreachable or rejecting us; calls fall back to opening their own
+                return
+            self.idle.append((time.monotonic(), live))
+            pool_idle.set(len(self.idle))
+
+    async def maintain(self, interval: float = 10.0):
+        """Replace idle sessions that closed or expired, and keep the pool full."""
+        while True:
+            for entry in list(self.idle):
+                # A call may take the session while we check it
+                if not await self.usable(*entry) and entry in self.idle:
+                    self.idle.remove(entry)
+            pool_idle.set(len(self.idle))
+            self.schedule_refill()
+            await asyncio.sleep(interval)
+
+    def start(self):
+        if self.size > 0 and self.maintenance_task is None:
+            logger.info(f"Keeping {self.size} live STT sessions open")
+            self.maintenance_task = asyncio.create_task(self.maintain())
+
+    def close_session(self, live):
+        task = asyncio.create_task(live.finish())
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    async def close(self):
+        for task in (self.maintenance_task, self.refill_task):
+            if task is not None:
+                task.cancel()
+        self.maintenance_task = None
+        self.refill_task = None
+        idle, self.idle = self.idle, []
+        pool_idle.set(0)
+        await asyncio.gather(*(live.finish() for _, live in idle), *self.closing, return_exceptions=True)
+
+
+stt_pool = STTConnectionPool()
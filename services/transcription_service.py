@@ -1,20 +1,34 @@
-import os
+import asyncio
 
-from deepgram import DeepgramClient, LiveOptions, LiveTranscriptionEvents
+from deepgram import LiveTranscriptionEvents
 
 from logger_config import get_logger
 from services.event_emmiter import EventEmitter
+from services.speculation import StableTranscriptDetector
+from services.stt_pool import stt_pool
+from services.turn_detection import SAMPLE_RATE, TurnDetectorFactory, TurnEventRecorder, TurnThresholds, TurnTracker, mulaw_rms
 
 logger = get_logger("Transcription")
 
 class TranscriptionService(EventEmitter):
     def __init__(self):
         super().__init__()
-        self.client = DeepgramClient(os.getenv("DEEPGRAM_API_KEY"))
         self.deepgram_live = None
-        self.final_result = ""
         self.speech_final = False
         self.stream_sid = None
+        # Emits 'stable' with the running transcript once it stops changing (speculative replies)
+        self.stability = StableTranscriptDetector(lambda text: self.emit('stable', text), 0)
+        # Decides when the caller's turn is over; by default that is Deepgram's endpoint
+        self.turns = TurnTracker(TurnDetectorFactory.get_detector())
+        self.recorder = TurnEventRecorder()
+        # Seconds of caller audio sent so far; the clock turn detection runs on
+        self.audio_clock = 0.0
+
+    def enable_stability_events(self, window: float):
+        self.stability.window = window
+
+    def set_turn_thresholds(self, thresholds: TurnThresholds):
+        self.turns.detector.thresholds = thresholds
 
     def set_stream_sid(self, stream_id):
         self.stream_sid = stream_id
@@ -22,19 +36,14 @@ class TranscriptionService(EventEmitter):
     def get_stream_sid(self):
         return self.stream_sid
 
+    @property
+    def transcript(self) -> str:
+        """What the caller has said so far in the current turn: finalized segments plus the latest interim."""
+        return self.turns.transcript
+
     async def connect(self):
-        self.deepgram_live = self.client.listen.asynclive.v("1")
-        await self.deepgram_live.start(LiveOptions(
-            model="nova-2", 
-            language="en-US", 
-            encoding="mulaw",
-            sample_rate=8000,
-            channels=1,
-            punctuate=True,
-            interim_results=True,
-            endpointing=200,
-            utterance_end_ms=1000
-        ))
+        # A session opened before the call, if the pool has one ready
+        self.deepgram_live = await stt_pool.acquire()
 
         self.deepgram_live.on(LiveTranscriptionEvents.Transcript, self.handle_transcription)
         self.deepgram_live.on(LiveTranscriptionEvents.Error, self.handle_error)
@@ -46,10 +55,9 @@ class TranscriptionService(EventEmitter):
     async def handle_utterance_end(self, self_obj, utterance_end):
         try:
             if not self.speech_final:
-                logger.info(f"UtteranceEnd received before speech was final, emit the text collected so far: {self.final_result}")
-                await self.emit('transcription', self.final_result)
-                self.final_result = ''
+                logger.info(f"UtteranceEnd received before speech was final, emit the text collected so far: {self.turns.final_text}")
                 self.speech_final = True
+                await self.finish_utterance("utterance_end")
                 return
             else:
                 return
@@ -63,22 +71,42 @@ class TranscriptionService(EventEmitter):
             text = alternatives[0].transcript if alternatives else ""
 
             if result.is_final and text.strip():
-                self.final_result += f" {text}"
+                self.recorder.record("final", self.audio_clock, text=text, speech_final=bool(result.speech_final),
+                                     audio_start=round(result.start, 3), audio_end=round(result.start + result.duration, 3))
+                turn = self.turns.on_final(text, self.audio_clock)
+                if turn:
+                    await self.end_turn(turn, "local")
                 if result.speech_final:
                     self.speech_final = True
-                    await self.emit('transcription', self.final_result)
-                    self.final_result = ''
+                    await self.finish_utterance("speech_final")
                 else:
                     self.speech_final = False
+                    self.stability.update(self.turns.transcript)
             else:
                 if text.strip():
+                    self.recorder.record("interim", self.audio_clock, text=text)
+                    turn = self.turns.on_interim(text, self.audio_clock)
+                    self.stability.update(self.turns.transcript)
+                    if turn:
+                        await self.end_turn(turn, "local")
                     stream_sid = self.stream_sid
                     await self.emit('utterance', text, stream_sid)
         except Exception as e:
             logger.error(f"Error while handling transcription: {e}")
             e.print_stack()
 
-            
+    async def finish_utterance(self, endpoint: str):
+        """Deepgram finalized the utterance; end the turn unless the detector already did."""
+        self.recorder.record("endpoint", self.audio_clock, kind=endpoint)
+        turn = self.turns.on_endpoint(self.audio_clock)
+        if turn is not None:
+            await self.end_turn(turn, "endpoint")
+
+    async def end_turn(self, text: str, trigger: str):
+        self.recorder.record("turn_end", self.audio_clock, text=text, trigger=trigger)
+        self.stability.reset()
+        await self.emit('transcription', text)
+
     async def handle_error(self, self_obj, error):
         logger.error(f"Deepgram error: {error}")
         self.is_connected = False
@@ -94,10 +122,20 @@ class TranscriptionService(EventEmitter):
         self.is_connected = False
 
     async def send(self, payload: bytes):
+        self.audio_clock += len(payload) / SAMPLE_RATE
+        if self.turns.detector.uses_audio or self.recorder.enabled:
+            energy = mulaw_rms(payload)
+            self.recorder.record("audio", self.audio_clock, rms=round(energy))
+            turn = self.turns.on_audio(energy, self.audio_clock)
+            if turn:
+                await self.end_turn(turn, "local")
         if self.deepgram_live:            
             await self.deepgram_live.send(payload)
     
     async def disconnect(self):
+        self.stability.reset()
+        if self.recorder.enabled:
+            await asyncio.to_thread(self.recorder.write, self.stream_sid)
         if self.deepgram_live:
             await self.deepgram_live.finish()
             self.deepgram_live = None
@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Optional, Set
+
+from logger_config import get_logger
+from services.metrics_service import metrics
+
+logger = get_logger("TTSCache")
+
+cache_requests = metrics.counter("aidialer_tts_cache_requests_total", "TTS cache lookups by result (memory, disk, miss)")
+cache_skips = metrics.counter("aidialer_tts_cache_skipped_total", "Synthesized replies not cached because their text has not repeated yet")
+cache_bytes = metrics.gauge("aidialer_tts_cache_memory_bytes", "Audio bytes held in the in-memory TTS cache")
+
+
+class TTSCache:
+    """
+    Process-wide cache of synthesized audio for phrases that repeat across calls.
+
+    Entries are raw 8kHz mulaw keyed on provider, voice, model and normalized text, for
+    texts up to TTS_CACHE_MAX_CHARS. Known phrases (greetings, function-call messages and
+    TTS_CACHE_WARM_PHRASES, stored with `pin`) are always kept. Any other reply is only
+    stored by `put` once the same text has been synthesized TTS_CACHE_MIN_REPEATS times,
+    so one-off LLM sentences never take their place. The in-memory tier is an LRU bounded
+    by TTS_CACHE_MAX_BYTES that evicts other entries before known phrases; if TTS_CACHE_DIR
+    is set, stored entries are also written there and survive restarts.
+    """
+    def __init__(self, max_bytes: Optional[int] = None, directory: Optional[str] = None, max_chars: Optional[int] = None,
+                 min_repeats: Optional[int] = None):
+        self.max_bytes = max_bytes or int(os.getenv("TTS_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        self.max_chars = max_chars or int(os.getenv("TTS_CACHE_MAX_CHARS", 160))
+        self.min_repeats = min_repeats or int(os.getenv("TTS_CACHE_MIN_REPEATS", 2))
+        self.directory = directory or os.getenv("TTS_CACHE_DIR")
+        self.entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.size = 0
+        self.known: Set[str] = set()
+        # How often each recent uncached text was synthesized, oldest first; bounded like the entries
+        self.seen: "OrderedDict[str, int]" = OrderedDict()
+        self.max_seen = int(os.getenv("TTS_CACHE_MAX_TRACKED", 10000))
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip()
+
+    def key(self, provider: str, voice: Optional[str], model: Optional[str], text: str) -> Optional[str]:
+        text = self.normalize(text)
+        if not text or len(text) > self.max_chars:
+            return None
+        raw = "\x1f".join([provider, voice or "", model or "", text])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self.entries.get(key)
+        if audio is not None:
+            self.entries.move_to_end(key)
+            cache_requests.inc(result="memory")
+            return audio
+
+        if self.directory:
+            audio = await asyncio.to_thread(self._read, key)
+            if audio is not None:
+                self._remember(key, audio)
+                cache_requests.inc(result="disk")
+                return audio
+
+        cache_requests.inc(result="miss")
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        """Offer a synthesized reply; it is stored once its text has come up often enough."""
+        if not audio:
+            return
+        if key not in self.known and key not in self.entries:
+            count = self.seen.pop(key, 0) + 1
+            if count < self.min_repeats:
+                self.seen[key] = count
+                while len(self.seen) > self.max_seen:
+                    self.seen.popitem(last=False)
+                cache_skips.inc()
+                return
+        await self._store(key, audio)
+
+    async def pin(self, key: str, audio: bytes):
+        """Store a known phrase, such as a greeting or function-call message."""
+        if not audio:
+            return
+        self.known.add(key)
+        self.seen.pop(key, None)
+        await self._store(key, audio)
+
+    def hold(self, key: str, audio: bytes):
+        """Keep audio synthesized ahead of its turn in memory only, for that turn to pick up."""
+        if audio:
+            self._remember(key, audio)
+
+    async def _store(self, key: str, audio: bytes):
+        self._remember(key, audio)
+        if self.directory:
+            await asyncio.to_thread(self._write, key, audio)
+
+    def contains(self, key: str) -> bool:
+        return key in self.entries or bool(self.directory and os.path.exists(self._path(key)))
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self.entries[key] = audio
+        self.size += len(audio)
+        while self.size > self.max_bytes:
+            # Least recently used first, but known phrases only once nothing else is left
+            victim = next((candidate for candidate in self.entries if candidate not in self.known), None)
+            if victim is None:
+                victim = next(iter(self.entries))
+            self.size -= len(self.entries.pop(victim))
+        cache_bytes.set(self.size)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.ulaw")
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, audio: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Could not write TTS cache entry {key}: {e}")
+
+
+tts_cache = TTSCache()
@@ -1,8 +1,12 @@
 
+import asyncio
 import base64
+import json
 import os
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
 
 import aiohttp
 import numpy as np
@@ -10,15 +14,58 @@ from deepgram import DeepgramClient, LiveOptions
 from dotenv import load_dotenv
 
 from logger_config import get_logger
+from services.cancellation import CancelScope, cancelled_chars, cancelled_work
 from services.event_emmiter import EventEmitter
+from services.http_pool import http_pool
+from services.metrics_service import TurnTracer, metrics
+from services.tts_cache import tts_cache
 
 load_dotenv()
 logger = get_logger("TTS")
 
 
+# Twilio plays 8kHz mulaw in 20ms frames of 160 bytes
+FRAME_BYTES = 160
+BYTES_PER_MS = 8
+
+# Caps provider requests across every call in the process, on top of the per-call limit
+process_slots = asyncio.Semaphore(int(os.getenv("TTS_MAX_CONCURRENCY", 32)))
+inflight_requests = metrics.gauge("aidialer_tts_inflight_requests", "TTS syntheses currently running across all calls")
+
+
 class AbstractTTSService(EventEmitter, ABC):
+    """
+    Base class for TTS providers.
+
+    Providers implement `synthesize`, an async generator of raw 8kHz mulaw bytes. `generate`
+    turns that into `speech` events: one event per sentence in buffered mode, or, when
+    TTS_STREAMING is enabled, a chunk per batch of whole 20ms frames as soon as the provider
+    returns them. Events carry raw audio bytes (base64 is only applied as frames leave for
+    Twilio) and a `final` flag so the stream service knows when a partial response is complete.
+
+    Short phrases are looked up in the shared TTS cache first; a hit is played immediately
+    without a provider round trip, and a miss is stored once synthesis completes.
+
+    Synthesis runs inside a cancel scope; `cancel` aborts every in-flight request on barge-in.
+
+    `submit` synthesizes partial responses concurrently, so the LLM keeps streaming while
+    earlier sentences are still being synthesized. At most TTS_MAX_CONCURRENCY_PER_CALL
+    requests run per call and TTS_MAX_CONCURRENCY per process; playback order comes from
+    the partialResponseIndex carried on every `speech` event.
+    """
+    def __init__(self):
+        super().__init__()
+        self.tracer = TurnTracer()
+        self.scope = CancelScope()
+        self.streaming = os.getenv("TTS_STREAMING", "false").lower() == "true"
+        self.call_slots = asyncio.Semaphore(int(os.getenv("TTS_MAX_CONCURRENCY_PER_CALL", 3)))
+        self.pending: Set[asyncio.Task] = set()
+
+    def set_tracer(self, tracer: TurnTracer):
+        self.tracer = tracer
+
     @abstractmethod
-    async def generate(self, llm_reply: Dict[str, Any], interaction_count: int):
+    def synthesize(self, text: str) -> AsyncIterator[bytes]:
         pass
 
     @abstractmethod
@@ -29,6 +76,136 @@ class AbstractTTSService(EventEmitter, ABC):
     async def disconnect(self):
         pass
 
+    def cancel(self, reason: str = "barge-in"):
+        self.scope.cancel(reason)
+        self.scope = CancelScope()
+        for task in self.pending:
+            task.cancel()
+
+    async def submit(self, llm_reply: Dict[str, Any], interaction_count: int):
+        """
+        Start synthesizing a partial response in the background. Waits only when this call
+        already has TTS_MAX_CONCURRENCY_PER_CALL requests running.
+        """
+        if llm_reply['partialResponseIndex'] is None:
+            # Unindexed audio plays as soon as it arrives, so let earlier sentences finish first
+            await self.wait_idle()
+            await self.generate(llm_reply, interaction_count)
+            return
+
+        # Bind to the current scope now; a barge-in before the task starts must still cancel it
+        scope = self.scope
+        await self.call_slots.acquire()
+        task = asyncio.create_task(self.generate(llm_reply, interaction_count, scope))
+        self.pending.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self.pending.discard(task)
+        self.call_slots.release()
+
+    async def wait_idle(self):
+        """Wait until every submitted partial response has been synthesized or cancelled."""
+        while self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+
+    async def warm_connection(self):
+        """Open a pooled connection to the provider before the first sentence needs it."""
+        return
+
+    def cache_identity(self) -> Tuple[str, Optional[str], Optional[str]]:
+        """Provider, voice and model that the synthesized audio depends on."""
+        return self.__class__.__name__, None, None
+
+    def cache_key(self, text: str) -> Optional[str]:
+        provider, voice, model = self.cache_identity()
+        return tts_cache.key(provider, voice, model, text)
+
+    async def warm_cache(self, texts: List[str], pin: bool = True):
+        """
+        Synthesize phrases that are not cached yet so the first call that needs them skips the provider.
+        Known phrases are pinned; with pin=False the audio is only held in memory for an imminent turn.
+        """
+        for text in texts:
+            key = self.cache_key(text or "")
+            if key is None:
+                continue
+            if tts_cache.contains(key):
+                if pin:
+                    tts_cache.known.add(key)
+                continue
+            try:
+                audio_content = b"".join([chunk async for chunk in self.synthesize(text)])
+                if pin:
+                    await tts_cache.pin(key, audio_content)
+                else:
+                    tts_cache.hold(key, audio_content)
+                logger.info(f"Pre-warmed TTS cache: {text}")
+            except Exception as e:
+                logger.error(f"Error pre-warming TTS cache for '{text}': {str(e)}")
+
+    async def generate(self, llm_reply: Dict[str, Any], interaction_count: int, scope: Optional[CancelScope] = None):
+        partial_response_index, partial_response = llm_reply['partialResponseIndex'], llm_reply['partialResponse']
+
+        if not partial_response:
+            return
+
+        scope = scope or self.scope
+        await scope.run(self.synthesize_limited(partial_response_index, partial_response, interaction_count))
+        if scope.cancelled:
+            logger.info(f"TTS cancelled ({scope.reason}): {partial_response}")
+            cancelled_work.inc(stage="tts")
+            cancelled_chars.inc(len(partial_response), stage="tts")
+
+    async def synthesize_limited(self, partial_response_index: Optional[int], partial_response: str, interaction_count: int):
+        async with process_slots:
+            inflight_requests.inc()
+            try:
+                await self.synthesize_reply(partial_response_index, partial_response, interaction_count)
+            finally:
+                inflight_requests.dec()
+
+    async def synthesize_reply(self, partial_response_index: Optional[int], partial_response: str, interaction_count: int):
+        try:
+            cache_key = self.cache_key(partial_response)
+            if cache_key is not None:
+                cached_audio = await tts_cache.get(cache_key)
+                if cached_audio is not None:
+                    self.tracer.mark("tts_first_byte")
+                    await self.emit('speech', partial_response_index, cached_audio, partial_response, interaction_count, True)
+                    return
+
+            if self.streaming:
+                audio_content = await self.generate_streaming(partial_response_index, partial_response, interaction_count)
+            else:
+                audio_content = b"".join([chunk async for chunk in self.synthesize(partial_response)])
+                if audio_content:
+                    self.tracer.mark("tts_first_byte")
+                    await self.emit('speech', partial_response_index, audio_content, partial_response, interaction_count, True)
+
+            if cache_key is not None:
+                await tts_cache.put(cache_key, audio_content)
+        except Exception as e:
+            logger.error(f"Error in {self.__class__.__name__} generation: {str(e)}")
+
+    async def generate_streaming(self, partial_response_index: int, partial_response: str, interaction_count: int) -> bytes:
+        audio_content = bytearray()
+        pending = bytearray()
+        async for chunk in self.synthesize(partial_response):
+            self.tracer.mark("tts_first_byte")
+            audio_content += chunk
+            pending += chunk
+            aligned = len(pending) - len(pending) % FRAME_BYTES
+            if aligned:
+                audio_chunk = bytes(pending[:aligned])
+                del pending[:aligned]
+                await self.emit('speech', partial_response_index, audio_chunk, partial_response, interaction_count, False)
+
+        # Whatever is left is shorter than a frame; the final event closes out this partial response
+        await self.emit('speech', partial_response_index, bytes(pending), partial_response, interaction_count, True)
+        return bytes(audio_content)
+
+
 class ElevenLabsTTS(AbstractTTSService):
     def __init__(self):
         super().__init__()
@@ -41,94 +218,329 @@ class ElevenLabsTTS(AbstractTTSService):
     def set_voice(self, voice_id):
         self.voice_id = voice_id
 
+    def cache_identity(self):
+        return "elevenlabs", self.voice_id, self.model_id
+
+    async def warm_connection(self):
+        await http_pool.warm("elevenlabs", "https://api.elevenlabs.io/")
+
     async def disconnect(self):
         # ElevenLabs client doesn't require explicit disconnection
         return
 
+    async def synthesize(self, text: str) -> AsyncIterator[bytes]:
+        output_format = "ulaw_8000"
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}/stream"
+        headers = {
+            "xi-api-key": self.api_key,
+            "Content-Type": "application/json",
+            "Accept": "audio/wav"
+        }
+        params = {
+            "output_format": output_format,
+            "optimize_streaming_latency": 4
+        }
+        data = {
+            "model_id": self.model_id,
+            "text": text
+        }
+
+        session = http_pool.get_session("elevenlabs")
+        async with session.post(url, headers=headers, params=params, json=data) as response:
+            if response.status != 200:
+                logger.error(f"ElevenLabs TTS request failed with status {response.status}: {await response.text()}")
+                return
+            async for chunk in response.content.iter_any():
+                yield chunk
+
+
+class StreamedSentence:
+    """A partial response sent over a TTS websocket, with how much of it has been voiced."""
+    def __init__(self, index: int, text: str, interaction_count: int, cache_key: Optional[str]):
+        self.index = index
+        self.text = text
+        self.interaction_count = interaction_count
+        self.cache_key = cache_key
+        # Alignment is matched on non-whitespace characters; providers normalize spacing
+        self.chars = sum(1 for char in text if not char.isspace())
+        self.voiced = 0
+        self.audio = bytearray()
+
+
+class ElevenLabsStreamingTTS(ElevenLabsTTS):
+    """
+    ElevenLabs over the stream-input websocket: one connection per call, kept open across turns.
+
+    Each partial response is written to the socket as soon as the LLM produces it (flushed, so
+    generation starts right away) and audio streams back continuously, without a new HTTP
+    request per sentence, and with the voice keeping its context across sentence edges. The
+    character alignment that comes with every audio chunk tells which partial response the
+    audio belongs to, so `speech` events keep their partialResponseIndex and `final` flags
+    and the stream service orders and tracks them as for the REST providers.
+
+    A barge-in drops the socket, which stops generation on ElevenLabs' side, and a fresh one is
+    opened in the background for the next turn. If the socket fails mid-turn, partial
+    responses that had not been voiced yet are synthesized over REST instead. Unindexed
+    messages (greeting, function-call messages) and cache warming also use REST.
+    """
+    def __init__(self):
+        super().__init__()
+        self.inactivity_timeout = int(os.getenv("ELEVENLABS_WS_INACTIVITY_TIMEOUT", 180))
+        self.chunk_length_schedule = [int(n) for n in os.getenv("ELEVENLABS_WS_CHUNK_SCHEDULE", "50,120,160,250").split(",")]
+        # No audio for this long while text is outstanding means the alignment lost track of it
+        self.stall_timeout = float(os.getenv("ELEVENLABS_WS_STALL_SECONDS", 3))
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.receiver: Optional[asyncio.Task] = None
+        self.reconnect_task: Optional[asyncio.Task] = None
+        self.connect_lock = asyncio.Lock()
+        self.closing: Set[asyncio.Task] = set()
+        # Partial responses written to the socket and not yet fully voiced, in send order
+        self.sentences: Deque[StreamedSentence] = deque()
+        self.voiced_all = asyncio.Event()
+        self.voiced_all.set()
+        self.last_audio_at = 0.0
+
+    async def warm_connection(self):
+        try:
+            await self.connect()
+        except Exception as e:
+            logger.info(f"Could not pre-open ElevenLabs websocket: {e}")
 
-    async def generate(self, llm_reply: Dict[str, Any], interaction_count: int):
+    async def connect(self) -> aiohttp.ClientWebSocketResponse:
+        async with self.connect_lock:
+            if self.ws is not None and not self.ws.closed:
+                return self.ws
+            url = f"wss://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}/stream-input"
+            params = {
+                "output_format": "ulaw_8000",
+                "sync_alignment": "true",
+                "inactivity_timeout": str(self.inactivity_timeout)
+            }
+            if self.model_id:
+                params["model_id"] = self.model_id
+            session = http_pool.get_session("elevenlabs")
+            ws = await session.ws_connect(url, params=params, headers={"xi-api-key": self.api_key})
+            # The first message opens the stream; its text must be a single space
+            await ws.send_json({"text": " ", "generation_config": {"chunk_length_schedule": self.chunk_length_schedule}})
+            self.ws = ws
+            self.receiver = asyncio.create_task(self.receive(ws))
+            logger.info("ElevenLabs websocket connected")
+            return ws
+
+    async def submit(self, llm_reply: Dict[str, Any], interaction_count: int):
         partial_response_index, partial_response = llm_reply['partialResponseIndex'], llm_reply['partialResponse']
-
-        if not partial_response:
+        if partial_response_index is None or not partial_response:
+            await super().submit(llm_reply, interaction_count)
             return
 
+        cache_key = self.cache_key(partial_response)
+        if cache_key is not None:
+            cached_audio = await tts_cache.get(cache_key)
+            if cached_audio is not None:
+                self.tracer.mark("tts_first_byte")
+                await self.emit('speech', partial_response_index, cached_audio, partial_response, interaction_count, True)
+                return
+
+        sentence = StreamedSentence(partial_response_index, partial_response, interaction_count, cache_key)
         try:
-            output_format = "ulaw_8000"            
-            url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}/stream"
-            headers = {
-                "xi-api-key": self.api_key,
-                "Content-Type": "application/json",
-                "Accept": "audio/wav"
-            }
-            params = {
-                "output_format": output_format,
-                "optimize_streaming_latency": 4
-            }
-            data = {
-                "model_id": self.model_id,
-                "text": partial_response
-            }
+            ws = await self.connect()
+            if not self.sentences:
+                self.last_audio_at = time.monotonic()
+            self.sentences.append(sentence)
+            self.voiced_all.clear()
+            await ws.send_json({"text": partial_response + " ", "flush": True})
+        except Exception as e:
+            logger.error(f"ElevenLabs websocket unavailable, synthesizing over REST: {e}")
+            if sentence in self.sentences:
+                self.sentences.remove(sentence)
+                if not self.sentences:
+                    self.voiced_all.set()
+            await super().submit(llm_reply, interaction_count)
+
+    async def receive(self, ws: aiohttp.ClientWebSocketResponse):
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                data = json.loads(message.data)
+                if data.get("audio"):
+                    await self.on_audio(base64.b64decode(data["audio"]), data.get("alignment"))
+                elif data.get("error") or data.get("message"):
+                    logger.error(f"ElevenLabs websocket error: {data}")
+        except Exception as e:
+            logger.error(f"Error reading ElevenLabs websocket: {e}")
+        finally:
+            if self.ws is ws:
+                # Closed by ElevenLabs (inactivity timeout or error) rather than by us
+                self.ws = None
+                if self.sentences:
+                    await self.resubmit_unvoiced()
+
+    async def on_audio(self, audio: bytes, alignment: Optional[Dict[str, Any]]):
+        self.tracer.mark("tts_first_byte")
+        self.last_audio_at = time.monotonic()
+        if not self.sentences:
+            return
+
+        # Byte offsets in this chunk at which each partial response that finishes in it ends:
+        # where the next one's first character starts, or the end of the chunk
+        ends = []
+        if alignment:
+            current = 0
+            finished = False
+            for char, start_ms in zip(alignment.get("chars", []), alignment.get("charStartTimesMs", [])):
+                if char.isspace() or current >= len(self.sentences):
+                    continue
+                if finished:
+                    ends.append(min(len(audio), int(start_ms * BYTES_PER_MS)))
+                    finished = False
+                sentence = self.sentences[current]
+                sentence.voiced += 1
+                if sentence.voiced >= sentence.chars:
+                    current += 1
+                    finished = True
+            if finished:
+                ends.append(len(audio))
+
+        position = 0
+        for end in ends:
+            await self.emit_audio(self.sentences.popleft(), audio[position:end], True)
+            position = max(position, end)
+        if position < len(audio) and self.sentences:
+            await self.emit_audio(self.sentences[0], audio[position:], False)
+        if not self.sentences:
+            self.voiced_all.set()
+
+    async def emit_audio(self, sentence: StreamedSentence, audio: bytes, final: bool):
+        sentence.audio += audio
+        await self.emit('speech', sentence.index, audio, sentence.text, sentence.interaction_count, final)
+        if final and sentence.cache_key is not None:
+            await tts_cache.put(sentence.cache_key, bytes(sentence.audio))
+
+    async def resubmit_unvoiced(self):
+        """Close out the partial response being voiced and synthesize the rest over REST."""
+        sentences, self.sentences = self.sentences, deque()
+        self.voiced_all.set()
+        if sentences[0].voiced:
+            await self.emit_audio(sentences.popleft(), b"", True)
+        for sentence in sentences:
+            await super().submit({"partialResponseIndex": sentence.index, "partialResponse": sentence.text}, sentence.interaction_count)
+
+    async def wait_idle(self):
+        await super().wait_idle()
+        while self.sentences:
+            try:
+                await asyncio.wait_for(self.voiced_all.wait(), timeout=self.stall_timeout)
+            except asyncio.TimeoutError:
+                if self.sentences and time.monotonic() - self.last_audio_at >= self.stall_timeout:
+                    logger.error(f"No ElevenLabs audio for {self.stall_timeout}s, closing out {len(self.sentences)} partial responses")
+                    while self.sentences:
+                        await self.emit_audio(self.sentences.popleft(), b"", True)
+                    self.voiced_all.set()
+        await super().wait_idle()
+
+    def cancel(self, reason: str = "barge-in"):
+        super().cancel(reason)
+        if self.sentences:
+            cancelled_work.inc(len(self.sentences), stage="tts")
+            cancelled_chars.inc(sum(len(sentence.text) for sentence in self.sentences), stage="tts")
+            self.sentences.clear()
+        self.voiced_all.set()
+        # Dropping the socket is the only way to stop audio that has already been requested
+        self.close_socket()
+        if self.reconnect_task is None or self.reconnect_task.done():
+            self.reconnect_task = asyncio.create_task(self.warm_connection())
+
+    def close_socket(self):
+        ws, self.ws = self.ws, None
+        if self.receiver is not None:
+            self.receiver.cancel()
+            self.receiver = None
+        if ws is not None and not ws.closed:
+            task = asyncio.create_task(ws.close())
+            self.closing.add(task)
+            task.add_done_callback(self.closing.discard)
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, params=params, json=data) as response:
-                    if response.status == 200:
-                        audio_content = await response.read()
-                        audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-                        await self.emit('speech', partial_response_index, audio_base64, partial_response, interaction_count)
-        except Exception as err:
-            logger.error("Error occurred in ElevenLabs TTS service", exc_info=True)
-            logger.error(str(err))
+    async def disconnect(self):
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+            self.reconnect_task = None
+        ws = self.ws
+        if ws is not None and not ws.closed:
+            try:
+                # An empty text ends the stream
+                await ws.send_json({"text": ""})
+            except Exception:
+                pass
+        self.close_socket()
+        await asyncio.gather(*self.closing, return_exceptions=True)
 
 
 class DeepgramTTS(AbstractTTSService):
+    # Trim the first 10ms (80 samples at 8000Hz) to remove the initial noise
+    TRIM_SAMPLES = 80
+
     def __init__(self):
         super().__init__()
-        self.client = DeepgramClient(os.getenv("DEEPGRAM_API_KEY"))
-
-    async def generate(self, llm_reply, interaction_count):
-        partial_response_index = llm_reply['partialResponseIndex']
-        partial_response = llm_reply['partialResponse']
-
-        if not partial_response:
+        self.api_key = os.getenv("DEEPGRAM_API_KEY")
+        self.client = DeepgramClient(self.api_key)
+        self.options = {
+            "model": "aura-asteria-en",
+            "encoding": "mulaw",
+            "sample_rate": 8000
+        }
+
+    def cache_identity(self):
+        return "deepgram", None, self.options["model"]
+
+    async def warm_connection(self):
+        if self.streaming:
+            await http_pool.warm("deepgram", "https://api.deepgram.com/")
+
+    async def synthesize(self, text: str) -> AsyncIterator[bytes]:
+        if self.streaming:
+            async for chunk in self.synthesize_streaming(text):
+                yield chunk
             return
 
-        try:
-            source = {
-                "text": partial_response
-            }
+        response = await self.client.asyncspeak.v("1").stream(
+            source={"text": text},
+            options=self.options
+        )
 
-            options = {
-                "model": "aura-asteria-en",
-                "encoding": "mulaw", 
-                "sample_rate": 8000 
-            }
-            
-            response = await self.client.asyncspeak.v("1").stream(
-                source={"text": partial_response},
-                options=options
-            )
-
-            if response.stream:
-                audio_content = response.stream.getvalue()
-                
-                # Convert audio to numpy array
-                audio_array = np.frombuffer(audio_content, dtype=np.uint8)
-                
-                # Trim the first 10ms (80 samples at 8000Hz) to remove the initial noise
-                trim_samples = 80
-                trimmed_audio = audio_array[trim_samples:]
-                
-                # Convert back to bytes
-                trimmed_audio_bytes = trimmed_audio.tobytes()
-
-                audio_base64 = base64.b64encode(trimmed_audio_bytes).decode('utf-8')
-                await self.emit('speech', partial_response_index, audio_base64, partial_response, interaction_count)
-            else:
-                logger.error("Error in TTS generation: No audio stream returned")
+        if response.stream:
+            audio_content = response.stream.getvalue()
 
-        except Exception as e:
-            logger.error(f"Error in TTS generation: {str(e)}")
+            # Convert audio to numpy array
+            audio_array = np.frombuffer(audio_content, dtype=np.uint8)
+            trimmed_audio = audio_array[self.TRIM_SAMPLES:]
 
+            # Convert back to bytes
+            yield trimmed_audio.tobytes()
+        else:
+            logger.error("Error in TTS generation: No audio stream returned")
+
+    async def synthesize_streaming(self, text: str) -> AsyncIterator[bytes]:
+        # The SDK buffers the whole response, so stream straight from the REST endpoint instead
+        url = "https://api.deepgram.com/v1/speak"
+        headers = {
+            "Authorization": f"Token {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+        session = http_pool.get_session("deepgram")
+        async with session.post(url, headers=headers, params=self.options, json={"text": text}) as response:
+            if response.status != 200:
+                logger.error(f"Deepgram TTS request failed with status {response.status}: {await response.text()}")
+                return
+            to_trim = self.TRIM_SAMPLES
+            async for chunk in response.content.iter_any():
+                if to_trim:
+                    trimmed = chunk[to_trim:]
+                    to_trim -= len(chunk) - len(trimmed)
+                    chunk = trimmed
+                if chunk:
+                    yield chunk
 
     async def set_voice(self, voice_id):
         logger.info(f"Attempting to set voice to {voice_id}, but Deepgram TTS doesn't support direct voice selection.")
@@ -144,6 +556,8 @@ class TTSFactory:
     def get_tts_service(service_name: str) -> AbstractTTSService:
         if service_name.lower() == "elevenlabs":
             return ElevenLabsTTS()
+        elif service_name.lower() == "elevenlabs_ws":
+            return ElevenLabsStreamingTTS()
         elif service_name.lower() == "deepgram":
             return DeepgramTTS()
         else:
@@ -0,0 +1,266 @@
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from logger_config import get_logger
+from services.metrics_service import metrics
+
+logger = get_logger("TurnDetection")
+
+turns_ended = metrics.counter("aidialer_turns_ended_total", "Caller turns ended, by detector and trigger (local, endpoint)")
+false_cutoffs = metrics.counter("aidialer_turn_false_cutoffs_total", "Turns ended locally after which the caller kept talking")
+
+# Twilio sends 8kHz mulaw
+SAMPLE_RATE = 8000
+
+# Magnitude of each mulaw code as 16-bit linear PCM
+_codes = ~np.arange(256, dtype=np.int32) & 0xFF
+_exponent = (_codes >> 4) & 0x07
+_mantissa = _codes & 0x0F
+MULAW_MAGNITUDE = ((((_mantissa << 3) + 0x84) << _exponent) - 0x84).astype(np.float64)
+
+# A turn rarely ends on these; wait longer before answering
+CONTINUATION_WORDS = {"and", "but", "or", "so", "because", "um", "uh", "like", "the", "a", "to", "if", "then", "with"}
+
+
+def mulaw_rms(chunk: bytes) -> float:
+    if not chunk:
+        return 0.0
+    magnitudes = MULAW_MAGNITUDE[np.frombuffer(chunk, dtype=np.uint8)]
+    return float(np.sqrt(np.mean(magnitudes ** 2)))
+
+
+class TurnThresholds:
+    """
+    Tunables for adaptive end-of-turn detection. Defaults come from TURN_* environment
+    variables; a call can override any of them (see `from_env`).
+    """
+    FIELDS = {
+        "punctuation_ms": 250,    # wait after text ending in . ? !
+        "short_ms": 350,          # wait after a short answer ("yes", "that's right")
+        "default_ms": 700,        # wait after anything else
+        "hold_ms": 1400,          # wait after a trailing comma, conjunction or filler
+        "short_words": 3,
+        "energy_threshold": 300,  # RMS (16-bit linear) above which a chunk counts as speech
+        "cutoff_window_ms": 1200, # new words this soon after ending a turn mean it ended too early
+        "max_scale": 2.0,         # how far repeated cut-offs may stretch the waits for a call
+    }
+
+    def __init__(self, **values: float):
+        for name, default in self.FIELDS.items():
+            setattr(self, name, float(values.get(name, default)))
+
+    @classmethod
+    def from_env(cls, overrides: Optional[Dict[str, Any]] = None) -> "TurnThresholds":
+        values = {name: float(os.getenv(f"TURN_{name.upper()}", default)) for name, default in cls.FIELDS.items()}
+        for name, value in (overrides or {}).items():
+            if name in cls.FIELDS:
+                values[name] = float(value)
+        return cls(**values)
+
+
+class EndOfTurnDetector:
+    """
+    Decides when the caller has finished speaking.
+
+    Times are seconds of received call audio, so a recorded event stream replays exactly.
+    `on_audio` (RMS energy of each audio chunk, see `mulaw_rms`) and `on_transcript` (the
+    running transcript of the utterance) feed the detector and return True when the turn
+    should end right now. `on_endpoint` is called when Deepgram finalizes an utterance
+    (speech_final or UtteranceEnd) and says whether that should end the turn. This base
+    detector is the original behaviour: the turn ends only on Deepgram's endpoint.
+    Detectors that look at audio energy set `uses_audio`; for the others it is not computed.
+    """
+    name = "deepgram"
+    uses_audio = False
+
+    def __init__(self, thresholds: Optional[TurnThresholds] = None):
+        self.thresholds = thresholds or TurnThresholds.from_env()
+        self.reset()
+
+    def reset(self):
+        self.text = ""
+        self.fired = False
+
+    def on_audio(self, energy: float, now: float) -> bool:
+        return False
+
+    def on_transcript(self, text: str, now: float) -> bool:
+        self.text = text
+        return False
+
+    def on_endpoint(self, now: float) -> bool:
+        return not self.fired
+
+
+class AdaptiveEndOfTurnDetector(EndOfTurnDetector):
+    """
+    Ends the turn locally, without waiting for Deepgram's endpoint, once the running
+    transcript has been stable and the line quiet for long enough. How long depends on what
+    was said: text ending in terminal punctuation or a short answer ends quickly; a trailing
+    comma, conjunction or filler waits longer. When the caller keeps talking right after a
+    locally ended turn, the waits for this call are stretched (up to `max_scale`); turns that
+    end cleanly shrink them back.
+    """
+    name = "adaptive"
+    uses_audio = True
+
+    def __init__(self, thresholds: Optional[TurnThresholds] = None):
+        self.scale = 1.0
+        super().__init__(thresholds)
+
+    def reset(self):
+        super().reset()
+        self.changed_at = 0.0
+        self.last_voice_at: Optional[float] = None
+        self.fired_at: Optional[float] = None
+
+    def required_wait(self) -> float:
+        t = self.thresholds
+        text = self.text.rstrip()
+        words = text.split()
+        if not words:
+            return float("inf")
+        last_word = words[-1].strip(".,?!").lower()
+        if text.endswith((",", "-", "...")) or last_word in CONTINUATION_WORDS:
+            wait_ms = t.hold_ms
+        elif text.endswith((".", "?", "!")):
+            wait_ms = t.punctuation_ms
+        elif len(words) <= t.short_words:
+            wait_ms = t.short_ms
+        else:
+            wait_ms = t.default_ms
+        return wait_ms * self.scale / 1000
+
+    def should_fire(self, now: float) -> bool:
+        if self.fired or not self.text:
+            return False
+        quiet_since = max(self.changed_at, self.last_voice_at or 0.0)
+        if now - quiet_since < self.required_wait():
+            return False
+        self.fired = True
+        self.fired_at = now
+        return True
+
+    def on_audio(self, energy: float, now: float) -> bool:
+        if energy >= self.thresholds.energy_threshold:
+            self.last_voice_at = now
+        return self.should_fire(now)
+
+    def on_transcript(self, text: str, now: float) -> bool:
+        if self.fired and len(text.split()) > len(self.text.split()):
+            # The caller kept talking: that turn was ended too early
+            if now - self.fired_at <= self.thresholds.cutoff_window_ms / 1000:
+                false_cutoffs.inc()
+                self.scale = min(self.thresholds.max_scale, self.scale * 1.25)
+                logger.info(f"Turn ended too early, waiting {self.scale:.2f}x longer for this call")
+            self.fired = False
+        if text != self.text:
+            self.text = text
+            self.changed_at = now
+        return self.should_fire(now)
+
+    def on_endpoint(self, now: float) -> bool:
+        if self.fired:
+            # Deepgram agrees the turn is over; it was a clean cut
+            self.scale = max(1.0, self.scale * 0.95)
+            return False
+        return True
+
+
+class TurnTracker:
+    """
+    The caller's current utterance and the turn decisions made on it, shared by the live
+    transcription service and the offline replay in benchmarks/turn_eval.py.
+
+    Each method returns the text to hand to the LLM as a finished turn, or None. When the
+    detector ends a turn before Deepgram's endpoint, only words spoken after that are
+    returned later, so nothing is answered twice.
+    """
+    def __init__(self, detector: EndOfTurnDetector):
+        self.detector = detector
+        self.final_text = ""
+        self.interim_text = ""
+        self.answered_words = 0
+
+    @property
+    def transcript(self) -> str:
+        return f"{self.final_text} {self.interim_text}".strip()
+
+    def on_audio(self, energy: float, now: float) -> Optional[str]:
+        return self.local_turn(self.detector.on_audio(energy, now))
+
+    def on_interim(self, text: str, now: float) -> Optional[str]:
+        self.interim_text = text
+        return self.local_turn(self.detector.on_transcript(self.transcript, now))
+
+    def on_final(self, text: str, now: float) -> Optional[str]:
+        self.final_text = f"{self.final_text} {text}".strip()
+        self.interim_text = ""
+        return self.local_turn(self.detector.on_transcript(self.transcript, now))
+
+    def local_turn(self, ended: bool) -> Optional[str]:
+        if not ended:
+            return None
+        words = self.detector.text.split()
+        text = " ".join(words[self.answered_words:])
+        self.answered_words = len(words)
+        if text:
+            turns_ended.inc(detector=self.detector.name, trigger="local")
+        return text or None
+
+    def on_endpoint(self, now: float) -> Optional[str]:
+        words = self.final_text.split()
+        end_turn = self.detector.on_endpoint(now)
+        remaining = words if end_turn else words[self.answered_words:]
+        self.final_text = ""
+        self.interim_text = ""
+        self.answered_words = 0
+        self.detector.reset()
+        if not remaining:
+            return None
+        turns_ended.inc(detector=self.detector.name, trigger="endpoint")
+        return " ".join(remaining)
+
+
+class TurnDetectorFactory:
+    @staticmethod
+    def get_detector(name: Optional[str] = None, thresholds: Optional[TurnThresholds] = None) -> EndOfTurnDetector:
+        name = (name or os.getenv("TURN_DETECTOR", "deepgram")).lower()
+        if name == "deepgram":
+            return EndOfTurnDetector(thresholds)
+        elif name == "adaptive":
+            return AdaptiveEndOfTurnDetector(thresholds)
+        else:
+            raise ValueError(f"Unsupported turn detector: {name}")
+
+
+class TurnEventRecorder:
+    """
+    Keeps the transcript and audio-energy events of a call so turn detection can be replayed
+    offline (see benchmarks/turn_eval.py). Written as JSON lines to TURN_EVENT_LOG_DIR.
+    """
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory if directory is not None else os.getenv("TURN_EVENT_LOG_DIR")
+        self.events: List[Dict[str, Any]] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def record(self, event: str, t: float, **fields: Any):
+        if self.directory:
+            self.events.append({"t": round(t, 3), "event": event, **fields})
+
+    def write(self, name: str):
+        if not self.directory or not self.events:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{name or int(time.time())}.jsonl")
+        with open(path, "w") as f:
+            for event in self.events:
+                f.write(json.dumps(event) + "\n")
+        self.events = []
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+from logger_config import get_logger
+from services.metrics_service import metrics
+
+logger = get_logger("Twilio")
+
+request_latency = metrics.histogram("aidialer_twilio_request_seconds", "Twilio REST request latency by operation")
+request_errors = metrics.counter("aidialer_twilio_errors_total", "Failed Twilio REST attempts by operation")
+
+
+class TwilioGateway:
+    """
+    Async access to the Twilio REST API for the whole process.
+
+    The Twilio SDK is synchronous, so every request runs on a small, bounded thread pool
+    (TWILIO_MAX_WORKERS) instead of blocking the event loop that carries everyone's audio.
+    A single Client is shared so its HTTP session keeps connections alive. Requests time
+    out after TWILIO_TIMEOUT_SECONDS; idempotent ones are retried with backoff on timeouts,
+    connection errors, 429 and 5xx responses, up to TWILIO_RETRIES times.
+    """
+    def __init__(self):
+        self.timeout = float(os.getenv("TWILIO_TIMEOUT_SECONDS", 10))
+        self.retries = int(os.getenv("TWILIO_RETRIES", 2))
+        self.executor = ThreadPoolExecutor(max_workers=int(os.getenv("TWILIO_MAX_WORKERS", 8)), thread_name_prefix="twilio")
+        self._client: Optional[Client] = None
+
+    @property
+    def client(self) -> Client:
+        # Created lazily so credentials loaded by dotenv after import are picked up
+        if self._client is None:
+            self._client = Client(
+                os.getenv("TWILIO_ACCOUNT_SID"),
+                os.getenv("TWILIO_AUTH_TOKEN"),
+                http_client=TwilioHttpClient(timeout=self.timeout)
+            )
+        return self._client
+
+    async def run(self, operation: str, fn: Callable, *args: Any, retry: bool = True, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(self.executor, partial(fn, *args, **kwargs)),
+                    timeout=self.timeout
+                )
+                request_latency.observe(time.monotonic() - started, operation=operation)
+                return result
+            except TwilioRestException as e:
+                request_errors.inc(operation=operation)
+                if e.status != 429 and e.status < 500:
+                    raise
+                error = e
+            except (asyncio.TimeoutError, ConnectionError, OSError) as e:
+                request_errors.inc(operation=operation)
+                error = e
+
+            if attempt == attempts - 1:
+                raise error
+            logger.warning(f"Twilio {operation} failed ({error!r}), retrying")
+            await asyncio.sleep(0.25 * 2 ** attempt)
+
+    async def create_call(self, to: str, from_: str, url: str, **kwargs: Any):
+        # Not idempotent: a retry after a timeout could place a second call
+        return await self.run("create_call", self.client.calls.create, to=to, from_=from_, url=url, retry=False, **kwargs)
+
+    async def fetch_call(self, call_sid: str):
+        return await self.run("fetch_call", lambda: self.client.calls(call_sid).fetch())
+
+    async def update_call(self, call_sid: str, **kwargs: Any):
+        return await self.run("update_call", lambda: self.client.calls(call_sid).update(**kwargs))
+
+    async def list_recordings(self, call_sid: str):
+        return await self.run("list_recordings", lambda: self.client.calls(call_sid).recordings.list())
+
+    async def start_recording(self, call_sid: str, **kwargs: Any):
+        return await self.run("start_recording", lambda: self.client.calls(call_sid).recordings.create(**kwargs), retry=False)
+
+
+twilio_gateway = TwilioGateway()
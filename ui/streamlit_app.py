@@ -1,3 +1,4 @@
+import json
 import os
 import time
 import requests
@@ -11,18 +12,68 @@ st.set_page_config(page_title="AI Dialer", page_icon="📞", layout="wide")
 def display_call_interface():
     return st.text_input("Phone Number (format: +1XXXXXXXXXX)", value=os.getenv("YOUR_NUMBER") or "")
 
-def fetch_all_transcripts():
+CALL_LIST_PAGE_SIZE = 20
+
+@st.cache_resource
+def api_session():
+    # One keep-alive connection to the backend, shared across reruns
+    return requests.Session()
+
+def api_get(path, params=None, etag=None):
+    """GET a backend route; returns (data, etag), with data None when the server answers 304 Not Modified."""
+    headers = {"If-None-Match": etag} if etag else {}
+    response = api_session().get(f"https://{os.getenv('SERVER')}{path}", params=params, headers=headers, timeout=10)
+    if response.status_code == 304:
+        return None, etag
+    return response.json(), response.headers.get("ETag")
+
+def call_events(call_sid):
+    """Yield (event, data) from the server's live updates for a call; ("keepalive", None) while it is quiet."""
+    # The read timeout only has to outlast the server's keepalive interval
+    with api_session().get(f"https://{os.getenv('SERVER')}/events/{call_sid}", stream=True, timeout=(10, 60)) as response:
+        event, data = "message", []
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith(":"):
+                yield "keepalive", None
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+            elif not line and data:
+                yield event, json.loads("\n".join(data))
+                event, data = "message", []
+
+def render_transcript(entries):
+    for entry in entries:
+        if entry['role'] == 'user':
+            st.chat_message("user").write(entry['content'])
+        elif entry['role'] == 'assistant':
+            st.chat_message("assistant").write(entry['content'])
+
+def fetch_all_transcripts(cursor=None):
+    """Fetch a page of the call list; the first page is skipped when it has not changed."""
     try:
-        response = requests.get(f"https://{os.getenv('SERVER')}/all_transcripts")
-        return response.json().get('transcripts', [])
+        etag = st.session_state.get('call_list_etag') if cursor is None else None
+        data, etag = api_get("/all_transcripts", {"limit": CALL_LIST_PAGE_SIZE, "cursor": cursor}, etag)
+        if data is None:
+            return st.session_state.all_transcripts
+        page = data.get('transcripts', [])
+        if cursor is None:
+            st.session_state.call_list_etag = etag
+            st.session_state.call_list_cursor = data.get('next_cursor')
+            return page
+        st.session_state.call_list_cursor = data.get('next_cursor')
+        return st.session_state.all_transcripts + page
     except requests.RequestException as e:
         st.error(f"Error fetching call list: {str(e)}")
-        return []
+        return st.session_state.get('all_transcripts', [])
 
 if 'call_active' not in st.session_state:
     st.session_state.call_active = False
     st.session_state.call_sid = None
     st.session_state.transcript = []
+    st.session_state.call_list_etag = None
+    st.session_state.call_list_cursor = None
     st.session_state.system_message = os.getenv("SYSTEM_MESSAGE")
     st.session_state.initial_message = os.getenv("INITIAL_MESSAGE")
     st.session_state.all_transcripts = fetch_all_transcripts()
@@ -54,18 +105,21 @@ with st.sidebar:
                     st.session_state.call_sid = call_sid
                     st.session_state.transcript = []
                     st.success(f"Call initiated. SID: {call_sid}")
-                    for _ in range(60):
-                        time.sleep(1)
-                        status = requests.get(f"https://{os.getenv('SERVER')}/call_status/{call_sid}").json().get('status')
-                        if status == 'in-progress':
+                    # Wait for the server to report the call answered (or over)
+                    deadline = time.monotonic() + 60
+                    for event, data in call_events(call_sid):
+                        if event == 'status' and data['status'] == 'in-progress':
                             st.session_state.call_active = True
                             st.session_state.call_selector = "Current Call"
                             break
-                        if status in ['completed', 'failed', 'busy', 'no-answer']:
-                            st.error(f"Call ended: {status}")
+                        if event == 'end':
+                            st.error(f"Call ended: {data.get('final_status')}")
+                            break
+                        if time.monotonic() > deadline:
+                            st.error("Timeout waiting for call to connect.")
                             break
                     else:
-                        st.error("Timeout waiting for call to connect.")
+                        st.error("Lost the connection while waiting for the call to connect.")
                 else:
                     st.error(f"Failed to initiate call: {call_data}")
             except requests.RequestException as e:
@@ -126,14 +180,14 @@ st.selectbox(
 )
 
 if st.button("Refresh Call List"):
-    try:
-        response = requests.get(f"https://{os.getenv('SERVER')}/all_transcripts")
-        st.session_state.all_transcripts = response.json().get('transcripts', [])
-        on_call_selector_change()  # Refresh the recording URL after updating the call list
-    except requests.RequestException as e:
-        st.error(f"Error fetching call list: {str(e)}")
+    st.session_state.all_transcripts = fetch_all_transcripts()
+    on_call_selector_change()  # Refresh the recording URL after updating the call list
     # Keep the existing system and initial messages (don't reset to env values)
 
+if st.session_state.call_list_cursor and st.button("Load More Calls"):
+    st.session_state.all_transcripts = fetch_all_transcripts(st.session_state.call_list_cursor)
+    st.rerun()
+
 st.divider()
 
 # Call Recording and Transcript display
@@ -148,45 +202,53 @@ with st.spinner("Loading recording and transcript..."):
     # Transcript display
     if st.session_state.call_active and st.session_state.call_sid:
         st.subheader(f"Transcript for Current Call {st.session_state.call_sid}")
-        for entry in st.session_state.transcript:
-            if entry['role'] == 'user':
-                st.chat_message("user").write(entry['content'])
-            elif entry['role'] == 'assistant':
-                st.chat_message("assistant").write(entry['content'])
+        live_transcript = st.empty()
+        with live_transcript.container():
+            render_transcript(st.session_state.transcript)
     elif st.session_state.call_selector != "Current Call":
         if transcript := next((t for t in st.session_state.all_transcripts if f"Call {t['call_sid']}" == st.session_state.call_selector), None):
             st.subheader(f"Transcript for {st.session_state.call_selector}")
-            for entry in transcript['transcript']:
-                if entry['role'] == 'user':
-                    st.chat_message("user").write(entry['content'])
-                elif entry['role'] == 'assistant':
-                    st.chat_message("assistant").write(entry['content'])
+            render_transcript(transcript['transcript'])
 
 if st.session_state.call_active:
-    def update_call_info():
+    call_status = st.sidebar.empty()
+    turn_latency = st.sidebar.empty()
+    heartbeat = st.sidebar.empty()
+
+    def follow_call():
+        """Apply the call's updates as the server pushes them; returns the end event, or None if the stream dropped."""
         try:
-            status = requests.get(f"https://{os.getenv('SERVER')}/call_status/{st.session_state.call_sid}").json().get('status')
-            if status not in ['in-progress', 'ringing']:
-                st.session_state.call_active = False
-                st.warning(f"Call ended: {status}")
-                return False
-            
-            transcript_data = requests.get(f"https://{os.getenv('SERVER')}/transcript/{st.session_state.call_sid}").json()
-            if transcript_data.get('call_ended', False):
-                st.session_state.call_active = False
-                st.info(f"Call ended. Status: {transcript_data.get('final_status', 'Unknown')}")
-                return False
-            
-            st.session_state.transcript = transcript_data.get('transcript', [])
-            return True
+            for event, data in call_events(st.session_state.call_sid):
+                if event == 'transcript':
+                    st.session_state.transcript = st.session_state.transcript[:data['since']] + data['transcript']
+                    with live_transcript.container():
+                        render_transcript(st.session_state.transcript)
+                elif event == 'status':
+                    call_status.caption(f"Status: {data['status']}")
+                elif event == 'latency':
+                    stages = " · ".join(f"{stage} {ms}ms" for stage, ms in data['timings_ms'].items())
+                    turn_latency.caption(f"Turn {data['interaction']}: {stages}")
+                elif event == 'end':
+                    return data
+                else:
+                    # Gives Streamlit a chance to act on button presses while the call is quiet
+                    heartbeat.caption(f"Live, last checked {time.strftime('%H:%M:%S')}")
         except requests.RequestException as e:
-            st.sidebar.error(f"Error updating call info: {str(e)}")
-            return False
+            st.sidebar.error(f"Error following call: {str(e)}")
+        return None
 
-    if update_call_info():
+    if (ended := follow_call()) is None:
+        # Reconnect; the stream starts again from a snapshot
         time.sleep(1)
         st.rerun()
     else:
+        # A barge-in can shorten the last reply after it was pushed; keep the final version
+        try:
+            final_data, _ = api_get(f"/transcript/{st.session_state.call_sid}")
+            st.session_state.transcript = final_data.get('transcript', st.session_state.transcript)
+        except requests.RequestException as e:
+            st.sidebar.error(f"Error fetching final transcript: {str(e)}")
+        st.info(f"Call ended. Status: {ended.get('final_status') or 'Unknown'}")
         st.session_state.call_active = False
         st.session_state.call_sid = None
         st.sidebar.info("Call has ended. You can start a new call if needed.")